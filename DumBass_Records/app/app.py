@@ -1,15 +1,18 @@
-from app.backend import mariadb_handler
-from app.backend import mariadb_initializer
 from app.backend import mongodb_initializer
 from app.backend import database_handler
+from app.backend import bootstrap
+from app.backend import pagination
+from app.backend import mariadb_migrations
+from app.backend import order_totals
+from app.backend import order_journal
+from app.backend.facet_index import FACETS
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from werkzeug.datastructures import MultiDict
 import os
-import mariadb
 from datetime import datetime
-import pymysql
 import sys
-from flask import request
-from pymongo import MongoClient
+import hashlib
+import click
 
 app = Flask(__name__)
 
@@ -22,49 +25,188 @@ app.config["MARIADB"] = {
     "password": os.getenv("DB_PASSWORD", "my_password"),
 }
 
+# MARIADB Connection Pool
+app.config["MARIADB_POOL"] = {
+    "size": int(os.getenv("DB_POOL_SIZE", 10)),
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", 5)),
+    "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", 1800)),
+    "ping": os.getenv("DB_POOL_PING", "true").lower() == "true",
+}
+
+# Opt-in statement statistics for MariaDB, EXPLAIN is sampled for statements slower than slow_ms
+app.config["QUERY_STATS"] = {
+    "enabled": os.getenv("QUERY_STATS_ENABLED", "false").lower() == "true",
+    "slow_ms": float(os.getenv("QUERY_STATS_SLOW_MS", 100)),
+    "explain_interval": float(os.getenv("QUERY_STATS_EXPLAIN_INTERVAL", 60)),
+    "max_fingerprints": int(os.getenv("QUERY_STATS_MAX_FINGERPRINTS", 500)),
+}
+
 # MONGODB Credentials
 app.config["MONGODB"] = {
     "host": os.getenv("MONGO_HOST", "localhost"),
     "port": int(os.getenv("MONGO_PORT", 27017)),
     "db": os.getenv("MONGO_DB", "my_mongo_database"),
+    "max_pool_size": int(os.getenv("MONGO_POOL_SIZE", 50)),
+    "server_selection_timeout_ms": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+    "compressors": os.getenv("MONGO_COMPRESSORS", "zlib"),
+    # order ids reserved per worker with one round trip to the counters collection
+    "id_block_size": int(os.getenv("MONGO_ID_BLOCK_SIZE", 20)),
+}
+
+# Shared backend selection, re-read by every worker at most once per interval
+app.config["BACKEND_STATE"] = {
+    "refresh_interval": float(os.getenv("BACKEND_STATE_REFRESH_INTERVAL", 2)),
+}
+
+# Random catalog sampling, the in-memory id list is reloaded after max_age seconds
+app.config["CATALOG_SAMPLER"] = {
+    "max_age": float(os.getenv("CATALOG_SAMPLER_MAX_AGE", 300)),
+}
+
+# Catalog listings for / and /shop, cleared on inserts, reseeds and migrations
+app.config["CATALOG_CACHE"] = {
+    "ttl": float(os.getenv("CATALOG_CACHE_TTL", 30)),
+    "maxsize": int(os.getenv("CATALOG_CACHE_SIZE", 256)),
+}
+
+# Order history on the user dashboard, keyset-paginated with a per-user cache of the first page
+app.config["ORDER_HISTORY"] = {
+    "page_size": int(os.getenv("ORDER_HISTORY_PAGE_SIZE", 20)),
+    "cache_size": int(os.getenv("ORDER_HISTORY_CACHE_SIZE", 1024)),
+    "cache_ttl": float(os.getenv("ORDER_HISTORY_CACHE_TTL", 30)),
+}
+
+# Admin purchase overview per normalized filter, cleared by every purchase
+app.config["PURCHASE_OVERVIEW_CACHE"] = {
+    "ttl": float(os.getenv("PURCHASE_OVERVIEW_CACHE_TTL", 60)),
+    "maxsize": int(os.getenv("PURCHASE_OVERVIEW_CACHE_SIZE", 64)),
+}
+
+# Keyset-paginated catalog API behind /api/vinyls and the infinite scroll in /shop
+app.config["CATALOG_API"] = {
+    "page_size": int(os.getenv("CATALOG_API_PAGE_SIZE", 48)),
+    "max_page_size": int(os.getenv("CATALOG_API_MAX_PAGE_SIZE", 100)),
+    "max_age": int(os.getenv("CATALOG_API_MAX_AGE", 30)),
+}
+
+# Search results by normalized query, longer queries are filtered from cached prefixes
+app.config["SEARCH_CACHE"] = {
+    "ttl": float(os.getenv("SEARCH_CACHE_TTL", 60)),
+    "maxsize": int(os.getenv("SEARCH_CACHE_SIZE", 512)),
+}
+
+# In-process trigram index for /search, facet bitmaps for /api/facets and the typo tolerant /search fallback,
+# rebuilt in the background after max_age seconds. Fuzzy deletes cover the first fuzzy_prefix_length characters
+# of a word, longer prefixes use more memory and answer faster.
+app.config["SEARCH_INDEX"] = {
+    "enabled": os.getenv("SEARCH_INDEX_ENABLED", "true").lower() == "true",
+    "max_age": float(os.getenv("SEARCH_INDEX_MAX_AGE", 600)),
+    "fuzzy_distance": int(os.getenv("SEARCH_INDEX_FUZZY_DISTANCE", 2)),
+    "fuzzy_prefix_length": int(os.getenv("SEARCH_INDEX_FUZZY_PREFIX_LENGTH", 6)),
+}
+
+# Startup bootstrap, seeds the database once per deployment behind a MariaDB lock
+app.config["BOOTSTRAP"] = {
+    "enabled": os.getenv("BOOTSTRAP_ON_STARTUP", "true").lower() == "true",
+    "lock_timeout": int(os.getenv("BOOTSTRAP_LOCK_TIMEOUT", 120)),
+    "retry_interval": float(os.getenv("BOOTSTRAP_RETRY_INTERVAL", 2)),
+}
+
+# Session cart, checked out as one order by /checkout
+app.config["CART"] = {
+    "max_lines": int(os.getenv("CART_MAX_LINES", 50)),
+    "max_amount": int(os.getenv("CART_MAX_AMOUNT", 10)),
+}
+
+# Background check of the MariaDB order totals against their lines, disabled with an interval of 0
+app.config["ORDER_TOTALS"] = {
+    "check_interval": float(os.getenv("ORDER_TOTALS_CHECK_INTERVAL", 0)),
+    "repair": os.getenv("ORDER_TOTALS_REPAIR", "false").lower() == "true",
+    "batch_size": int(os.getenv("ORDER_TOTALS_BATCH_SIZE", 500)),
+}
+
+# Write-behind mode for flash sales: orders are acknowledged once journaled to a local SQLite file and
+# committed to the active backend in batches. The path must be on a disk that survives a restart.
+app.config["ORDER_JOURNAL"] = {
+    "enabled": os.getenv("ORDER_JOURNAL_ENABLED", "false").lower() == "true",
+    "path": os.getenv("ORDER_JOURNAL_PATH", "order_journal.sqlite3"),
+    "batch_size": int(os.getenv("ORDER_JOURNAL_BATCH_SIZE", 200)),
+    "flush_interval": float(os.getenv("ORDER_JOURNAL_FLUSH_INTERVAL", 1.0)),
+    # wait after the first order of a batch so that the ones arriving right after it join the batch
+    "linger": float(os.getenv("ORDER_JOURNAL_LINGER", 0.02)),
+    "lease": float(os.getenv("ORDER_JOURNAL_LEASE", 30)),
+    # an order whose write keeps failing is moved to the Dead_Letters table after this many attempts
+    "max_attempts": int(os.getenv("ORDER_JOURNAL_MAX_ATTEMPTS", 5)),
 }
 
 app.secret_key = "funny_secret_key"
+app.before_request(database_handler.sync_backend)
+app.teardown_appcontext(database_handler.release_connections)
+bootstrap.start(app)
+order_totals.start(app)
+order_journal.start(app)
+
+
+@app.cli.command("check-indexes")
+def check_indexes():
+    # EXPLAIN every hot MariaDB query and fail when one of them scans its table
+    report = mariadb_migrations.explain_hot_queries(database_handler.get_mariadb_connection())
+    for entry in report:
+        status = "ok" if entry["uses_index"] else "FULL SCAN"
+        tables = ", ".join(entry["tables"])
+        print(f"{status:9} {entry['query']}: tables {tables}, type {entry['type']}, key {entry['key']}")
+    if not all(entry["uses_index"] for entry in report):
+        sys.exit(1)
 
 
-def get_mariadb_connection():
-    try:
-        mariadb_config = app.config["MARIADB"]
-        connection = pymysql.connect(
-            host=mariadb_config["host"],
-            port=mariadb_config["port"],
-            user=mariadb_config["user"],
-            password=mariadb_config["password"],
-            database=mariadb_config["name"],
-        )
-        return connection
-    except pymysql.MySQLError as e:
-        app.logger.error(f"MARIADB Database Error: {e}")
+@app.cli.command("check-mongo-indexes")
+def check_mongo_indexes():
+    # explain every indexed MongoDB query and fail when one of them needs a collection scan
+    report = mongodb_initializer.explain_handler_queries(database_handler.get_mongodb_connection())
+    for entry in report:
+        status = "ok" if entry["uses_index"] else "COLLSCAN"
+        collections = ", ".join(entry["collections"])
+        print(f"{status:9} {entry['query']}: collections {collections}, stages {entry['stages']}")
+    if not all(entry["uses_index"] for entry in report):
         sys.exit(1)
 
 
-def get_mongodb_connection():
-    mongo_config = app.config["MONGODB"]
-    client = MongoClient(host=mongo_config["host"], port=mongo_config["port"])
-    app.logger.info(f"Connected to MongoDB database '{mongo_config['db']}' successfully.")
-    db = client[mongo_config["db"]]
-    return db
+@app.cli.command("check-order-totals")
+@click.option("--repair", is_flag=True, help="Reset drifted totals to the sum of their lines at their unit prices.")
+def check_order_totals(repair):
+    # compare every MariaDB order total with its lines and fail when one drifted
+    report, drift = order_totals.check_order_totals(database_handler.get_mariadb_connection(), repair)
+    for entry in drift:
+        print(f"order {entry['order_id']}: total {entry['total_price']}, lines {entry['expected']}")
+    print(
+        f"{report['orders']} orders checked, {report['unpriced']} without unit prices, "
+        f"{report['drifted']} drifted, {report['repaired']} repaired"
+    )
+    if drift and not repair:
+        sys.exit(1)
 
 
-initialized = False
-migrated = False
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route("/readyz")
+def readyz():
+    try:
+        ready = bootstrap.is_ready()
+    except Exception as e:
+        app.logger.warning(f"Readiness check failed: {e}")
+        ready = False
+    if not ready:
+        return jsonify({"status": "starting"}), 503
+    return jsonify({"status": "ready", "backend": database_handler.active_backend}), 200
 
 
 @app.route("/")
 def display_home():
     app.logger.info("Handling request to '/'")
-    database_handler.initialize_db()
-    vinyls = database_handler.query_vinyls(100)
+    vinyls = database_handler.catalog.query_vinyls(100)
     return render_template("views/home.html", vinyls=vinyls)
 
 
@@ -85,17 +227,137 @@ def erase_and_fill_db():
     return {"message": "Database erased and filled successfully!"}, 200
 
 
+def query_catalog_page(args):
+    api_config = app.config["CATALOG_API"]
+    sort = args.get("sort", "id")
+    if sort not in pagination.SORT_KEYS:
+        raise ValueError(f"Unknown sort '{sort}', expected one of {', '.join(pagination.SORT_KEYS)}")
+    descending = args.get("order", "asc") == "desc"
+    limit = max(1, min(args.get("limit", api_config["page_size"], type=int), api_config["max_page_size"]))
+    after = pagination.decode_cursor(args.get("cursor"), sort, descending)
+
+    # one extra row tells whether there is a next page without a COUNT
+    vinyls = database_handler.catalog.query_vinyls_page(
+        limit + 1,
+        sort,
+        descending,
+        after,
+        args.get("genre", "").strip() or None,
+        args.get("artist_id", type=int),
+        args.get("min_price", type=float),
+        args.get("max_price", type=float),
+    )
+    next_cursor = pagination.encode_cursor(sort, descending, vinyls[limit - 1]) if len(vinyls) > limit else None
+    return vinyls[:limit], next_cursor
+
+
+def facet_filters(args, facets=FACETS):
+    return {facet: [value for value in args.getlist(facet) if value] for facet in facets}
+
+
+def query_facet_page(facet_index, args):
+    api_config = app.config["CATALOG_API"]
+    limit = max(1, min(args.get("limit", api_config["page_size"], type=int), api_config["max_page_size"]))
+    filters = facet_filters(args)
+    cursor = args.get("cursor")
+    if cursor and not cursor.isdigit():
+        raise pagination.InvalidCursor(f"Malformed cursor: {cursor}")
+    result = facet_index.query(filters, limit, int(cursor) if cursor else None)
+    vinyls = database_handler.catalog.query_vinyls_by_ids(result["vinyl_ids"])
+    next_cursor = result["vinyl_ids"][-1] if result["has_more"] else None
+    return vinyls, next_cursor, result
+
+
 @app.route("/shop")
 def vinyl_list():
-    vinyls = database_handler.query_vinyls(100)
-    return render_template("views/shop.html", vinyls=vinyls)
+    facet_index = database_handler.get_facet_index()
+    facets = None
+    endpoint = url_for("api_vinyls")
+    selected = facet_filters(request.args)
+    if request.args.get("sort") == "random":
+        # the sampled listing /shop showed before the keyset pages, one page without infinite scroll
+        vinyls, next_cursor = database_handler.catalog.query_vinyls(100), None
+        if facet_index is not None:
+            facets = facet_index.query({}, limit=0)["facets"]
+    elif facet_index is not None and any(selected.values()):
+        try:
+            vinyls, next_cursor, result = query_facet_page(facet_index, request.args)
+        except ValueError as e:
+            app.logger.warning(f"Invalid shop cursor, showing the first page: {e}")
+            args = request.args.copy()
+            args.pop("cursor")
+            vinyls, next_cursor, result = query_facet_page(facet_index, args)
+        facets = result["facets"]
+        endpoint = url_for("api_facets")
+    else:
+        try:
+            vinyls, next_cursor = query_catalog_page(request.args)
+        except ValueError as e:
+            app.logger.warning(f"Invalid shop arguments, showing the default listing: {e}")
+            vinyls, next_cursor = query_catalog_page(MultiDict())
+        if facet_index is not None:
+            facets = facet_index.query({}, limit=0)["facets"]
+    return render_template(
+        "views/shop.html",
+        vinyls=vinyls,
+        next_cursor=next_cursor,
+        endpoint=endpoint,
+        facets=facets,
+        selected=selected,
+        sort=request.args.get("sort", "id"),
+        order=request.args.get("order", "asc"),
+    )
+
+
+@app.route("/api/facets", methods=["GET"])
+def api_facets():
+    facet_index = database_handler.get_facet_index()
+    if facet_index is None:
+        return jsonify({"error": "Facet index is not available yet."}), 503
+    try:
+        vinyls, next_cursor, result = query_facet_page(facet_index, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return (
+        jsonify({"vinyls": vinyls, "total": result["total"], "facets": result["facets"], "next_cursor": next_cursor}),
+        200,
+    )
+
+
+@app.route("/api/vinyls", methods=["GET"])
+def api_vinyls():
+    try:
+        vinyls, next_cursor = query_catalog_page(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rows = [app.json.dumps(vinyl) for vinyl in vinyls]
+    etag = hashlib.sha1("\n".join(rows + [str(next_cursor)]).encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+
+        def generate():
+            yield '{"vinyls":['
+            for position, row in enumerate(rows):
+                yield f",{row}" if position else row
+            yield f'],"next_cursor":{app.json.dumps(next_cursor)}}}'
+
+        response = app.response_class(generate(), mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config["CATALOG_API"]["max_age"]
+    return response
 
 
 @app.route("/search", methods=["GET"])
 def search():
     app.logger.info("Handling search query")
     query = request.args.get("q", "").lower()
-    results = database_handler.search_vinyls(query)
+    results = database_handler.catalog.search_vinyls(query)
+    if not results and query.strip():
+        # kept out of the search cache, a misspelling is no prefix of the words typed after it
+        return {"results": database_handler.suggest_vinyls(query), "fuzzy": True}, 200
     return {"results": results}, 200
 
 
@@ -105,7 +367,7 @@ def login():
     password = request.form.get("password")
     try:
         app.logger.info(f"cought information from login  {email}, {password}")
-        app.session = database_handler.handle_login(email, password)
+        app.session = database_handler.users.handle_login(email, password)
         if app.session["user_role"] == "admin":
             return redirect(url_for("admin_dashboard"))
         else:
@@ -130,11 +392,61 @@ def admin_dashboard():
     id = request.args.get("id", "").strip()
 
     try:
-        vinyls, genres = database_handler.search_vinyls_admin(genre, artist, min_price, max_price, id)
+        vinyls, genres = database_handler.catalog.search_vinyls_admin(genre, artist, min_price, max_price, id)
     except Exception as e:
         app.logger.error(f"Error while retrieving admin data: {e}")
         vinyls, genres = [], []
-    return render_template("views/admin_dashboard.html", vinyls=vinyls, genres=genres)
+
+    # nationality, decade and price bucket are narrowed with the facet bitmaps
+    selected = facet_filters(request.args, ("nationality", "decade", "price"))
+    facets = None
+    facet_index = database_handler.get_facet_index()
+    if facet_index is not None:
+        # without a selection only the counts are needed, not the matching ids
+        limit = None if any(selected.values()) else 0
+        result = facet_index.query(dict(selected, genre=[genre] if genre else []), limit=limit)
+        facets = result["facets"]
+        if any(selected.values()):
+            matching = set(result["vinyl_ids"])
+            vinyls = [vinyl for vinyl in vinyls if vinyl["vinyl_id"] in matching]
+    return render_template(
+        "views/admin_dashboard.html", vinyls=vinyls, genres=genres, facets=facets, selected=selected
+    )
+
+
+@app.route("/admin/stats", methods=["GET"])
+def admin_stats():
+    if "user_role" not in session or session["user_role"] != "admin":
+        return jsonify({"error": "Access denied! Admins only."}), 403
+
+    return (
+        jsonify(
+            {
+                "mariadb_pool": database_handler.get_pool_stats(),
+                "caches": database_handler.get_cache_stats(),
+                "search_index": database_handler.get_search_index_stats(),
+                "facet_index": database_handler.get_facet_index_stats(),
+                "fuzzy_index": database_handler.get_fuzzy_index_stats(),
+                "order_totals": order_totals.last_report(),
+                "order_journal": order_journal.stats(app),
+            }
+        ),
+        200,
+    )
+
+
+@app.route("/admin/query_stats", methods=["GET", "POST"])
+def admin_query_stats():
+    if "user_role" not in session or session["user_role"] != "admin":
+        return jsonify({"error": "Access denied! Admins only."}), 403
+
+    query_stats = database_handler.get_query_stats()
+    if query_stats is None:
+        return jsonify({"error": "Query statistics are disabled, set QUERY_STATS_ENABLED=true."}), 404
+    if request.method == "POST":
+        query_stats.reset()
+        return jsonify({"success": "Query statistics reset."}), 200
+    return jsonify(query_stats.report()), 200
 
 
 @app.route("/add_vinyl", methods=["POST"])
@@ -150,7 +462,7 @@ def add_vinyl():
     if not artist_id or not vinyl_name or not vinyl_price or not release_date or not cover_image or not genre:
         return jsonify({"error": "Missing required fields."}), 400
     try:
-        database_handler.insert_vinyl(artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre)
+        database_handler.catalog.insert_vinyl(artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre)
         return jsonify({"success": "insert successfull"}), 200
     except Exception as e:
         app.logger.error(f"exception in add_vinyl {e}")
@@ -165,8 +477,33 @@ def user_dashboard():
     if "user_role" not in session or session["user_role"] != "customer":
         return redirect(url_for("display_home"))
 
-    orders = database_handler.get_orders_for_user(session["user_id"])
-    return render_template("views/user_dashboard.html", orders=orders)
+    orders, next_cursor = query_order_page(session["user_id"], None)
+    return render_template("views/user_dashboard.html", orders=orders, next_cursor=next_cursor)
+
+
+def query_order_page(user_id, cursor):
+    page_size = app.config["ORDER_HISTORY"]["page_size"]
+    after = pagination.decode_order_cursor(cursor)
+    # one extra order tells whether there is a next page
+    orders = database_handler.orders.get_orders_for_user(user_id, page_size + 1, after)
+    if len(orders) <= page_size:
+        return orders, None
+    orders = orders[:page_size]
+    return orders, pagination.encode_order_cursor(orders[-1])
+
+
+@app.route("/user_dashboard/orders")
+def user_dashboard_orders():
+    # the next page of the order history, rendered with the same markup as the dashboard
+    if session.get("user_role") != "customer":
+        return jsonify({"error": "Access denied! Customers only."}), 403
+    try:
+        orders, next_cursor = query_order_page(session["user_id"], request.args.get("cursor"))
+    except pagination.InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(
+        {"html": render_template("views/order_history.html", orders=orders), "next_cursor": next_cursor}
+    )
 
 
 @app.route("/submit_review", methods=["POST"])
@@ -182,12 +519,12 @@ def submit_review():
     app.logger.info(f"Review received: Vinyl ID={vinyl_id}, Rating={rating}, Review Text={review_text}")
 
     try:
-        existing_review = database_handler.query_review_by_user(user_id, vinyl_id)
+        existing_review = database_handler.reviews.query_review_by_user(user_id, vinyl_id)
 
         if existing_review:
             return jsonify({"error": "You have already reviewed this vinyl."}), 400
 
-        database_handler.insert_review_for_vinyl(user_id, vinyl_id, rating, review_text)
+        database_handler.reviews.insert_review_for_vinyl(user_id, vinyl_id, rating, review_text)
 
         return jsonify({"message": "Review submitted successfully!"}), 200
     except Exception as e:
@@ -204,7 +541,7 @@ def check_review():
     if not user_id or not vinyl_id:
         return jsonify({"error": "Missing user_id or vinyl_id"}), 400
     try:
-        review = database_handler.query_review_by_user(user_id, vinyl_id)
+        review = database_handler.reviews.query_review_by_user(user_id, vinyl_id)
         if review:
             return (
                 jsonify(
@@ -232,7 +569,7 @@ def delete_review():
     if not user_id or not vinyl_id:
         return jsonify({"error": "Missing user_id or vinyl_id"}), 400
     try:
-        deletion = database_handler.delete_review(user_id, vinyl_id)
+        deletion = database_handler.reviews.delete_review(user_id, vinyl_id)
         if deletion:
             return jsonify({"success": "Deleted the review, thanks for nothing, man."}), 200
         else:
@@ -257,7 +594,7 @@ def best_rated():
     end_date = validate_date(end_date)
 
     try:
-        results = database_handler.fetch_reviews_summary(start_date, end_date)
+        results = database_handler.reviews.fetch_reviews_summary(start_date, end_date)
         app.logger.debug(f"Fetched results: {results}")
         return render_template(
             "views/best_rated.html",
@@ -270,23 +607,86 @@ def best_rated():
 
 @app.route("/buy_vinyl", methods=["POST"])
 def buy_vinyl():
-    vinyl_id = request.get_json().get("vinyl_id")
+    data = request.get_json(silent=True) or {}
     user_id = session.get("user_id")
     app.logger.info(f"user_id {user_id}")
     if user_id is None:
         return jsonify({"warning": "Please Log in before purchasing an item. Who do you think you are?"})
 
-    if app.session["user_role"] == "admin":
+    if session["user_role"] == "admin":
         return jsonify({"warning": "Hey you are an admin you cant buy a vinyl, listen to spotify or relog as user"})
+    try:
+        vinyl_id = int(data.get("vinyl_id"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "vinyl_id must be an integer"}), 400
     app.logger.info(f"ITEM ID ITEM ID: {vinyl_id}")
+    if order_journal.enabled(app):
+        token = order_journal.append(app, user_id, {vinyl_id: 1})
+        return jsonify({"success": "Order received, it will show up on your dashboard shortly.", "token": token})
     try:
-        database_handler.buy_vinyl(user_id, vinyl_id)
+        database_handler.orders.buy_vinyl(user_id, vinyl_id)
     except Exception as e:
         return jsonify({"error": f"something silly going one here, here is the error message {e}"}), 500
     finally:
         return jsonify({"success": "yay it worked i guess..."})
 
 
+def cart_response(cart):
+    vinyls = database_handler.catalog.query_vinyls_by_ids([int(vinyl_id) for vinyl_id in cart])
+    lines = [dict(vinyl, amount=cart[str(vinyl["vinyl_id"])]) for vinyl in vinyls]
+    total = sum(float(line["price"]) * line["amount"] for line in lines)
+    return jsonify({"items": lines, "total_price": round(total, 2)})
+
+
+@app.route("/cart", methods=["GET", "POST", "DELETE"])
+def cart():
+    # vinyl id (as a string, session data is JSON) -> amount
+    cart = session.get("cart", {})
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        cart_config = app.config["CART"]
+        try:
+            vinyl_id = str(int(data.get("vinyl_id")))
+            amount = int(data.get("amount", 1))
+        except (TypeError, ValueError):
+            return jsonify({"error": "vinyl_id and amount must be integers"}), 400
+        if not data.get("replace"):
+            amount += cart.get(vinyl_id, 0)
+        if amount <= 0:
+            cart.pop(vinyl_id, None)
+        elif vinyl_id not in cart and len(cart) >= cart_config["max_lines"]:
+            return jsonify({"warning": f"Your cart is full, at most {cart_config['max_lines']} different vinyls."}), 400
+        else:
+            cart[vinyl_id] = min(amount, cart_config["max_amount"])
+        session["cart"] = cart
+    elif request.method == "DELETE":
+        cart = {}
+        session.pop("cart", None)
+    return cart_response(cart)
+
+
+@app.route("/checkout", methods=["POST"])
+def checkout():
+    user_id = session.get("user_id")
+    if user_id is None:
+        return jsonify({"warning": "Please Log in before purchasing an item. Who do you think you are?"})
+    if session.get("user_role") == "admin":
+        return jsonify({"warning": "Hey you are an admin you cant buy a vinyl, listen to spotify or relog as user"})
+    cart = session.get("cart")
+    if not cart:
+        return jsonify({"warning": "Your cart is empty."}), 400
+    items = {int(vinyl_id): amount for vinyl_id, amount in cart.items()}
+    if order_journal.enabled(app):
+        token = order_journal.append(app, user_id, items)
+        session.pop("cart", None)
+        return jsonify({"success": "Order received, it will show up on your dashboard shortly.", "token": token})
+    result = database_handler.orders.checkout(user_id, items)
+    if "error" in result:
+        return jsonify(result), 500
+    session.pop("cart", None)
+    return jsonify(result)
+
+
 @app.route("/logout", methods=["GET"])
 def logout():
     if session.get("user_id") is None:
@@ -304,7 +704,7 @@ def purchase_overview():
         genre = request.form.get("genre", "").strip() or None
 
         try:
-            summary_data, details_data = database_handler.get_purchase_overview(
+            summary_data, details_data = database_handler.orders.get_purchase_overview(
                 artist_name, start_date, end_date, genre
             )
             return render_template("views/purchase_overview.html", sales_data=summary_data, vinyl_sales=details_data)
@@ -0,0 +1,61 @@
+import pymysql
+
+# single row control table, every worker compares its cached (backend, version, catalog version)
+# against it so that a switch or a catalog write in one process reaches all of them
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS Backend_State (
+        State_ID TINYINT PRIMARY KEY,
+        Backend VARCHAR(32) NOT NULL,
+        Version INT NOT NULL DEFAULT 1,
+        Catalog_Version INT NOT NULL DEFAULT 0
+    );
+"""
+
+
+def create_table(mariadb_connection):
+    with mariadb_connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+    mariadb_connection.commit()
+
+
+def is_published(mariadb_connection):
+    # independent of the columns, a database from before a Backend_State migration still counts as seeded
+    with mariadb_connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM Backend_State WHERE State_ID = 1")
+        row = cursor.fetchone()
+    mariadb_connection.commit()
+    return row is not None
+
+
+def read_state(mariadb_connection):
+    with mariadb_connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        cursor.execute("SELECT Backend, Version, Catalog_Version FROM Backend_State WHERE State_ID = 1")
+        row = cursor.fetchone()
+    # plain reads must not keep a snapshot open on the request connection
+    mariadb_connection.commit()
+    if not row:
+        return None
+    return row["Backend"], row["Version"], row["Catalog_Version"]
+
+
+def publish_state(mariadb_connection, backend, previous_version=0):
+    # previous_version carries the counter over a reseed, which drops the table
+    create_table(mariadb_connection)
+    with mariadb_connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO Backend_State (State_ID, Backend, Version)
+            VALUES (1, %s, %s)
+            ON DUPLICATE KEY UPDATE Backend = VALUES(Backend), Version = Version + 1
+            """,
+            (backend, previous_version + 1),
+        )
+    mariadb_connection.commit()
+    return read_state(mariadb_connection)
+
+
+def bump_catalog_version(mariadb_connection):
+    with mariadb_connection.cursor() as cursor:
+        cursor.execute("UPDATE Backend_State SET Catalog_Version = Catalog_Version + 1 WHERE State_ID = 1")
+    mariadb_connection.commit()
+    return read_state(mariadb_connection)
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from app.backend import backend_state
+from app.backend import database_handler
+from app.backend import mariadb_migrations
+
+# MariaDB named lock, held by exactly one process of the deployment while it seeds
+BOOTSTRAP_LOCK = "dumbass_records_bootstrap"
+
+_bootstrapped = threading.Event()
+
+
+def is_seeded(mariadb_connection):
+    # the Backend_State row is published after the seed data, so it only
+    # exists once schema and data are complete
+    try:
+        return backend_state.is_published(mariadb_connection)
+    except Exception:
+        return False
+
+
+def bootstrap(app):
+    bootstrap_config = app.config["BOOTSTRAP"]
+    mariadb_connection = database_handler.get_mariadb_connection()
+    cursor = mariadb_connection.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (BOOTSTRAP_LOCK, bootstrap_config["lock_timeout"]))
+    if cursor.fetchone()[0] != 1:
+        raise TimeoutError(f"Could not acquire bootstrap lock within {bootstrap_config['lock_timeout']}s")
+    try:
+        if is_seeded(mariadb_connection):
+            app.logger.info("Database already seeded, skipping bootstrap.")
+            # existing databases only receive the index migrations they are missing
+            mariadb_migrations.apply_migrations(mariadb_connection)
+            database_handler.sync_backend(force=True)
+        else:
+            app.logger.info("Bootstrapping database: creating schema and seed data.")
+            database_handler.erase_and_fill_db()
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (BOOTSTRAP_LOCK,))
+        cursor.close()
+
+    if app.config["SEARCH_INDEX"]["enabled"]:
+        try:
+            database_handler.build_search_index()
+        except Exception as e:
+            # /search falls back to the database and retries the build on demand
+            app.logger.warning(f"Could not build search index during bootstrap: {e}")
+    _bootstrapped.set()
+
+
+def _run(app):
+    retry_interval = app.config["BOOTSTRAP"]["retry_interval"]
+    while not _bootstrapped.is_set():
+        try:
+            with app.app_context():
+                bootstrap(app)
+        except Exception as e:
+            app.logger.warning(f"Bootstrap failed, retrying in {retry_interval}s: {e}")
+            time.sleep(retry_interval)
+    app.logger.info("Bootstrap finished.")
+
+
+def start(app):
+    # the database container may still be starting, so bootstrap retries in the
+    # background while /readyz keeps the worker out of the load balancer
+    if not app.config["BOOTSTRAP"]["enabled"]:
+        # seeding is left to another process, readiness only checks the data
+        _bootstrapped.set()
+        return
+    threading.Thread(target=_run, args=(app,), name="bootstrap", daemon=True).start()
+
+
+def is_ready():
+    if not _bootstrapped.is_set():
+        return False
+    return is_seeded(database_handler.get_mariadb_connection())
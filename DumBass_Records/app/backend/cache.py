@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.backend.search_index import normalize
+
+
+class TTLCache:
+    def __init__(self, maxsize=128, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+class PrefixSearchCache:
+    # LRU of search results keyed on the normalized query. Results of the trigram index can be narrowed
+    # down in memory: a query that extends a cached prefix whose result list was not cut off at the limit
+    # is refined from that list by the index that produced it. Database results are only reused for the
+    # exact query, full-text matches of a longer query are no subset of a shorter one's.
+    def __init__(self, maxsize=512, ttl=60.0, limit=20):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.limit = limit
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, query, index=None):
+        query = normalize(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._lookup(query, now)
+            if entry is not None:
+                self.hits += 1
+                return entry[1]
+            prefixes = []
+            if index is not None:
+                for length in range(len(query) - 1, 0, -1):
+                    entry = self._lookup(query[:length], now)
+                    if entry is not None and entry[0] is index and len(entry[1]) < self.limit:
+                        prefixes.append((query[:length], entry[1]))
+
+        for prefix, cached in prefixes:
+            results = index.refine(prefix, query, cached, self.limit)
+            if results is not None:
+                with self._lock:
+                    self.prefix_hits += 1
+                self.set(query, results, index)
+                return results
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, query, results, index=None):
+        # index is the trigram index the results came from, None for database results
+        query = normalize(query)
+        with self._lock:
+            self._entries[query] = (time.monotonic() + self.ttl, index, results)
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.prefix_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "prefix_hits": self.prefix_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.prefix_hits) / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+    def _lookup(self, query, now):
+        entry = self._entries.get(query)
+        if entry is None:
+            return None
+        if entry[0] < now:
+            del self._entries[query]
+            return None
+        self._entries.move_to_end(query)
+        return entry[1:]
@@ -0,0 +1,40 @@
+import random
+import threading
+import time
+from array import array
+
+
+class CatalogSampler:
+    def __init__(self):
+        # 4 bytes per vinyl, a million vinyls fit in 4 MB
+        self._ids = array("i")
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def is_stale(self, max_age):
+        if self._loaded_at is None:
+            return True
+        return bool(max_age) and time.monotonic() - self._loaded_at > max_age
+
+    def refresh(self, vinyl_ids):
+        ids = array("i", vinyl_ids)
+        with self._lock:
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+
+    def add(self, vinyl_id):
+        with self._lock:
+            if self._loaded_at is not None:
+                self._ids.append(int(vinyl_id))
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def sample(self, limit):
+        with self._lock:
+            ids = self._ids
+            return random.sample(ids, min(limit, len(ids)))
+
+    def __len__(self):
+        return len(self._ids)
@@ -1,96 +1,441 @@
-from app.backend import mariadb_handler
 from app.backend import mariadb_initializer
 from app.backend import mongodb_initializer
 from app.backend import mongodb_handler
+from app.backend import repositories
+from app.backend import backend_state
+from app.backend.mariadb_pool import MariaDBPool, PoolTimeoutError
+from app.backend.query_stats import QueryStats
+from app.backend.cache import PrefixSearchCache, TTLCache
+from app.backend.search_index import TrigramIndex
+from app.backend.facet_index import FacetIndex
+from app.backend.fuzzy_index import FuzzyIndex
+import atexit
+import os
 import pymysql
-import sys
-from flask import request, current_app
+import threading
+import time
+from flask import current_app, g
 from pymongo import MongoClient
 
 
+_mariadb_pool = None
+_mariadb_pool_lock = threading.Lock()
+
+
+def get_mariadb_pool():
+    global _mariadb_pool
+    with _mariadb_pool_lock:
+        # a forked worker must not share sockets with its parent
+        if _mariadb_pool is None or _mariadb_pool.pid != os.getpid():
+            mariadb_config = current_app.config["MARIADB"]
+            pool_config = current_app.config["MARIADB_POOL"]
+            _mariadb_pool = MariaDBPool(
+                host=mariadb_config["host"],
+                port=mariadb_config["port"],
+                user=mariadb_config["user"],
+                password=mariadb_config["password"],
+                database=mariadb_config["name"],
+                size=pool_config["size"],
+                timeout=pool_config["timeout"],
+                max_lifetime=pool_config["max_lifetime"],
+                ping=pool_config["ping"],
+                query_stats=get_query_stats(),
+            )
+            current_app.logger.info(f"Created MariaDB connection pool with size {pool_config['size']}")
+        return _mariadb_pool
+
+
+_query_stats = None
+_query_stats_lock = threading.Lock()
+
+
+def get_query_stats():
+    global _query_stats
+    stats_config = current_app.config["QUERY_STATS"]
+    if not stats_config["enabled"]:
+        return None
+    with _query_stats_lock:
+        # concurrent first requests must record into the same instance
+        if _query_stats is None:
+            _query_stats = QueryStats(
+                slow_ms=stats_config["slow_ms"],
+                explain_interval=stats_config["explain_interval"],
+                max_fingerprints=stats_config["max_fingerprints"],
+            )
+        return _query_stats
+
+
+def get_pool_stats():
+    return get_mariadb_pool().stats()
+
+
 def get_mariadb_connection():
+    # one pooled connection per request, shared by every handler call and
+    # handed back to the pool by release_connections() on teardown
+    if "mariadb_connection" in g:
+        return g.mariadb_connection
     try:
-        mariadb_config = current_app.config["MARIADB"]
-        connection = pymysql.connect(
-            host=mariadb_config["host"],
-            port=mariadb_config["port"],
-            user=mariadb_config["user"],
-            password=mariadb_config["password"],
-            database=mariadb_config["name"],
-        )
-        return connection
+        g.mariadb_connection = get_mariadb_pool().acquire()
+        return g.mariadb_connection
+    except PoolTimeoutError as e:
+        current_app.logger.error(f"MARIADB Pool Error: {e}")
+        raise
     except pymysql.MySQLError as e:
+        # no sys.exit here, /readyz reports the outage and bootstrap retries
         current_app.logger.error(f"MARIADB Database Error: {e}")
-        sys.exit(1)
+        raise
+
+
+def release_connections(exception=None):
+    connection = g.pop("mariadb_connection", None)
+    if connection is not None:
+        connection.close()
+
+
+_mongodb_client = None
+_mongodb_client_pid = None
+_mongodb_client_lock = threading.Lock()
+
+
+def get_mongodb_client():
+    global _mongodb_client, _mongodb_client_pid
+    with _mongodb_client_lock:
+        # MongoClient is not fork-safe, every worker process builds its own
+        if _mongodb_client is None or _mongodb_client_pid != os.getpid():
+            mongo_config = current_app.config["MONGODB"]
+            _mongodb_client = MongoClient(
+                host=mongo_config["host"],
+                port=mongo_config["port"],
+                maxPoolSize=mongo_config["max_pool_size"],
+                serverSelectionTimeoutMS=mongo_config["server_selection_timeout_ms"],
+                compressors=mongo_config["compressors"],
+                connect=False,
+            )
+            _mongodb_client_pid = os.getpid()
+            current_app.logger.info(f"Created MongoDB client for database '{mongo_config['db']}'.")
+        return _mongodb_client
 
 
 def get_mongodb_connection():
-    mongo_config = current_app.config["MONGODB"]
-    client = MongoClient(host=mongo_config["host"], port=mongo_config["port"])
-    current_app.logger.info(f"Connected to MongoDB database '{mongo_config['db']}' successfully.")
-    db = client[mongo_config["db"]]
-    return db
+    return get_mongodb_client()[current_app.config["MONGODB"]["db"]]
 
 
-initialized = False
-migrated = False
+def close_mongodb_client():
+    global _mongodb_client
+    with _mongodb_client_lock:
+        if _mongodb_client is not None and _mongodb_client_pid == os.getpid():
+            _mongodb_client.close()
+        _mongodb_client = None
 
 
-def initialize_db():
-    global initialized
-    global migrated
-    if not initialized:
-        mariadb_connection = get_mariadb_connection()
-        mariadb_initializer.erase_and_fill_maria_db(mariadb_connection)
-        initialized = True
-        migrated = False
+def _reset_after_fork():
+    # runs in the forked child, the inherited client and pool belong to the parent
+    global _mongodb_client, _mongodb_client_lock, _mariadb_pool, _mariadb_pool_lock, _query_stats_lock
+    _mongodb_client = None
+    _mongodb_client_lock = threading.Lock()
+    _mariadb_pool = None
+    _mariadb_pool_lock = threading.Lock()
+    _query_stats_lock = threading.Lock()
+
 
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(close_mongodb_client)
 
-def erase_and_fill_db():
-    global migrated
-    migrated = False
-    mariadb_connection = get_mariadb_connection()
-    mariadb_initializer.erase_and_fill_maria_db(mariadb_connection)
+
+MARIADB = "mariadb"
+MONGODB = "mongodb"
+
+_catalog_cache = None
+
+
+def get_catalog_cache():
+    global _catalog_cache
+    if _catalog_cache is None:
+        cache_config = current_app.config["CATALOG_CACHE"]
+        _catalog_cache = TTLCache(maxsize=cache_config["maxsize"], ttl=cache_config["ttl"])
+    return _catalog_cache
+
+
+_search_cache = None
+
+
+def get_search_cache():
+    global _search_cache
+    if _search_cache is None:
+        cache_config = current_app.config["SEARCH_CACHE"]
+        _search_cache = PrefixSearchCache(maxsize=cache_config["maxsize"], ttl=cache_config["ttl"])
+    return _search_cache
 
 
-def query_vinyls(limit):
-    if migrated:
-        current_app.logger.debug("Querying Vinyls from MongoDB")
-        return mongodb_handler.query_vinyls(get_mongodb_connection(), limit)
-    else:
-        current_app.logger.debug("Querying Vinyls from MariaDB")
-        return mariadb_handler.query_vinyls(get_mariadb_connection(), limit)
+_order_cache = None
 
 
-def search_vinyls(query):
-    if migrated:
-        current_app.logger.debug("Searching Vinyls from MongoDB")
-        return mongodb_handler.search_vinyls(get_mongodb_connection(), query)
-    else:
-        current_app.logger.debug("Searching Vinyls from MariaDB")
-        return mariadb_handler.search_vinyls(get_mariadb_connection(), query)
+def get_order_cache():
+    global _order_cache
+    if _order_cache is None:
+        cache_config = current_app.config["ORDER_HISTORY"]
+        _order_cache = TTLCache(maxsize=cache_config["cache_size"], ttl=cache_config["cache_ttl"])
+    return _order_cache
 
 
-def handle_login(email, password):
-    if migrated:
-        current_app.logger.debug("handling login from mongodb")
-        return mongodb_handler.handle_login(get_mongodb_connection(), email, password)
-    else:
-        current_app.logger.debug("handling login with mariadb")
-        return mariadb_handler.handle_login(get_mariadb_connection(), email, password)
+_overview_cache = None
 
 
-def insert_vinyl(artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre):
-    if migrated:
-        current_app.logger.debug("inserting vinyl mongodb")
-        return mongodb_handler.insert_vinyl(
-            get_mongodb_connection(), artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre
-        )
-    else:
-        current_app.logger.debug("inserting vinyl mariadb")
-        return mariadb_handler.insert_vinyl(
-            get_mariadb_connection(), artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre
-        )
+def get_overview_cache():
+    global _overview_cache
+    if _overview_cache is None:
+        cache_config = current_app.config["PURCHASE_OVERVIEW_CACHE"]
+        _overview_cache = TTLCache(maxsize=cache_config["maxsize"], ttl=cache_config["ttl"])
+    return _overview_cache
+
+
+def get_cache_stats():
+    return {
+        "catalog": get_catalog_cache().stats(),
+        "search": get_search_cache().stats(),
+        "orders": get_order_cache().stats(),
+        "purchase_overview": get_overview_cache().stats(),
+    }
+
+
+_search_index = None
+_facet_index = None
+_fuzzy_index = None
+# None until built, and again once the catalog changed in another worker
+_search_index_built_at = None
+_search_index_building = False
+# bumped on every bind, a build started for an older generation is dropped
+_search_index_generation = 0
+_search_index_lock = threading.Lock()
+
+
+def build_search_index():
+    global _search_index, _facet_index, _fuzzy_index, _search_index_built_at
+    with _search_index_lock:
+        generation = _search_index_generation
+        source = catalog
+    # the facet bitmaps and the typo tolerant dictionary are built in the same pass over the catalog
+    index = TrigramIndex()
+    facets = FacetIndex()
+    fuzzy = FuzzyIndex(
+        distance=current_app.config["SEARCH_INDEX"]["fuzzy_distance"],
+        prefix_length=current_app.config["SEARCH_INDEX"]["fuzzy_prefix_length"],
+    )
+    for vinyl in source.query_all_vinyls():
+        index.add(vinyl)
+        facets.add(vinyl)
+        fuzzy.add(vinyl)
+    with _search_index_lock:
+        if generation != _search_index_generation:
+            return None
+        _search_index = index
+        _facet_index = facets
+        _fuzzy_index = fuzzy
+        _search_index_built_at = time.monotonic()
+    # results cached from the database fallback or an older index
+    if _search_cache is not None:
+        _search_cache.clear()
+    current_app.logger.info(f"Search index built with {len(index)} vinyls from {active_backend}.")
+    return index
+
+
+def _rebuild_search_index(app):
+    global _search_index_building
+    try:
+        with app.app_context():
+            build_search_index()
+    except Exception as e:
+        app.logger.error(f"Building the search index failed: {e}")
+    finally:
+        _search_index_building = False
+
+
+def _refresh_search_index():
+    global _search_index_building
+    # caller holds _search_index_lock
+    max_age = current_app.config["SEARCH_INDEX"]["max_age"]
+    stale = (
+        _search_index is None
+        or _search_index_built_at is None
+        or (max_age and time.monotonic() - _search_index_built_at > max_age)
+    )
+    if stale and not _search_index_building:
+        # the stale index keeps serving, or the database while there is none yet
+        _search_index_building = True
+        app = current_app._get_current_object()
+        threading.Thread(target=_rebuild_search_index, args=(app,), name="search-index", daemon=True).start()
+
+
+def get_search_index():
+    if not current_app.config["SEARCH_INDEX"]["enabled"]:
+        return None
+    with _search_index_lock:
+        _refresh_search_index()
+        return _search_index
+
+
+def get_facet_index():
+    if not current_app.config["SEARCH_INDEX"]["enabled"]:
+        return None
+    with _search_index_lock:
+        _refresh_search_index()
+        return _facet_index
+
+
+def get_fuzzy_index():
+    if not current_app.config["SEARCH_INDEX"]["enabled"]:
+        return None
+    with _search_index_lock:
+        _refresh_search_index()
+        return _fuzzy_index
+
+
+def suggest_vinyls(query):
+    # typo tolerant fallback for an empty /search, nothing while the index is (re)building
+    fuzzy = get_fuzzy_index()
+    return fuzzy.search(query, 20) if fuzzy is not None else []
+
+
+def get_search_index_stats():
+    index = _search_index
+    return index.stats() if index is not None else None
+
+
+def get_facet_index_stats():
+    facets = _facet_index
+    return facets.stats() if facets is not None else None
+
+
+def get_fuzzy_index_stats():
+    fuzzy = _fuzzy_index
+    return fuzzy.stats() if fuzzy is not None else None
+
+
+def _create_backend(create, get_connection):
+    backend = create(get_connection)
+    backend = repositories.with_search_index(backend, get_search_index, get_facet_index, get_fuzzy_index)
+    backend = repositories.with_order_cache(backend, get_order_cache, get_overview_cache)
+    # publish_catalog_change is defined further down, next to the other Backend_State functions
+    return repositories.with_catalog_cache(
+        backend, get_catalog_cache, get_search_cache, lambda: publish_catalog_change()
+    )
+
+
+repositories.register_backend(
+    MARIADB, lambda: _create_backend(repositories.create_mariadb_backend, get_mariadb_connection)
+)
+repositories.register_backend(
+    MONGODB, lambda: _create_backend(repositories.create_mongodb_backend, get_mongodb_connection)
+)
+
+# the repositories of the active backend, routes call them directly
+active_backend = None
+catalog = None
+orders = None
+reviews = None
+users = None
+
+
+def bind_backend(name):
+    global active_backend, catalog, orders, reviews, users, _search_index_generation
+    global _search_index, _facet_index, _fuzzy_index
+    backend = repositories.create_backend(name)
+    with _search_index_lock:
+        catalog = backend.catalog
+        orders = backend.orders
+        reviews = backend.reviews
+        users = backend.users
+        active_backend = backend.name
+        # listings and the search index of the previous backend, or of the data before a reseed, are stale
+        _search_index = None
+        _facet_index = None
+        _fuzzy_index = None
+        _search_index_generation += 1
+    if _catalog_cache is not None:
+        _catalog_cache.clear()
+    if _search_cache is not None:
+        _search_cache.clear()
+    if _order_cache is not None:
+        _order_cache.clear()
+    if _overview_cache is not None:
+        _overview_cache.clear()
+
+
+bind_backend(MARIADB)
+
+# last (backend, version, catalog version) seen in the shared Backend_State table
+_backend_state = None
+_backend_state_checked_at = 0.0
+
+
+def sync_backend(force=False):
+    global _backend_state, _backend_state_checked_at
+    refresh_interval = current_app.config["BACKEND_STATE"]["refresh_interval"]
+    now = time.monotonic()
+    if not force and now - _backend_state_checked_at < refresh_interval:
+        return
+    _backend_state_checked_at = now
+
+    try:
+        state = backend_state.read_state(get_mariadb_connection())
+    except Exception as e:
+        current_app.logger.warning(f"Could not read shared backend state, keeping {active_backend}: {e}")
+        return
+    if state is None or state == _backend_state:
+        return
+
+    previous = _backend_state
+    _backend_state = state
+    if previous is not None and state[:2] == previous[:2]:
+        current_app.logger.info(f"Catalog changed in another worker (version {state[2]}), dropping catalog caches")
+        invalidate_catalog()
+        return
+    # a new version also means reseeded data, rebinding drops the in-memory state of the old repositories
+    current_app.logger.info(f"Binding backend {state[0]} (version {state[1]}), was {active_backend}")
+    bind_backend(state[0])
+
+
+def invalidate_catalog():
+    # the stale search index keeps serving until the rebuild, a build already running is dropped
+    global _search_index_built_at, _search_index_generation
+    with _search_index_lock:
+        _search_index_built_at = None
+        _search_index_generation += 1
+    if _catalog_cache is not None:
+        _catalog_cache.clear()
+    if _search_cache is not None:
+        _search_cache.clear()
+    catalog.invalidate()
+
+
+def publish_catalog_change():
+    global _backend_state
+    try:
+        state = backend_state.bump_catalog_version(get_mariadb_connection())
+    except Exception as e:
+        current_app.logger.warning(f"Could not publish the catalog change, other workers catch up on expiry: {e}")
+        return
+    # this worker is already current, unless another one changed the catalog in between
+    if state and _backend_state and state[:2] == _backend_state[:2] and state[2] == _backend_state[2] + 1:
+        _backend_state = state
+
+
+def publish_backend(name):
+    global _backend_state, _backend_state_checked_at
+    bind_backend(name)
+    previous_version = _backend_state[1] if _backend_state else 0
+    _backend_state = backend_state.publish_state(get_mariadb_connection(), name, previous_version)
+    _backend_state_checked_at = time.monotonic()
+    current_app.logger.info(f"Published backend {name} (version {_backend_state[1]})")
+
+
+def erase_and_fill_db():
+    sync_backend(force=True)
+    mariadb_connection = get_mariadb_connection()
+    mariadb_initializer.erase_and_fill_maria_db(mariadb_connection)
+    # the database was dropped underneath the idle connections
+    get_mariadb_pool().clear()
+    publish_backend(MARIADB)
 
 
 def handle_migration():
@@ -98,96 +443,7 @@ def handle_migration():
     mariadb_connection = get_mariadb_connection()
     mongodb_initializer.create_collections_with_schemas(mongodb_connection)
     mongodb_initializer.fill_mongodb(mongodb_connection, mariadb_connection)
-    global migrated
-    migrated = True
-
-
-def search_vinyls_admin(genre, artist, min_price, max_price, id):
-    if migrated:
-        current_app.logger.debug("searching vinyls admin from mongodb")
-        return mongodb_handler.search_vinyls_admin(get_mongodb_connection(), genre, artist, min_price, max_price, id)
-    else:
-        current_app.logger.debug("seraching vinyls admin with mariadb")
-        return mariadb_handler.search_vinyls_admin(get_mariadb_connection(), genre, artist, min_price, max_price, id)
-
-
-def get_orders_for_user(user_id):
-    if migrated:
-        current_app.logger.debug(f"getting user orders for user_id {user_id} from mongodb")
-        return mongodb_handler.get_orders_for_user(get_mongodb_connection(), user_id)
-    else:
-        current_app.logger.debug(f"getting user orders for user_id {user_id} from mariadb")
-        return mariadb_handler.get_orders_for_user(get_mariadb_connection(), user_id)
-
-
-def query_review_by_user(user_id, vinyl_id):
-    if migrated:
-        current_app.logger.debug(f"getting user review for user_id {user_id} and vinyl_id {vinyl_id} from mongodb")
-        return mongodb_handler.query_review_by_user(get_mongodb_connection(), user_id, vinyl_id)
-    else:
-        current_app.logger.debug(f"getting user review for user_id {user_id} and vinyl_id {vinyl_id} from mariadb")
-        return mariadb_handler.query_review_by_user(get_mariadb_connection(), user_id, vinyl_id)
-
-
-def insert_review_for_vinyl(user_id, vinyl_id, rating, review_text):
-    if migrated:
-        current_app.logger.debug(
-            f"inserting user review for user_id {user_id} and vinyl_id {vinyl_id}, with rating {rating} and comment{review_text}, mongodb"
-        )
-        return mongodb_handler.insert_review_for_vinyl(get_mongodb_connection(), user_id, vinyl_id, rating, review_text)
-    else:
-        current_app.logger.debug(
-            f"inserting user review for user_id {user_id} and vinyl_id {vinyl_id}, with rating {rating} and comment{review_text}, mariadb"
-        )
-        return mariadb_handler.insert_review_for_vinyl(get_mariadb_connection(), user_id, vinyl_id, rating, review_text)
-
-
-def delete_review(user_id, vinyl_id):
-    if migrated:
-        current_app.logger.debug(f"deleting user review for user_id {user_id} and vinyl_id {vinyl_id} from mongodb")
-        return mongodb_handler.delete_review(get_mongodb_connection(), user_id, vinyl_id)
-    else:
-        current_app.logger.debug(f"deletiong user review for user_id {user_id} and vinyl_id {vinyl_id} from mariadb")
-        return mariadb_handler.delete_review(get_mariadb_connection(), user_id, vinyl_id)
-
-
-def fetch_reviews_summary(start_date, end_date):
-    if migrated:
-        current_app.logger.debug(f"searching reviews from {start_date} to {end_date} from mongodb")
-        return mongodb_handler.fetch_reviews_summary(get_mongodb_connection(), start_date, end_date)
-    else:
-        current_app.logger.debug(f"searching reviews from {start_date} to {end_date} from mariadb")
-        return mariadb_handler.fetch_reviews_summary(get_mariadb_connection(), start_date, end_date)
-
-
-def set_migrated(migrated_value):
-    global migrated
-    migrated = migrated_value
-
-
-def get_users():
-    if migrated:
-        current_app.logger.debug(f"query user mongodb")
-        return mongodb_handler.get_users(get_mongodb_connection())
-    else:
-        current_app.logger.debug(f"query user mariadb")
-        return mariadb_handler.get_users(get_mariadb_connection())
-
-
-def buy_vinyl(user_id, vinyl_id):
-    if migrated:
-        current_app.logger.debug(f"buying vinyal mongodb")
-        return mongodb_handler.buy_vinyl(get_mongodb_connection(), user_id, vinyl_id)
-    else:
-        current_app.logger.debug(f"buying vinyal mongodb")
-        return mariadb_handler.buy_vinyl(get_mariadb_connection(), user_id, vinyl_id)
-
-
-def get_purchase_overview(artist_name, start_date, end_date, genre):
-
-    if migrated:
-        current_app.logger.debug(f"getting overview with mongodb")
-        return mongodb_handler.get_purchase_overview(get_mongodb_connection(), artist_name, start_date, end_date, genre)
-    else:
-        current_app.logger.debug(f"getting overview with mariadb")
-        return mariadb_handler.get_purchase_overview(get_mariadb_connection(), artist_name, start_date, end_date, genre)
+    # the counters were reseeded with the migrated vinyls and orders
+    mongodb_handler.id_allocator().discard("vinyls")
+    mongodb_handler.id_allocator().discard("orders")
+    publish_backend(MONGODB)
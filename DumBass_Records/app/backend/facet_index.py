@@ -0,0 +1,135 @@
+import threading
+
+from app.backend.genres import split_genres
+from app.backend.pagination import InvalidCursor
+
+FACETS = ("genre", "nationality", "decade", "price")
+# upper bound (exclusive) and label of each price bucket, the last one is open ended
+PRICE_BUCKETS = ((20, "under 20"), (30, "20 - 30"), (40, "30 - 40"), (50, "40 - 50"), (None, "50 and up"))
+
+
+# positions of the set bits of every byte value, bitmaps are read a byte at a time
+BYTE_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256))
+
+
+def set_bits(bits, limit=None):
+    # doc numbers of the first limit set bits in ascending order. One pass over the bytes of the
+    # bitmap, clearing bits one at a time would copy the whole int for every match.
+    docs = []
+    for offset, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+        if byte:
+            docs += [offset * 8 + bit for bit in BYTE_BITS[byte]]
+            if limit is not None and len(docs) >= limit:
+                return docs[:limit]
+    return docs
+
+
+def price_bucket(price):
+    price = float(price or 0)
+    for upper, label in PRICE_BUCKETS:
+        if upper is None or price < upper:
+            return label
+
+
+def decade(release_date):
+    year = getattr(release_date, "year", None)
+    if year is None:
+        try:
+            year = int(str(release_date)[:4])
+        except ValueError:
+            return None
+    return f"{year // 10 * 10}s"
+
+
+def facet_values(vinyl):
+    values = {
+        "genre": split_genres(vinyl.get("genre")),
+        "nationality": [vinyl.get("nationality")],
+        "decade": [decade(vinyl.get("release_date"))],
+        "price": [price_bucket(vinyl.get("price"))],
+    }
+    return {facet: [value for value in facet_values if value] for facet, facet_values in values.items()}
+
+
+class FacetIndex:
+    def __init__(self):
+        # doc number -> vinyl id, docs are added in vinyl id order so bit order is id order
+        self._vinyl_ids = []
+        self._docs = {}
+        # facet -> value -> bitmap as a python int, bit n is set when doc n has the value
+        self._bitmaps = {facet: {} for facet in FACETS}
+        self._all = 0
+        self._lock = threading.Lock()
+
+    def add(self, vinyl):
+        with self._lock:
+            doc = len(self._vinyl_ids)
+            bit = 1 << doc
+            self._vinyl_ids.append(vinyl["vinyl_id"])
+            self._docs[vinyl["vinyl_id"]] = doc
+            self._all |= bit
+            for facet, values in facet_values(vinyl).items():
+                bitmaps = self._bitmaps[facet]
+                for value in values:
+                    bitmaps[value] = bitmaps.get(value, 0) | bit
+
+    def query(self, filters, limit=48, after=None):
+        # values of one facet are OR-ed, facets are AND-ed. The counts of a facet are
+        # computed with the filters of all other facets, so its other values stay selectable.
+        with self._lock:
+            everything = self._all
+            bitmaps = {facet: dict(values) for facet, values in self._bitmaps.items()}
+            after_doc = self._docs.get(after) if after is not None else None
+            vinyl_ids = self._vinyl_ids
+        if after is not None and after_doc is None:
+            raise InvalidCursor(f"Unknown cursor {after}")
+
+        masks = {}
+        for facet, values in filters.items():
+            if facet in bitmaps and values:
+                mask = 0
+                for value in values:
+                    mask |= bitmaps[facet].get(value, 0)
+                masks[facet] = mask
+
+        matches = everything
+        for mask in masks.values():
+            matches &= mask
+
+        counts = {}
+        for facet in FACETS:
+            base = everything
+            for other, mask in masks.items():
+                if other != facet:
+                    base &= mask
+            selected = set(filters.get(facet) or ())
+            facet_counts = {value: (bits & base).bit_count() for value, bits in bitmaps[facet].items()}
+            counts[facet] = {
+                value: count for value, count in sorted(facet_counts.items()) if count or value in selected
+            }
+
+        page = matches
+        if after_doc is not None:
+            page = page >> (after_doc + 1) << (after_doc + 1)
+        # limit 0 only asks for the counts, one doc past the limit tells whether there is a next page
+        docs = set_bits(page, None if limit is None else limit + 1) if limit != 0 else []
+        has_more = page != 0 if limit == 0 else limit is not None and len(docs) > limit
+
+        return {
+            "vinyl_ids": [vinyl_ids[doc] for doc in docs[:limit]],
+            "total": matches.bit_count(),
+            "facets": counts,
+            "has_more": has_more,
+        }
+
+    def __len__(self):
+        return len(self._vinyl_ids)
+
+    def stats(self):
+        with self._lock:
+            bitmaps = [bits for values in self._bitmaps.values() for bits in values.values()]
+            return {
+                "documents": len(self._vinyl_ids),
+                "values": {facet: len(values) for facet, values in self._bitmaps.items()},
+                "bitmap_bytes": sum((bits.bit_length() + 7) // 8 for bits in bitmaps),
+            }
@@ -0,0 +1,143 @@
+import heapq
+import threading
+from array import array
+
+from app.backend.search_index import FIELDS, normalize
+
+
+def max_distance(word):
+    # short words get fewer edits, otherwise almost every short word matches
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 5:
+        return 1
+    return 2
+
+
+def deletes(word, distance):
+    # every string reachable from word by removing up to distance characters
+    variants = {word}
+    edge = {word}
+    for _ in range(distance):
+        edge = {variant[:i] + variant[i + 1 :] for variant in edge if len(variant) > 1 for i in range(len(variant))}
+        variants |= edge
+    return variants
+
+
+def edit_distance(source, target, limit):
+    # optimal string alignment distance, gives up with limit + 1 once every cell of a row exceeds limit
+    if abs(len(source) - len(target)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(target) + 1))
+    for i in range(1, len(source) + 1):
+        current = [i] + [0] * len(target)
+        for j in range(1, len(target) + 1):
+            cost = source[i - 1] != target[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (
+                previous_previous is not None
+                and j > 1
+                and source[i - 1] == target[j - 2]
+                and source[i - 2] == target[j - 1]
+            ):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    # SymSpell style lookup: the deletes of every dictionary word are precomputed, so a
+    # misspelled word only has to be compared with the words sharing one of its deletes.
+    # Deletes are only generated for the first prefix_length characters, which keeps the
+    # dictionary small, candidates are still verified against the whole word.
+    def __init__(self, distance=2, prefix_length=6):
+        self.distance = distance
+        self.prefix_length = prefix_length
+        self._records = []
+        # word -> array("i") of doc << 1 | matched in the artist name
+        self._postings = {}
+        # delete of a word prefix -> the word, or the list of words, it was derived from
+        self._deletes = {}
+        self._lock = threading.Lock()
+
+    def add(self, vinyl):
+        artist_words = set(normalize(vinyl.get("artist_name")).split())
+        title_words = set(normalize(vinyl.get("vinyl_title")).split())
+        with self._lock:
+            doc = len(self._records)
+            self._records.append(tuple(vinyl.get(field) for field in FIELDS))
+            for word in artist_words | title_words:
+                postings = self._postings.get(word)
+                if postings is None:
+                    postings = self._postings[word] = array("i")
+                    for variant in self._deletes_of(word):
+                        # most deletes belong to a single word, which is stored without a list
+                        words = self._deletes.get(variant)
+                        if words is None:
+                            self._deletes[variant] = word
+                        elif isinstance(words, str):
+                            self._deletes[variant] = [words, word]
+                        else:
+                            words.append(word)
+                postings.append(doc << 1 | (word in artist_words))
+
+    def _deletes_of(self, word):
+        return deletes(word[: self.prefix_length], min(self.distance, max_distance(word)))
+
+    def lookup(self, word):
+        # the closest dictionary words within the allowed distance, as (words, distance)
+        limit = min(self.distance, max_distance(word))
+        if word in self._postings:
+            return [word], 0
+        closest = []
+        for variant in self._deletes_of(word):
+            words = self._deletes.get(variant, ())
+            for candidate in (words,) if isinstance(words, str) else words:
+                distance = edit_distance(word, candidate, limit)
+                if distance < limit:
+                    limit = distance
+                    closest = [candidate]
+                elif distance == limit and candidate not in closest:
+                    closest.append(candidate)
+        return closest, limit
+
+    def search(self, query, limit=20):
+        words = normalize(query).split()
+        if not words:
+            return []
+        with self._lock:
+            # doc -> [matched query words, summed distance, matched in an artist name]
+            scores = {}
+            for word in words:
+                candidates, distance = self.lookup(word)
+                matched = {}
+                for candidate in candidates:
+                    for posting in self._postings[candidate]:
+                        doc = posting >> 1
+                        matched[doc] = matched.get(doc, 0) | posting & 1
+                for doc, in_artist in matched.items():
+                    score = scores.get(doc)
+                    if score is None:
+                        score = scores[doc] = [0, 0, 0]
+                    score[0] += 1
+                    score[1] += distance
+                    score[2] += in_artist
+            # docs matching more of the query words first, then the closest spellings, then artist matches
+            ranked = heapq.nsmallest(
+                limit, scores.items(), key=lambda item: (-item[1][0], item[1][1], -item[1][2], item[0])
+            )
+            return [dict(zip(FIELDS, self._records[doc])) for doc, _ in ranked]
+
+    def __len__(self):
+        return len(self._records)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._records),
+                "words": len(self._postings),
+                "deletes": len(self._deletes),
+            }
@@ -0,0 +1,12 @@
+import re
+
+# Discogs genres that contain the separator themselves
+COMPOUND_GENRES = ("Folk, World, & Country",)
+GENRE_NAMES = re.compile(r"\s*(?:" + "|".join(re.escape(name) for name in COMPOUND_GENRES) + r")|[^,]+")
+
+
+# Vinyls keep the comma joined genre string for display, the single genres are
+# stored in Genres/Vinyl_Genre (MariaDB) and in the genres array (MongoDB)
+def split_genres(genre):
+    names = (name.strip() for name in GENRE_NAMES.findall(str(genre or "")))
+    return list(dict.fromkeys(name for name in names if name))
@@ -0,0 +1,56 @@
+import os
+import threading
+
+from pymongo import ReturnDocument
+
+COUNTERS = "counters"
+
+
+def seed_counter(mongodb_connection, name, collection):
+    # raises the counter to the highest _id in the collection, never lowers it
+    last = mongodb_connection[collection].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    value = int(last["_id"]) if last else 0
+    mongodb_connection[COUNTERS].update_one({"_id": name}, {"$max": {"value": value}}, upsert=True)
+    return value
+
+
+class IdAllocator:
+    # hands out integer ids from blocks reserved with one atomic $inc on the counters
+    # collection, so only every block_size-th id costs a round trip. Ids of a block that
+    # is not used up before the worker exits are skipped, ids are unique but not gapless.
+    def __init__(self, block_size=20):
+        self.block_size = block_size
+        # counter name -> [next id, last id of the reserved block]
+        self._blocks = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def next_id(self, mongodb_connection, name, collection):
+        with self._lock:
+            if self._pid != os.getpid():
+                # a forked worker must not hand out the ids of its parent's blocks
+                self._blocks.clear()
+                self._pid = os.getpid()
+            block = self._blocks.get(name)
+            if block is None or block[0] > block[1]:
+                block = self._blocks[name] = self._reserve(mongodb_connection, name, collection)
+            block[0] += 1
+            return block[0] - 1
+
+    def _reserve(self, mongodb_connection, name, collection):
+        counters = mongodb_connection[COUNTERS]
+        counter = counters.find_one_and_update(
+            {"_id": name}, {"$inc": {"value": self.block_size}}, return_document=ReturnDocument.AFTER
+        )
+        if counter is None:
+            # databases filled before the counter existed start after their highest id
+            seed_counter(mongodb_connection, name, collection)
+            counter = counters.find_one_and_update(
+                {"_id": name}, {"$inc": {"value": self.block_size}}, return_document=ReturnDocument.AFTER
+            )
+        return [counter["value"] - self.block_size + 1, counter["value"]]
+
+    def discard(self, name):
+        # drops the current block, the next id is taken from a freshly reserved one
+        with self._lock:
+            self._blocks.pop(name, None)
@@ -6,17 +6,48 @@ from flask import current_app
 import json
 from flask import session
 import datetime
+import re
+from decimal import Decimal
+from .genres import split_genres
 
 
-def get_orders_for_user(mariadb_connection, user_id):
+def get_orders_for_user(mariadb_connection, user_id, limit=20, after=None):
+    # one page of the order history, newest first. after is the (order_date, order_id) of the last
+    # order of the previous page. The page is read from idx_orders_user_date before its lines are
+    # joined, so the cost does not grow with the length of the history.
     try:
         cursor = mariadb_connection.cursor(pymysql.cursors.DictCursor)
-        query = """
+        conditions = ["User_ID = %s"]
+        params = [user_id]
+        if after is not None:
+            after_date = datetime.date.fromisoformat(after[0][:10])
+            conditions.append("Order_Date <= %s AND (Order_Date < %s OR Order_ID < %s)")
+            params += [after_date, after_date, after[1]]
+        cursor.execute(
+            f"""
             SELECT
-                O.Order_ID AS order_id,
-                O.Order_Date AS order_date,
-                O.Zahlungsmethode AS payment_method,
-                O.Total_Price AS total_price,
+                Order_ID AS order_id,
+                Order_Date AS order_date,
+                Zahlungsmethode AS payment_method,
+                Total_Price AS total_price
+            FROM Orders
+            WHERE {" AND ".join(conditions)}
+            ORDER BY Order_Date DESC, Order_ID DESC
+            LIMIT %s
+            """,
+            params + [limit],
+        )
+        orders = {}
+        for row in cursor.fetchall():
+            orders[row["order_id"]] = dict(row, total_price=float(row["total_price"]), vinyls=[])
+        if not orders:
+            return []
+
+        placeholders = ", ".join(["%s"] * len(orders))
+        cursor.execute(
+            f"""
+            SELECT
+                OP.Order_ID AS order_id,
                 V.Vinyl_ID AS vinyl_id,
                 V.Vinyl_Name AS vinyl_title,
                 V.Price AS price,
@@ -26,45 +57,19 @@ def get_orders_for_user(mariadb_connection, user_id):
                 A.Artist_Name AS artist_name,
                 A.Nationality AS nationality,
                 OP.Amount AS amount
-            FROM Orders O
-            JOIN Order_Vinyl OP ON O.Order_ID = OP.Order_ID
+            FROM Order_Vinyl OP
             JOIN Vinyls V ON OP.Vinyl_ID = V.Vinyl_ID
             JOIN Artists A ON V.Artist_ID = A.Artist_ID
-            WHERE O.User_ID = %s
-            ORDER BY O.Order_Date DESC, O.Order_ID, V.Vinyl_Name;
-        """
-        cursor.execute(query, (user_id,))
-        results = cursor.fetchall()
-        current_app.logger.debug(f"Orders for user_id {user_id}: {results}")
-
-        orders = {}
-        for row in results:
-            order_id = row["order_id"]
-            if order_id not in orders:
-                orders[order_id] = {
-                    "order_id": order_id,
-                    "order_date": row["order_date"],
-                    "payment_method": row["payment_method"],
-                    "total_price": float(row["total_price"]),
-                    "vinyls": [],
-                }
-            orders[order_id]["vinyls"].append(
-                {
-                    "vinyl_id": row["vinyl_id"],
-                    "vinyl_title": row["vinyl_title"],
-                    "price": float(row["price"]),
-                    "cover_image": row["cover_image"],
-                    "amount": row["amount"],
-                    "release_date": row["release_date"],
-                    "genre": row["genre"],
-                    "artist_name": row["artist_name"],
-                    "nationality": row["nationality"],
-                }
-            )
-        orders_list = list(orders.values())
-
-        mariadb_connection.close()
-        return orders_list
+            WHERE OP.Order_ID IN ({placeholders})
+            ORDER BY V.Vinyl_Name
+            """,
+            list(orders),
+        )
+        for row in cursor.fetchall():
+            order_id = row.pop("order_id")
+            orders[order_id]["vinyls"].append(dict(row, price=float(row["price"])))
+        cursor.close()
+        return list(orders.values())
 
     except Exception as e:
         current_app.logger.info(f"Error querying user Orders: {e}")
@@ -94,9 +99,6 @@ def query_review_by_user(connection, user_id, vinyl_id):
         current_app.logger.debug(f"Error querying reviews: {e}")
         return None
 
-    finally:
-        connection.close()
-
 
 def insert_review_for_vinyl(connection, user_id, vinyl_id, rating, review_text):
     try:
@@ -112,7 +114,6 @@ def insert_review_for_vinyl(connection, user_id, vinyl_id, rating, review_text):
             f"Error isnerting into review user_id {user_id}, vinyl_id {vinyl_id} rating {rating}, review_text {review_text}: {e}"
         )
     finally:
-        connection.close()
         cursor.close()
 
 
@@ -136,7 +137,6 @@ def delete_review(connection, user_id, vinyl_id):
         return False
     finally:
         cursor.close()
-        connection.close()
 
 
 def insert_vinyl(connection, artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre):
@@ -146,12 +146,99 @@ def insert_vinyl(connection, artist_id, vinyl_name, vinyl_price, release_date, c
             VALUES (%s, %s, %s, %s, %s, %s)
         """
     cursor.execute(query, (artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre))
+    vinyl_id = cursor.lastrowid
+    link_vinyl_genres(cursor, vinyl_id, split_genres(genre))
     connection.commit()
     current_app.logger.debug("Vinyl inserted successfully with MariaDB.")
-    connection.close()
+    return vinyl_id
+
+
+def link_vinyl_genres(cursor, vinyl_id, genres):
+    for name in genres:
+        cursor.execute(
+            """
+            INSERT INTO Genres (Genre_Name, Vinyl_Count) VALUES (%s, 1)
+            ON DUPLICATE KEY UPDATE Vinyl_Count = Vinyl_Count + 1
+            """,
+            (name,),
+        )
+        cursor.execute(
+            "INSERT IGNORE INTO Vinyl_Genre (Genre_ID, Vinyl_ID) SELECT Genre_ID, %s FROM Genres WHERE Genre_Name = %s",
+            (vinyl_id, name),
+        )
+
+
+def query_genres(connection):
+    # facet counts are maintained on write, so the dropdown never scans Vinyls
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    cursor.execute(
+        "SELECT Genre_Name AS name, Vinyl_Count AS vinyl_count FROM Genres WHERE Vinyl_Count > 0 ORDER BY Genre_Name"
+    )
+    genres = cursor.fetchall()
+    cursor.close()
+    return genres
+
+
+# InnoDB does not index words shorter than innodb_ft_min_token_size (3) nor the words of
+# INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD, the Mongo search skips the same words
+FULLTEXT_MIN_TOKEN_SIZE = 3
+FULLTEXT_STOPWORDS = frozenset(
+    "a about an are as at be by com de en for from how i in is it la of on or that the this to was what when "
+    "where who will with und www".split()
+)
+
+
+def fulltext_terms(query):
+    words = [word for word in re.findall(r"\w+", query.lower()) if len(word) >= FULLTEXT_MIN_TOKEN_SIZE]
+    return " ".join(f"{word}*" for word in words)
 
 
 def search_vinyls(connection, query):
+    terms = fulltext_terms(query)
+    if not terms:
+        return search_vinyls_like(connection, query)
+
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    # one branch per FULLTEXT index, the scores of a vinyl matching in both are added up
+    cursor.execute(
+        """
+        SELECT 
+            v.Vinyl_ID AS vinyl_id, 
+            v.Vinyl_Name AS vinyl_title, 
+            v.Price AS price, 
+            v.Cover_Image AS cover_image, 
+            a.Artist_Name AS artist_name,
+            a.Artist_ID AS artist_id,
+            v.Release_Date AS release_date, 
+            v.Genre AS genre, 
+            a.Nationality AS nationality
+        FROM (
+            SELECT scored.Vinyl_ID, SUM(scored.score) AS relevance
+            FROM (
+                SELECT Vinyl_ID, MATCH(Vinyl_Name, Genre) AGAINST (%s IN BOOLEAN MODE) AS score
+                FROM Vinyls
+                WHERE MATCH(Vinyl_Name, Genre) AGAINST (%s IN BOOLEAN MODE)
+                UNION ALL
+                SELECT vv.Vinyl_ID, MATCH(aa.Artist_Name) AGAINST (%s IN BOOLEAN MODE) AS score
+                FROM Artists aa
+                JOIN Vinyls vv ON vv.Artist_ID = aa.Artist_ID
+                WHERE MATCH(aa.Artist_Name) AGAINST (%s IN BOOLEAN MODE)
+            ) scored
+            GROUP BY scored.Vinyl_ID
+            ORDER BY relevance DESC
+            LIMIT 20
+        ) m
+        JOIN Vinyls v ON v.Vinyl_ID = m.Vinyl_ID
+        JOIN Artists a ON v.Artist_ID = a.Artist_ID
+        ORDER BY m.relevance DESC;
+        """,
+        (terms, terms, terms, terms),
+    )
+    results = cursor.fetchall()
+    return results
+
+
+def search_vinyls_like(connection, query):
     cursor = connection.cursor(pymysql.cursors.DictCursor)
     cursor.execute(
         """
@@ -176,10 +263,15 @@ def search_vinyls(connection, query):
         (f"%{query}%", f"%{query}%", f"%{query}%"),
     )
     results = cursor.fetchall()
-    connection.close()
     return results
 
 
+# vinyl ids of one genre, a range read on the Vinyl_Genre primary key
+GENRE_VINYL_IDS = """
+    SELECT vg.Vinyl_ID FROM Vinyl_Genre vg JOIN Genres g ON g.Genre_ID = vg.Genre_ID WHERE g.Genre_Name = %s
+"""
+
+
 def search_vinyls_admin(connection, genre, artist, min_price, max_price, id):
     cursor = connection.cursor(pymysql.cursors.DictCursor)
     query = """
@@ -195,10 +287,13 @@ def search_vinyls_admin(connection, genre, artist, min_price, max_price, id):
             a.Nationality AS nationality
             FROM Vinyls v
             JOIN Artists a ON v.Artist_ID = a.Artist_ID
-            WHERE (%s = '' OR v.Genre LIKE %s)
-            AND (%s = '' OR a.Artist_Name LIKE %s)
+            WHERE (%s = '' OR a.Artist_Name LIKE %s)
         """
-    params = [genre, f"%{genre}%", artist, f"%{artist}%"]
+    params = [artist, f"%{artist}%"]
+
+    if genre:
+        query += f" AND v.Vinyl_ID IN ({GENRE_VINYL_IDS})"
+        params.append(genre)
 
     if min_price:
         query += " AND v.Price >= %s"
@@ -214,10 +309,8 @@ def search_vinyls_admin(connection, genre, artist, min_price, max_price, id):
     cursor.execute(query, params)
     vinyls = cursor.fetchall()
 
-    cursor.execute("SELECT DISTINCT Genre FROM Vinyls")
-    genres = [row["Genre"] for row in cursor.fetchall()]
-    connection.close()
-    return vinyls, genres
+    cursor.close()
+    return vinyls, query_genres(connection)
 
 
 def handle_login(connection, email, password):
@@ -250,7 +343,15 @@ def handle_login(connection, email, password):
         current_app.logger.debug("Invalid email or password!")
 
 
-def query_vinyls(connection, limit):
+def query_vinyl_ids(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT Vinyl_ID FROM Vinyls")
+    vinyl_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return vinyl_ids
+
+
+def query_all_vinyls(connection):
     cursor = connection.cursor(pymysql.cursors.DictCursor)
     cursor.execute(
         """
@@ -266,13 +367,117 @@ def query_vinyls(connection, limit):
             a.Nationality AS nationality
         FROM Vinyls v
         JOIN Artists a ON v.Artist_ID = a.Artist_ID
-        ORDER BY RAND()
+        ORDER BY v.Vinyl_ID
+        """
+    )
+    vinyls = cursor.fetchall()
+    cursor.close()
+    return vinyls
+
+
+def query_vinyls_by_ids(connection, vinyl_ids):
+    if not vinyl_ids:
+        return []
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    placeholders = ", ".join(["%s"] * len(vinyl_ids))
+    cursor.execute(
+        f"""
+        SELECT 
+            v.Vinyl_ID AS vinyl_id, 
+            v.Vinyl_Name AS vinyl_title, 
+            v.Price AS price, 
+            v.Cover_Image AS cover_image, 
+            a.Artist_Name AS artist_name,
+            a.Artist_ID AS artist_id,
+            v.Release_Date AS release_date, 
+            v.Genre AS genre, 
+            a.Nationality AS nationality
+        FROM Vinyls v
+        JOIN Artists a ON v.Artist_ID = a.Artist_ID
+        WHERE v.Vinyl_ID IN ({placeholders})
+        """,
+        list(vinyl_ids),
+    )
+    vinyls_by_id = {vinyl["vinyl_id"]: vinyl for vinyl in cursor.fetchall()}
+    cursor.close()
+    # keep the random order of the sample, ids deleted since the last refresh are skipped
+    return [vinyls_by_id[vinyl_id] for vinyl_id in vinyl_ids if vinyl_id in vinyls_by_id]
+
+
+PAGE_SORT_COLUMNS = {"id": "v.Vinyl_ID", "price": "v.Price", "release_date": "v.Release_Date"}
+
+
+def query_vinyls_page(
+    connection,
+    limit,
+    sort="id",
+    descending=False,
+    after=None,
+    genre=None,
+    artist_id=None,
+    min_price=None,
+    max_price=None,
+):
+    column = PAGE_SORT_COLUMNS[sort]
+    operator = "<" if descending else ">"
+    direction = "DESC" if descending else "ASC"
+
+    conditions = []
+    params = []
+    source = "Vinyls v"
+    id_column = "v.Vinyl_ID"
+    if genre:
+        # genre pages start from Vinyl_Genre, id ordered pages are range reads on its (Genre_ID, Vinyl_ID) key
+        source = "Genres g JOIN Vinyl_Genre vg ON vg.Genre_ID = g.Genre_ID JOIN Vinyls v ON v.Vinyl_ID = vg.Vinyl_ID"
+        id_column = "vg.Vinyl_ID"
+        conditions.append("g.Genre_Name = %s")
+        params.append(genre)
+    if artist_id is not None:
+        conditions.append("v.Artist_ID = %s")
+        params.append(artist_id)
+    if min_price is not None:
+        conditions.append("v.Price >= %s")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("v.Price <= %s")
+        params.append(max_price)
+    if after is not None:
+        # keyset condition, the index seeks straight to the last row of the previous page
+        value, vinyl_id = after
+        if sort == "id":
+            conditions.append(f"{id_column} {operator} %s")
+            params.append(vinyl_id)
+        else:
+            if sort == "price":
+                value = Decimal(value)
+            conditions.append(f"({column} {operator} %s OR ({column} = %s AND {id_column} {operator} %s))")
+            params.extend([value, value, vinyl_id])
+
+    order_by = f"{id_column} {direction}" if sort == "id" else f"{column} {direction}, {id_column} {direction}"
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    cursor.execute(
+        f"""
+        SELECT 
+            v.Vinyl_ID AS vinyl_id, 
+            v.Vinyl_Name AS vinyl_title, 
+            v.Price AS price, 
+            v.Cover_Image AS cover_image, 
+            a.Artist_Name AS artist_name,
+            a.Artist_ID AS artist_id,
+            v.Release_Date AS release_date, 
+            v.Genre AS genre, 
+            a.Nationality AS nationality
+        FROM {source}
+        JOIN Artists a ON v.Artist_ID = a.Artist_ID
+        {where}
+        ORDER BY {order_by}
         LIMIT %s
         """,
-        (limit,),
+        params + [limit],
     )
     vinyls = cursor.fetchall()
-    connection.close()
+    cursor.close()
     return vinyls
 
 
@@ -338,7 +543,6 @@ def fetch_reviews_summary(mariadb_connection, start_date=None, end_date=None):
 
     finally:
         cursor.close()
-        mariadb_connection.close()
 
 
 def get_users(mariadb_connection):
@@ -410,10 +614,10 @@ def buy_vinyl(mariadb_connection, user_id, vinyl_id, amount=1):
         order_id = cursor.lastrowid
 
         query = """
-            INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount)
-            VALUES (%s, %s, %s)
+            INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount, Unit_Price)
+            VALUES (%s, %s, %s, %s)
         """
-        cursor.execute(query, (order_id, vinyl_id, amount))
+        cursor.execute(query, (order_id, vinyl_id, amount, vinyl_price))
 
         mariadb_connection.commit()
 
@@ -428,55 +632,192 @@ def buy_vinyl(mariadb_connection, user_id, vinyl_id, amount=1):
     finally:
         if cursor:
             cursor.close()
-        if mariadb_connection:
-            mariadb_connection.close()
 
 
-def get_purchase_overview(mariadb_connection, artist_name=None, start_date=None, end_date=None, genre=None):
+def checkout(mariadb_connection, user_id, items):
+    # items maps vinyl id -> amount, the whole cart is one order written in one transaction
+    cursor = None
     try:
         cursor = mariadb_connection.cursor(pymysql.cursors.DictCursor)
+        placeholders = ", ".join(["%s"] * len(items))
+        cursor.execute(f"SELECT Vinyl_ID, Price FROM Vinyls WHERE Vinyl_ID IN ({placeholders})", list(items))
+        prices = {row["Vinyl_ID"]: row["Price"] for row in cursor.fetchall()}
+        missing = [vinyl_id for vinyl_id in items if vinyl_id not in prices]
+        if missing:
+            current_app.logger.error(f"Vinyls {missing} not found.")
+            return {"error": f"Vinyls not found: {missing}"}
+
+        total_price = sum(prices[vinyl_id] * amount for vinyl_id, amount in items.items())
+        cursor.execute(
+            """
+            INSERT INTO Orders (User_ID, Order_Date, Zahlungsmethode, Total_Price)
+            VALUES (%s, CURDATE(), %s, %s)
+            """,
+            (user_id, "Kreditkarte", total_price),
+        )
+        order_id = cursor.lastrowid
 
-        query_summary = """
-            SELECT
-                v.Genre,
-                COUNT(DISTINCT v.Vinyl_ID) AS vinyl_count,
-                SUM(ov.Amount) AS total_purchase,
-                SUM(ov.Amount * v.Price) AS total_revenue
-            FROM Vinyls v
-            JOIN Artists a ON v.Artist_ID = a.Artist_ID
-            JOIN Order_Vinyl ov ON v.Vinyl_ID = ov.Vinyl_ID
-            JOIN Orders o ON ov.Order_ID = o.Order_ID
-            WHERE (%s IS NULL OR a.Artist_Name = %s)
-            AND (%s IS NULL OR o.Order_Date BETWEEN %s AND %s)
-            AND (%s IS NULL OR v.Genre = %s)
-            GROUP BY v.Genre
-            ORDER BY total_purchase DESC;
-        """
-        params_summary = [artist_name, artist_name, start_date, start_date, end_date, genre, genre]
-        cursor.execute(query_summary, params_summary)
-        summary_data = cursor.fetchall()
+        # pymysql sends executemany of an INSERT ... VALUES as one multi-row statement
+        cursor.executemany(
+            "INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount, Unit_Price) VALUES (%s, %s, %s, %s)",
+            [(order_id, vinyl_id, amount, prices[vinyl_id]) for vinyl_id, amount in items.items()],
+        )
+        mariadb_connection.commit()
+        return {"success": f"Order {order_id} placed successfully", "order_id": order_id}
+
+    except Exception as e:
+        mariadb_connection.rollback()
+        current_app.logger.error(f"Error checking out cart: {e}")
+        return {"error": str(e)}
+
+    finally:
+        if cursor:
+            cursor.close()
 
-        query_details = """
+
+def place_orders(mariadb_connection, orders):
+    # journaled orders in one transaction. An order the database refuses (a deleted customer, an amount
+    # out of range) fails the whole transaction, the batch is then written order by order and only the
+    # refused orders are reported as failed. Other errors propagate so the journal keeps the batch.
+    try:
+        return _place_orders(mariadb_connection, orders)
+    except (pymysql.err.IntegrityError, pymysql.err.DataError) as e:
+        current_app.logger.warning(f"Writing {len(orders)} journaled orders failed, writing them one by one: {e}")
+
+    placed = 0
+    rejected = []
+    failed = {}
+    for order in orders:
+        try:
+            result = _place_orders(mariadb_connection, [order])
+        except (pymysql.err.IntegrityError, pymysql.err.DataError) as e:
+            failed[order["token"]] = str(e)
+            continue
+        placed += result["placed"]
+        rejected += result["rejected"]
+    return {"placed": placed, "rejected": rejected, "failed": failed}
+
+
+def _place_orders(mariadb_connection, orders):
+    # tokens found in Order_Journal were committed before a crash and are skipped
+    cursor = mariadb_connection.cursor(pymysql.cursors.DictCursor)
+    try:
+        placeholders = ", ".join(["%s"] * len(orders))
+        cursor.execute(
+            f"SELECT Token FROM Order_Journal WHERE Token IN ({placeholders})", [order["token"] for order in orders]
+        )
+        committed = {row["Token"] for row in cursor.fetchall()}
+        vinyl_ids = list({vinyl_id for order in orders for vinyl_id in order["items"]})
+        placeholders = ", ".join(["%s"] * len(vinyl_ids))
+        cursor.execute(f"SELECT Vinyl_ID, Price FROM Vinyls WHERE Vinyl_ID IN ({placeholders})", vinyl_ids)
+        prices = {row["Vinyl_ID"]: row["Price"] for row in cursor.fetchall()}
+
+        lines = []
+        tokens = []
+        rejected = []
+        for order in orders:
+            if order["token"] in committed:
+                continue
+            if any(vinyl_id not in prices for vinyl_id in order["items"]):
+                rejected.append(order["token"])
+                continue
+            total_price = sum(prices[vinyl_id] * amount for vinyl_id, amount in order["items"].items())
+            cursor.execute(
+                """
+                INSERT INTO Orders (User_ID, Order_Date, Zahlungsmethode, Total_Price)
+                VALUES (%s, CURDATE(), %s, %s)
+                """,
+                (order["user_id"], "Kreditkarte", total_price),
+            )
+            order_id = cursor.lastrowid
+            lines += [(order_id, vinyl_id, amount, prices[vinyl_id]) for vinyl_id, amount in order["items"].items()]
+            tokens.append((order["token"], order_id))
+        if tokens:
+            cursor.executemany(
+                "INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount, Unit_Price) VALUES (%s, %s, %s, %s)", lines
+            )
+            cursor.executemany("INSERT INTO Order_Journal (Token, Order_ID) VALUES (%s, %s)", tokens)
+        mariadb_connection.commit()
+        return {"placed": len(tokens) + len(committed), "rejected": rejected, "failed": {}}
+
+    except Exception:
+        mariadb_connection.rollback()
+        raise
+
+    finally:
+        cursor.close()
+
+
+def get_purchase_overview(mariadb_connection, artist_name=None, start_date=None, end_date=None, genre=None):
+    # one pass over the join: WITH ROLLUP adds a subtotal row per genre (Vinyl_ID NULL) and a grand
+    # total as the last row to the per vinyl rows. MariaDB does not allow ORDER BY next to ROLLUP,
+    # both lists are sorted here.
+    cursor = None
+    try:
+        cursor = mariadb_connection.cursor(pymysql.cursors.DictCursor)
+        conditions = []
+        params = []
+        if artist_name:
+            conditions.append("a.Artist_Name = %s")
+            params.append(artist_name)
+        if start_date:
+            conditions.append("o.Order_Date >= %s")
+            params.append(start_date)
+        if end_date:
+            conditions.append("o.Order_Date <= %s")
+            params.append(end_date)
+        if genre:
+            # every vinyl listed under the genre, not only those whose genre string is just that genre
+            conditions.append(f"v.Vinyl_ID IN ({GENRE_VINYL_IDS})")
+            params.append(genre)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor.execute(
+            f"""
             SELECT
-                v.Vinyl_Name,
-                a.Artist_Name,
                 v.Genre,
+                v.Vinyl_ID,
+                MAX(v.Vinyl_Name) AS Vinyl_Name,
+                MAX(a.Artist_Name) AS Artist_Name,
                 SUM(ov.Amount) AS Total_Sales,
                 SUM(ov.Amount * v.Price) AS Total_Revenue
-            FROM Vinyls v
-            JOIN Artists a ON v.Artist_ID = a.Artist_ID
-            JOIN Order_Vinyl ov ON v.Vinyl_ID = ov.Vinyl_ID
+            FROM Order_Vinyl ov
             JOIN Orders o ON ov.Order_ID = o.Order_ID
-            WHERE (%s IS NULL OR a.Artist_Name = %s)
-            AND (%s IS NULL OR o.Order_Date BETWEEN %s AND %s)
-            AND (%s IS NULL OR v.Genre = %s)
-            GROUP BY v.Vinyl_ID, a.Artist_Name
-            ORDER BY Total_Sales DESC;
-        """
-        params_details = [artist_name, artist_name, start_date, start_date, end_date, genre, genre]
-        cursor.execute(query_details, params_details)
-        details_data = cursor.fetchall()
-
+            JOIN Vinyls v ON v.Vinyl_ID = ov.Vinyl_ID
+            JOIN Artists a ON v.Artist_ID = a.Artist_ID
+            {where}
+            GROUP BY v.Genre, v.Vinyl_ID WITH ROLLUP
+            """,
+            params,
+        )
+        rows = cursor.fetchall()[:-1]
+
+        summary_data = []
+        details_data = []
+        vinyl_counts = {}
+        for row in rows:
+            if row["Vinyl_ID"] is None:
+                summary_data.append(
+                    {
+                        "Genre": row["Genre"],
+                        "total_purchase": row["Total_Sales"],
+                        "total_revenue": row["Total_Revenue"],
+                    }
+                )
+            else:
+                vinyl_counts[row["Genre"]] = vinyl_counts.get(row["Genre"], 0) + 1
+                details_data.append(
+                    {
+                        "Vinyl_Name": row["Vinyl_Name"],
+                        "Artist_Name": row["Artist_Name"],
+                        "Genre": row["Genre"],
+                        "Total_Sales": row["Total_Sales"],
+                        "Total_Revenue": row["Total_Revenue"],
+                    }
+                )
+        for summary in summary_data:
+            summary["vinyl_count"] = vinyl_counts.get(summary["Genre"], 0)
+        summary_data.sort(key=lambda summary: summary["total_purchase"], reverse=True)
+        details_data.sort(key=lambda detail: detail["Total_Sales"], reverse=True)
         return summary_data, details_data
 
     except Exception as e:
@@ -484,4 +825,5 @@ def get_purchase_overview(mariadb_connection, artist_name=None, start_date=None,
         return [], []
 
     finally:
-        cursor.close()
+        if cursor:
+            cursor.close()
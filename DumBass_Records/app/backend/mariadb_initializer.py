@@ -1,9 +1,11 @@
 import pymysql
 import app.app
 import sys
-import mariadb
 from pymongo import MongoClient
 from .data.api_extractor import get_data_from_api
+from . import backend_state
+from . import mariadb_migrations
+from .genres import split_genres
 import os
 import json
 from flask import current_app
@@ -20,7 +22,8 @@ def create_tables(mariadb_connection):
             CREATE TABLE IF NOT EXISTS Artists (
                 Artist_ID INT PRIMARY KEY AUTO_INCREMENT,
                 Artist_Name VARCHAR(255) NOT NULL,
-                Nationality VARCHAR(255) NOT NULL
+                Nationality VARCHAR(255) NOT NULL,
+                FULLTEXT INDEX ft_artists_name (Artist_Name)
             );
             """
         )
@@ -36,12 +39,41 @@ def create_tables(mariadb_connection):
                 Release_Date DATE NOT NULL,
                 Cover_Image VARCHAR(255),
                 Genre VARCHAR(255) NOT NULL,
-                FOREIGN KEY (Artist_ID) REFERENCES Artists(Artist_ID)
+                FOREIGN KEY (Artist_ID) REFERENCES Artists(Artist_ID),
+                FULLTEXT INDEX ft_vinyls_name_genre (Vinyl_Name, Genre),
+                INDEX idx_vinyls_price (Price),
+                INDEX idx_vinyls_release_date (Release_Date)
             );
             """
         )
         current_app.logger.debug("Table 'Vinyl' created successfully.")
 
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS Genres (
+                Genre_ID INT PRIMARY KEY AUTO_INCREMENT,
+                Genre_Name VARCHAR(255) NOT NULL,
+                Vinyl_Count INT NOT NULL DEFAULT 0,
+                UNIQUE INDEX idx_genres_name (Genre_Name)
+            );
+            """
+        )
+        current_app.logger.debug("Table 'Genres' created successfully.")
+
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS Vinyl_Genre (
+                Genre_ID INT NOT NULL,
+                Vinyl_ID INT NOT NULL,
+                PRIMARY KEY (Genre_ID, Vinyl_ID),
+                INDEX idx_vinyl_genre_vinyl (Vinyl_ID),
+                FOREIGN KEY (Genre_ID) REFERENCES Genres(Genre_ID),
+                FOREIGN KEY (Vinyl_ID) REFERENCES Vinyls(Vinyl_ID) ON DELETE CASCADE
+            );
+            """
+        )
+        current_app.logger.debug("Table 'Vinyl_Genre' created successfully.")
+
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS Users (
@@ -141,6 +173,9 @@ def create_tables(mariadb_connection):
 
         current_app.logger.debug("Table 'Referrals' created successfully.")
 
+        cursor.execute(backend_state.CREATE_TABLE)
+        current_app.logger.debug("Table 'Backend_State' created successfully.")
+
         cursor.execute(
             """
             CREATE TRIGGER Rabatt_Nach_Empfehlung
@@ -164,63 +199,7 @@ def create_tables(mariadb_connection):
             """
         )
         current_app.logger.debug("Trigger 'Rabatt_Nach_Empfehlung' created successfully.")
-
-        cursor.execute(
-            """
-            CREATE TRIGGER after_order_vinyl_insert
-            AFTER INSERT ON Order_Vinyl
-            FOR EACH ROW
-            BEGIN
-                UPDATE Orders
-                SET Total_Price = (
-                    SELECT IFNULL(SUM(v.Price * ov.Amount), 0)
-                    FROM Order_Vinyl ov
-                    JOIN Vinyls v ON ov.Vinyl_ID = v.Vinyl_ID
-                    WHERE ov.Order_ID = NEW.Order_ID
-                )
-                WHERE Orders.Order_ID = NEW.Order_ID;
-            END;
-            """
-        )
-        current_app.logger.debug("Trigger 'after_order_vinyl_insert' created successfully.")
-
-        cursor.execute(
-            """
-            CREATE TRIGGER after_order_vinyl_update
-            AFTER UPDATE ON Order_Vinyl
-            FOR EACH ROW
-            BEGIN
-                UPDATE Orders
-                SET Total_Price = (
-                    SELECT IFNULL(SUM(v.Price * ov.Amount), 0)
-                    FROM Order_Vinyl ov
-                    JOIN Vinyls v ON ov.Vinyl_ID = v.Vinyl_ID
-                    WHERE ov.Order_ID = NEW.Order_ID
-                )
-                WHERE Orders.Order_ID = NEW.Order_ID;
-            END;
-            """
-        )
-        current_app.logger.debug("Trigger 'after_order_vinyl_update' created successfully.")
-
-        cursor.execute(
-            """
-            CREATE TRIGGER after_order_vinyl_delete
-            AFTER DELETE ON Order_Vinyl
-            FOR EACH ROW
-            BEGIN
-                UPDATE Orders
-                SET Total_Price = (
-                    SELECT IFNULL(SUM(v.Price * ov.Amount), 0)
-                    FROM Order_Vinyl ov
-                    JOIN Vinyls v ON ov.Vinyl_ID = v.Vinyl_ID
-                    WHERE ov.Order_ID = OLD.Order_ID
-                )
-                WHERE Orders.Order_ID = OLD.Order_ID;
-            END;
-            """
-        )
-        current_app.logger.debug("Trigger 'after_order_vinyl_delete' created successfully.")
+        # order totals are computed by the code inserting the order, order_totals checks them
 
         mariadb_connection.commit()
 
@@ -275,6 +254,10 @@ def fill_artists(mariadb_connection):
         current_app.logger.info(f"Error inserting artists: {e}")
 
 
+# artist lookup per release while filling Vinyls, checked by mariadb_migrations.HOT_QUERIES
+ARTIST_ID_BY_NAME = "SELECT artist_id FROM Artists WHERE artist_name = %s"
+
+
 def fill_vinyls(mariadb_connection):
     try:
         file_path = os.path.join(os.path.dirname(__file__), "data/releases.json")
@@ -282,6 +265,7 @@ def fill_vinyls(mariadb_connection):
             releases = json.load(file)
 
         cursor = mariadb_connection.cursor()
+        vinyl_genres = []
         for release in releases.get("releases", []):
             artist_name = release.get("artist")
             title = release.get("title")[:255]
@@ -291,12 +275,7 @@ def fill_vinyls(mariadb_connection):
 
             release_date = f"{year}-01-01" if year != "Unknown" else "1999-09-09"
 
-            cursor.execute(
-                """
-                SELECT artist_id FROM Artists WHERE artist_name = %s
-                """,
-                (artist_name,),
-            )
+            cursor.execute(ARTIST_ID_BY_NAME, (artist_name,))
             result = cursor.fetchone()
             if result:
                 artist_id = result[0]
@@ -308,7 +287,9 @@ def fill_vinyls(mariadb_connection):
                     """,
                     (artist_id, title, price, release_date, cover_image, genre),
                 )
+                vinyl_genres.append((cursor.lastrowid, split_genres(genre)))
 
+        fill_genres(cursor, vinyl_genres)
         mariadb_connection.commit()
         current_app.logger.debug("Vinyls inserted successfully.")
 
@@ -316,6 +297,27 @@ def fill_vinyls(mariadb_connection):
         current_app.logger.info(f"Error inserting vinyls: {e}")
 
 
+def fill_genres(cursor, vinyl_genres):
+    names = sorted({name for _, genres in vinyl_genres for name in genres})
+    if not names:
+        return
+    cursor.executemany("INSERT IGNORE INTO Genres (Genre_Name) VALUES (%s)", [(name,) for name in names])
+    cursor.execute("SELECT Genre_ID, Genre_Name FROM Genres")
+    genre_ids = {name.lower(): genre_id for genre_id, name in cursor.fetchall()}
+    cursor.executemany(
+        "INSERT IGNORE INTO Vinyl_Genre (Genre_ID, Vinyl_ID) VALUES (%s, %s)",
+        [(genre_ids[name.lower()], vinyl_id) for vinyl_id, genres in vinyl_genres for name in genres],
+    )
+    # Vinyl_Count is the facet count behind the genre dropdown, kept up to date by insert_vinyl
+    cursor.execute(
+        """
+        UPDATE Genres g
+        SET Vinyl_Count = (SELECT COUNT(*) FROM Vinyl_Genre vg WHERE vg.Genre_ID = g.Genre_ID)
+        """
+    )
+    current_app.logger.debug(f"Linked vinyls to {len(names)} genres.")
+
+
 def fill_users(mariadb_connection):
     faker = Faker()
     cursor = mariadb_connection.cursor()
@@ -416,60 +418,61 @@ def insert_TestUser_data(mariadb_connection):
 
         cursor.execute(
             """
-            SELECT Vinyl_ID
+            SELECT Vinyl_ID, Price
             FROM Vinyls
             LIMIT 4
             """
         )
         vinyl_row = cursor.fetchall()
         vinyl_ids = [row[0] for row in vinyl_row]
+        prices = [row[1] for row in vinyl_row]
 
         cursor.execute(
             """
             INSERT INTO Orders (User_ID, Order_Date, Zahlungsmethode, Total_Price)
-            VALUES (%s, CURDATE(), %s, 0.00)
+            VALUES (%s, CURDATE(), %s, %s)
             """,
-            (user_id, "ApplePay"),
+            (user_id, "ApplePay", prices[0] * 1 + prices[1] * 3),
         )
         order_id_1 = cursor.lastrowid
 
         cursor.execute(
             """
-            INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount)
-            VALUES (%s, %s, %s)
+            INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount, Unit_Price)
+            VALUES (%s, %s, %s, %s)
             """,
-            (order_id_1, vinyl_ids[0], 1),
+            (order_id_1, vinyl_ids[0], 1, prices[0]),
         )
         cursor.execute(
             """
-            INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount)
-            VALUES (%s, %s, %s)
+            INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount, Unit_Price)
+            VALUES (%s, %s, %s, %s)
             """,
-            (order_id_1, vinyl_ids[1], 3),
+            (order_id_1, vinyl_ids[1], 3, prices[1]),
         )
 
         cursor.execute(
             """
             INSERT INTO Orders (User_ID, Order_Date, Zahlungsmethode, Total_Price)
-            VALUES (%s, CURDATE(), %s, 0.00)
+            VALUES (%s, CURDATE(), %s, %s)
             """,
-            (user_id, "Klarna"),
+            (user_id, "Klarna", prices[2] + prices[3]),
         )
         order_id_2 = cursor.lastrowid
 
         cursor.execute(
             """
-            INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount)
-            VALUES (%s, %s, %s)
+            INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount, Unit_Price)
+            VALUES (%s, %s, %s, %s)
             """,
-            (order_id_2, vinyl_ids[2], 1),
+            (order_id_2, vinyl_ids[2], 1, prices[2]),
         )
         cursor.execute(
             """
-            INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount)
-            VALUES (%s, %s, %s)
+            INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount, Unit_Price)
+            VALUES (%s, %s, %s, %s)
             """,
-            (order_id_2, vinyl_ids[3], 1),
+            (order_id_2, vinyl_ids[3], 1, prices[3]),
         )
 
         cursor.execute(
@@ -557,6 +560,8 @@ def insert_random_reviews(mariadb_connection):
 def erase_and_fill_maria_db(mariadb_connection):
     delete_database(mariadb_connection)
     create_tables(mariadb_connection)
+    # secondary indexes before the fill, fill_vinyls looks up every artist by name
+    mariadb_migrations.apply_migrations(mariadb_connection)
     fill_artists(mariadb_connection)
     fill_vinyls(mariadb_connection)
     fill_users(mariadb_connection)
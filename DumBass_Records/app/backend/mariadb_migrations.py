@@ -0,0 +1,248 @@
+import pymysql
+from flask import current_app
+
+from app.backend import backend_state
+from app.backend import mariadb_handler
+from app.backend import mariadb_initializer
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS Schema_Migrations (
+        Version INT PRIMARY KEY,
+        Name VARCHAR(255) NOT NULL,
+        Applied_At DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+# (version, name, statements), append new entries and never edit applied ones. The
+# statements use IF [NOT] EXISTS so a migration interrupted between its DDL and its
+# Schema_Migrations row can simply run again.
+MIGRATIONS = (
+    (1, "users_email", ("CREATE INDEX IF NOT EXISTS idx_users_email ON Users (User_Email)",)),
+    (2, "artists_name", ("CREATE INDEX IF NOT EXISTS idx_artists_name ON Artists (Artist_Name)",)),
+    (3, "orders_user_date", ("CREATE INDEX IF NOT EXISTS idx_orders_user_date ON Orders (User_ID, Order_Date)",)),
+    (4, "reviews_date", ("CREATE INDEX IF NOT EXISTS idx_reviews_date ON Reviews (Review_Date)",)),
+    (5, "vinyls_genre_price", ("CREATE INDEX IF NOT EXISTS idx_vinyls_genre_price ON Vinyls (Genre, Price)",)),
+    (
+        6,
+        "drop_order_vinyl_triggers",
+        (
+            "DROP TRIGGER IF EXISTS after_order_vinyl_insert",
+            "DROP TRIGGER IF EXISTS after_order_vinyl_update",
+            "DROP TRIGGER IF EXISTS after_order_vinyl_delete",
+        ),
+    ),
+    (
+        7,
+        "order_journal",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS Order_Journal (
+                Token CHAR(32) PRIMARY KEY,
+                Order_ID INT NOT NULL,
+                FOREIGN KEY (Order_ID) REFERENCES Orders(Order_ID) ON DELETE CASCADE
+            )
+            """,
+        ),
+    ),
+    (
+        8,
+        "backend_state_catalog_version",
+        (
+            backend_state.CREATE_TABLE,
+            "ALTER TABLE Backend_State ADD COLUMN IF NOT EXISTS Catalog_Version INT NOT NULL DEFAULT 0",
+        ),
+    ),
+    (
+        9,
+        "compound_genres",
+        (
+            # genre filters go through Vinyl_Genre, nothing reads (Genre, Price) any more
+            "DROP INDEX IF EXISTS idx_vinyls_genre_price ON Vinyls",
+            # "Folk, World, & Country" was split at its commas into three genres
+            "INSERT IGNORE INTO Genres (Genre_Name) VALUES ('Folk, World, & Country')",
+            """
+            INSERT IGNORE INTO Vinyl_Genre (Genre_ID, Vinyl_ID)
+            SELECT g.Genre_ID, v.Vinyl_ID
+            FROM Vinyls v
+            JOIN Genres g ON g.Genre_Name = 'Folk, World, & Country'
+            WHERE v.Genre LIKE '%Folk, World, & Country%'
+            """,
+            """
+            DELETE vg FROM Vinyl_Genre vg
+            JOIN Genres g ON g.Genre_ID = vg.Genre_ID
+            JOIN Vinyls v ON v.Vinyl_ID = vg.Vinyl_ID
+            WHERE g.Genre_Name IN ('Folk', 'World', '& Country') AND v.Genre LIKE '%Folk, World, & Country%'
+            """,
+            "UPDATE Genres g SET Vinyl_Count = (SELECT COUNT(*) FROM Vinyl_Genre vg WHERE vg.Genre_ID = g.Genre_ID)",
+        ),
+    ),
+    (
+        10,
+        "order_unit_prices",
+        (
+            # order_totals checks a total against the prices its lines were sold at, not the current ones
+            "ALTER TABLE Order_Vinyl ADD COLUMN IF NOT EXISTS Unit_Price DECIMAL(10, 2) NULL",
+            "ALTER TABLE Orders ADD COLUMN IF NOT EXISTS Referral_Discount BOOLEAN NOT NULL DEFAULT FALSE",
+            # earlier lines are priced like the dropped triggers last summed them
+            """
+            UPDATE Order_Vinyl ov
+            JOIN Vinyls v ON v.Vinyl_ID = ov.Vinyl_ID
+            SET ov.Unit_Price = v.Price
+            WHERE ov.Unit_Price IS NULL
+            """,
+            # and an earlier order whose total only fits the discounted sum was discounted
+            """
+            UPDATE Orders o
+            JOIN (SELECT Order_ID, SUM(Unit_Price * Amount) AS Line_Total FROM Order_Vinyl GROUP BY Order_ID) l
+                ON l.Order_ID = o.Order_ID
+            SET o.Referral_Discount = TRUE
+            WHERE o.Total_Price <> l.Line_Total AND o.Total_Price = ROUND(l.Line_Total * 0.931, 2)
+            """,
+            "DROP TRIGGER IF EXISTS Rabatt_Nach_Empfehlung",
+            """
+            CREATE TRIGGER Rabatt_Nach_Empfehlung
+            BEFORE INSERT ON Orders
+            FOR EACH ROW
+            BEGIN
+                IF EXISTS (
+                    SELECT 1
+                    FROM Referrals
+                    WHERE User_ID = NEW.User_ID
+                      AND Referral_Count > 0
+                ) THEN
+                    SET NEW.Total_Price = NEW.Total_Price * 0.931;
+                    SET NEW.Referral_Discount = TRUE;
+                    UPDATE Referrals
+                    SET Referral_Count = Referral_Count - 1
+                    WHERE User_ID = NEW.User_ID
+                      AND Referral_Count > 0
+                    LIMIT 1;
+                END IF;
+            END
+            """,
+        ),
+    ),
+)
+
+# hot queries of mariadb_handler and mariadb_initializer: (name, table aliases that must be read
+# through an index, call). The call runs the real handler code, every SELECT it executes is
+# EXPLAINed with the parameters it was executed with.
+HOT_QUERIES = (
+    ("handle_login", ("Users",), lambda connection: mariadb_handler.handle_login(connection, "user@user.com", "")),
+    (
+        "fill_vinyls artist lookup",
+        ("Artists",),
+        lambda connection: connection.cursor().execute(mariadb_initializer.ARTIST_ID_BY_NAME, ("Queen",)),
+    ),
+    (
+        "get_orders_for_user",
+        ("Orders", "OP"),
+        lambda connection: mariadb_handler.get_orders_for_user(connection, 1, 20, ("2100-01-01", 2**31 - 1)),
+    ),
+    (
+        "fetch_reviews_summary",
+        ("r",),
+        lambda connection: mariadb_handler.fetch_reviews_summary(connection, "2100-01-01", "2100-01-31"),
+    ),
+    (
+        "search_vinyls_admin by genre and price",
+        ("g", "vg"),
+        lambda connection: mariadb_handler.search_vinyls_admin(connection, "Rock", "", None, 25, None),
+    ),
+    (
+        "get_purchase_overview by artist",
+        ("a",),
+        lambda connection: mariadb_handler.get_purchase_overview(connection, "Queen"),
+    ),
+    (
+        "get_purchase_overview by genre",
+        ("g", "vg"),
+        lambda connection: mariadb_handler.get_purchase_overview(connection, genre="Rock"),
+    ),
+    (
+        "query_vinyls_page by genre",
+        ("g", "vg"),
+        lambda connection: mariadb_handler.query_vinyls_page(connection, 21, genre="Rock", after=(None, 1)),
+    ),
+)
+
+
+class RecordingCursor:
+    def __init__(self, cursor, statements):
+        self._cursor = cursor
+        self._statements = statements
+
+    def execute(self, query, args=None):
+        self._statements.append((query, args))
+        return self._cursor.execute(query, args)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+
+class RecordingConnection:
+    # hands out cursors that keep every statement executed through them
+    def __init__(self, connection):
+        self._connection = connection
+        self.statements = []
+
+    def cursor(self, *args):
+        return RecordingCursor(self._connection.cursor(*args), self.statements)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def applied_versions(mariadb_connection):
+    with mariadb_connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        cursor.execute("SELECT Version FROM Schema_Migrations")
+        versions = {row[0] for row in cursor.fetchall()}
+    mariadb_connection.commit()
+    return versions
+
+
+def apply_migrations(mariadb_connection):
+    applied = applied_versions(mariadb_connection)
+    pending = [migration for migration in MIGRATIONS if migration[0] not in applied]
+    for version, name, statements in pending:
+        current_app.logger.info(f"Applying schema migration {version} ({name}).")
+        with mariadb_connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO Schema_Migrations (Version, Name) VALUES (%s, %s)", (version, name))
+        mariadb_connection.commit()
+    return [version for version, _, _ in pending]
+
+
+def explain_hot_query(mariadb_connection, name, tables, call):
+    # uses_index is False when one of the tables is read with a full scan, or the call ran no query
+    recording = RecordingConnection(mariadb_connection)
+    call(recording)
+    mariadb_connection.rollback()
+    selects = [(query, args) for query, args in recording.statements if query.lstrip().upper().startswith("SELECT")]
+    rows = []
+    with mariadb_connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        for query, args in selects:
+            cursor.execute(f"EXPLAIN {query}", args)
+            rows += [row for row in cursor.fetchall() if row["table"] in tables]
+    mariadb_connection.commit()
+    # no row for a table means the optimizer resolved it from an index without reading it
+    return {
+        "query": name,
+        "tables": tables,
+        "statements": len(selects),
+        "type": [row["type"] for row in rows],
+        "key": [row["key"] for row in rows],
+        "uses_index": bool(selects) and all(row["type"] != "ALL" and row["key"] for row in rows),
+    }
+
+
+def explain_hot_queries(mariadb_connection):
+    return [explain_hot_query(mariadb_connection, *hot_query) for hot_query in HOT_QUERIES]
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from collections import deque
+
+import pymysql
+
+from app.backend.query_stats import InstrumentedCursor
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class _PoolEntry:
+    def __init__(self, connection, generation):
+        self.connection = connection
+        self.generation = generation
+        self.created_at = time.monotonic()
+
+
+class PooledConnection:
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def _connection(self):
+        entry = self.__dict__.get("_entry")
+        if entry is None:
+            raise pymysql.err.InterfaceError("Connection has already been returned to the pool")
+        return entry.connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection(), name)
+
+    def cursor(self, cursor=None):
+        connection = self._connection()
+        raw_cursor = connection.cursor(cursor)
+        if self._pool.query_stats is None:
+            return raw_cursor
+        return InstrumentedCursor(raw_cursor, connection, self._pool.query_stats)
+
+    def close(self):
+        # closing a pooled connection hands it back instead of dropping it
+        entry, self._entry = self._entry, None
+        if entry is not None:
+            self._pool.release(entry)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class MariaDBPool:
+    def __init__(
+        self,
+        host,
+        port,
+        user,
+        password,
+        database,
+        size=10,
+        timeout=5.0,
+        max_lifetime=1800.0,
+        ping=True,
+        query_stats=None,
+    ):
+        self.connect_args = {"host": host, "port": port, "user": user, "password": password, "database": database}
+        # opt-in QueryStats, cursors of checked out connections report every statement to it
+        self.query_stats = query_stats
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping = ping
+        self.pid = os.getpid()
+
+        self._condition = threading.Condition(threading.Lock())
+        self._idle = deque()
+        self._total = 0
+        self._in_use = 0
+        self._generation = 0
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            entry = self._checkout(started, deadline)
+            if entry is None:
+                try:
+                    entry = self._connect()
+                except Exception:
+                    self._forget()
+                    raise
+            elif not self._is_usable(entry):
+                self._discard(entry)
+                continue
+
+            waited = time.monotonic() - started
+            with self._condition:
+                self._checkouts += 1
+                self._total_wait += waited
+                self._max_wait = max(self._max_wait, waited)
+            return PooledConnection(self, entry)
+
+    def release(self, entry):
+        try:
+            # never hand out a connection that is still inside a transaction,
+            # otherwise the next request would read from a stale snapshot
+            entry.connection.rollback()
+        except Exception:
+            self._discard(entry)
+            return
+
+        if entry.generation != self._generation or self._is_expired(entry):
+            self._discard(entry)
+            return
+
+        with self._condition:
+            self._in_use -= 1
+            self._idle.append(entry)
+            self._condition.notify()
+
+    def clear(self):
+        with self._condition:
+            self._generation += 1
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+            self._discarded += len(idle)
+            self._condition.notify_all()
+        for entry in idle:
+            self._close_quietly(entry)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "size": self.size,
+                "open": self._total,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "total_wait_ms": round(self._total_wait * 1000, 3),
+                "avg_wait_ms": round(self._total_wait * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+            }
+
+    def _checkout(self, started, deadline):
+        with self._condition:
+            while True:
+                if self._idle:
+                    self._in_use += 1
+                    # LIFO, the most recently used connection is the least likely to be stale
+                    return self._idle.pop()
+                if self._total < self.size:
+                    self._total += 1
+                    self._in_use += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"No MariaDB connection available after {time.monotonic() - started:.2f}s "
+                        f"(pool size {self.size})"
+                    )
+                self._condition.wait(remaining)
+
+    def _connect(self):
+        connection = pymysql.connect(**self.connect_args)
+        with self._condition:
+            self._created += 1
+            generation = self._generation
+        return _PoolEntry(connection, generation)
+
+    def _is_expired(self, entry):
+        return self.max_lifetime and time.monotonic() - entry.created_at > self.max_lifetime
+
+    def _is_usable(self, entry):
+        if entry.generation != self._generation or self._is_expired(entry):
+            return False
+        if not self.ping:
+            return True
+        try:
+            entry.connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, entry):
+        self._close_quietly(entry)
+        with self._condition:
+            self._discarded += 1
+        self._forget()
+
+    def _forget(self):
+        with self._condition:
+            self._total -= 1
+            self._in_use -= 1
+            self._condition.notify()
+
+    def _close_quietly(self, entry):
+        try:
+            entry.connection.close()
+        except Exception:
+            pass
@@ -2,12 +2,18 @@ import app.app
 from pymongo import MongoClient
 from .data.api_extractor import get_data_from_api
 from flask import session, current_app
-from bson.regex import Regex
 from datetime import datetime, date
 import json
 from pymongo.collection import Collection
+import re
 from typing import Optional, Tuple, List, Dict, Union
 from datetime import datetime
+from .mongodb_initializer import search_tokens
+from .mariadb_handler import FULLTEXT_MIN_TOKEN_SIZE, FULLTEXT_STOPWORDS
+from .search_index import normalize
+from .genres import split_genres
+from .id_allocator import IdAllocator
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 
 def query_vinyls(mongodb_connection, limit):
@@ -23,18 +29,100 @@ def query_vinyls(mongodb_connection, limit):
         "release_date": 1,
         "genre": 1,
     }
-    current_app.logger.info(collection.find({}, projection))
-    return collection.find({}, projection).limit(limit)
+    # $sample with a size below 5% of the collection picks random documents without a collection scan
+    return list(collection.aggregate([{"$sample": {"size": limit}}, {"$project": projection}]))
 
 
-def get_orders_for_user(mongodb_connection, user_id):
+def query_all_vinyls(mongodb_connection):
+    collection = mongodb_connection["vinyls"]
+    projection = {
+        "vinyl_id": "$_id",
+        "artist_id": "$artist._id",
+        "artist_name": "$artist.artist_name",
+        "nationality": "$artist.nationality",
+        "vinyl_title": 1,
+        "price": 1,
+        "cover_image": 1,
+        "release_date": 1,
+        "genre": 1,
+    }
+    return list(collection.find({}, projection).sort("_id", 1))
+
+
+def query_vinyls_by_ids(mongodb_connection, vinyl_ids):
+    collection = mongodb_connection["vinyls"]
+    projection = {
+        "vinyl_id": "$_id",
+        "artist_id": "$artist._id",
+        "artist_name": "$artist.artist_name",
+        "nationality": "$artist.nationality",
+        "vinyl_title": 1,
+        "price": 1,
+        "cover_image": 1,
+        "release_date": 1,
+        "genre": 1,
+    }
+    vinyls_by_id = {vinyl["_id"]: vinyl for vinyl in collection.find({"_id": {"$in": list(vinyl_ids)}}, projection)}
+    return [vinyls_by_id[vinyl_id] for vinyl_id in vinyl_ids if vinyl_id in vinyls_by_id]
+
+
+PAGE_SORT_FIELDS = {"id": "_id", "price": "price", "release_date": "release_date"}
+
+
+def query_vinyls_page(
+    mongodb_connection,
+    limit,
+    sort="id",
+    descending=False,
+    after=None,
+    genre=None,
+    artist_id=None,
+    min_price=None,
+    max_price=None,
+):
+    collection = mongodb_connection["vinyls"]
+    field = PAGE_SORT_FIELDS[sort]
+    operator = "$lt" if descending else "$gt"
+    direction = -1 if descending else 1
+
+    query = {}
+    if genre:
+        query["genres"] = genre
+    if artist_id is not None:
+        query["artist._id"] = artist_id
+    if min_price is not None or max_price is not None:
+        query["price"] = {}
+        if min_price is not None:
+            query["price"]["$gte"] = float(min_price)
+        if max_price is not None:
+            query["price"]["$lte"] = float(max_price)
+    if after is not None:
+        value, vinyl_id = after
+        if sort == "id":
+            query = {"$and": [query, {"_id": {operator: vinyl_id}}]}
+        else:
+            value = float(value) if sort == "price" else datetime.fromisoformat(value)
+            keyset = {"$or": [{field: {operator: value}}, {field: value, "_id": {operator: vinyl_id}}]}
+            query = {"$and": [query, keyset]}
+
+    sort_order = [("_id", direction)] if sort == "id" else [(field, direction), ("_id", direction)]
+    return list(collection.find(query, SEARCH_PROJECTION).sort(sort_order).limit(limit))
+
+
+def get_orders_for_user(mongodb_connection, user_id, limit=20, after=None):
+    # one page of the order history, newest first, read along the user_order_date index
     try:
         collection = mongodb_connection["orders"]
 
         query = {"user_id": user_id}
+        if after is not None:
+            after_date = datetime.fromisoformat(after[0])
+            query["$or"] = [
+                {"order_date": {"$lt": after_date}},
+                {"order_date": after_date, "_id": {"$lt": after[1]}},
+            ]
 
         projection = {
-            "oder_id": "$_id",
             "user_id": 1,
             "order_date": 1,
             "payment_method": 1,
@@ -49,7 +137,7 @@ def get_orders_for_user(mongodb_connection, user_id):
             "vinyls.artist_details.nationality": 1,
         }
 
-        results = list(collection.find(query, projection).sort([("order_date", -1), ("_id", 1)]))
+        results = collection.find(query, projection).sort([("order_date", -1), ("_id", -1)]).limit(limit)
 
         orders = []
         for order in results:
@@ -74,8 +162,6 @@ def get_orders_for_user(mongodb_connection, user_id):
                     ],
                 }
             )
-
-        current_app.logger.debug(f"Orders for user_id {user_id}: {orders}")
         return orders
 
     except Exception as e:
@@ -113,25 +199,99 @@ def handle_login(mongodb_connection, email, password):
         current_app.logger.debug("Invalid email or password!")
 
 
-def search_vinyls(mongodb_connection, query):
+def get_users(mongodb_connection):
+    try:
+        collection = mongodb_connection["users"]
+        admins = []
+        customers = []
+        for user in collection.find({}):
+            user_doc = {
+                "user_id": user["_id"],
+                "user_name": user["user_name"],
+                "user_email": user["user_email"],
+                "user_password": user["user_password"],
+                "role": user["role"],
+            }
+            if user["role"] == "admin":
+                user_doc["department"] = user.get("admin_details", {}).get("department")
+                admins.append(user_doc)
+            else:
+                user_doc["address"] = (user.get("customer_details") or {}).get("address")
+                customers.append(user_doc)
+        return {"admins": admins, "customers": customers}
+
+    except Exception as e:
+        current_app.logger.error(f"Error fetching users: {e}")
+        return {"admins": [], "customers": []}
+
+
+SEARCH_PROJECTION = {
+    "_id": 0,
+    "vinyl_id": "$_id",
+    "vinyl_title": 1,
+    "price": 1,
+    "cover_image": 1,
+    "artist_name": "$artist.artist_name",
+    "artist_id": "$artist._id",
+    "release_date": 1,
+    "genre": 1,
+    "nationality": "$artist.nationality",
+}
+
+
+# field weights of the vinyls_text index, every query word that starts a word of a field adds its weight
+PREFIX_WEIGHTS = {"vinyl_title": 3, "artist_name": 3, "genre": 1}
+
+
+def search_vinyls(mongodb_connection, query, limit=20):
+    # ranked by relevance like the FULLTEXT search of MariaDB. Whole words come from the vinyls_text
+    # index with their textScore, the word* terms of MariaDB are matched against the starts of the
+    # search_tokens, so "bea" finds "The Beatles" in both backends
     collection = mongodb_connection["vinyls"]
-    regex_pattern = Regex(f".*{query}.*", "i")
-    query = {"$or": [{"vinyl_title": regex_pattern}, {"artist.artist_name": regex_pattern}, {"genre": regex_pattern}]}
+    # the same words fulltext_terms of MariaDB searches for, "-" or quotes are not read as $text operators
+    words = [word for word in re.findall(r"\w+", query.lower()) if len(word) >= FULLTEXT_MIN_TOKEN_SIZE]
+    if not words:
+        return search_vinyls_like(mongodb_connection, query, limit)
+
+    scored = {}
+    # a stopword still matches the longer words it starts, but not itself
+    text_words = [word for word in words if word not in FULLTEXT_STOPWORDS]
+    if text_words:
+        projection = dict(SEARCH_PROJECTION, score={"$meta": "textScore"})
+        text_hits = (
+            collection.find({"$text": {"$search": " ".join(text_words)}}, projection)
+            .sort([("score", {"$meta": "textScore"})])
+            .limit(limit)
+        )
+        for vinyl in text_hits:
+            scored[vinyl["vinyl_id"]] = vinyl
+
+    # U+FFFF sorts after any character, each word is one range scan on the multikey search_tokens index
+    prefix_query = {"$or": [{"search_tokens": {"$gte": word, "$lt": word + "\uffff"}} for word in words]}
+    for vinyl in collection.find(prefix_query, SEARCH_PROJECTION).limit(limit):
+        field_words = {
+            field: set(normalize(vinyl.get(field)).split()) - FULLTEXT_STOPWORDS for field in PREFIX_WEIGHTS
+        }
+        weight = sum(
+            field_weight
+            for field, field_weight in PREFIX_WEIGHTS.items()
+            for word in words
+            if any(token.startswith(word) for token in field_words[field])
+        )
+        scored.setdefault(vinyl["vinyl_id"], dict(vinyl, score=0))["score"] += weight
 
-    projection = {
-        "vinyl_id": "$_id",
-        "artist_id": "$artist._id",
-        "artist_name": "$artist.artist_name",
-        "nationality": "$artist.nationality",
-        "vinyl_title": 1,
-        "price": 1,
-        "cover_image": 1,
-        "release_date": 1,
-        "genre": 1,
-    }
+    ranked = sorted(scored.values(), key=lambda vinyl: (-vinyl["score"], vinyl["vinyl_title"] or ""))
+    results = [{key: value for key, value in vinyl.items() if key != "score"} for vinyl in ranked[:limit]]
+    current_app.logger.info(f"query results found: {len(results)}")
+    return results
 
-    current_app.logger.info(f"query results found: {len(list(collection.find(query,projection)))}")
-    return list(collection.find(query, projection))
+
+def search_vinyls_like(mongodb_connection, query, limit=20):
+    # queries without a word long enough for the full-text index, a bounded substring scan like the
+    # LIKE fallback of MariaDB
+    pattern = {"$regex": re.escape(query.lower()), "$options": "i"}
+    search_query = {"$or": [{field: pattern} for field in ("vinyl_title", "artist.artist_name", "genre")]}
+    return list(mongodb_connection["vinyls"].find(search_query, SEARCH_PROJECTION).limit(limit))
 
 
 def search_vinyls_admin(mongodb_connection, genre, artist, min_price, max_price, vinyl_id):
@@ -139,7 +299,7 @@ def search_vinyls_admin(mongodb_connection, genre, artist, min_price, max_price,
     query = {}
 
     if genre:
-        query["genre"] = {"$regex": f".*{genre}.*", "$options": "i"}
+        query["genres"] = genre
     if artist:
         query["artist.artist_name"] = {"$regex": f".*{artist}.*", "$options": "i"}
     if min_price and min_price.strip():
@@ -164,18 +324,28 @@ def search_vinyls_admin(mongodb_connection, genre, artist, min_price, max_price,
 
     current_app.logger.info(f"Executing query: {query}")
     vinyls = list(collection.find(query, projection))
-    genres = collection.distinct("genre")
-    return vinyls, genres
+    return vinyls, query_genres(mongodb_connection)
 
 
-def insert_vinyl(mongodb_connection, artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre):
-    collection = mongodb_connection["vinyls"]
+def query_genres(mongodb_connection):
+    projection = {"_id": 0, "name": "$_id", "vinyl_count": 1}
+    return list(mongodb_connection["genres"].find({"vinyl_count": {"$gt": 0}}, projection).sort("_id", 1))
 
-    existing_artist = collection.find_one(
+
+def find_artist(mongodb_connection, artist_id):
+    # artists are embedded in their vinyls, any vinyl of the artist carries the details
+    return mongodb_connection["vinyls"].find_one(
         {"artist._id": int(artist_id)}, {"artist.artist_name": 1, "artist.nationality": 1}
     )
 
-    formatted_release_date = datetime.strftime("%Y-%m-%d", release_date)
+
+def insert_vinyl(mongodb_connection, artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre):
+    collection = mongodb_connection["vinyls"]
+
+    existing_artist = find_artist(mongodb_connection, artist_id)
+
+    # the form sends YYYY-MM-DD, the schema stores release dates as BSON dates like fill_mongodb does
+    formatted_release_date = datetime.strptime(release_date, "%Y-%m-%d")
 
     if not existing_artist:
         current_app.logger.error(f"Artist with ID {artist_id} not found in Vinyls collection.")
@@ -185,8 +355,9 @@ def insert_vinyl(mongodb_connection, artist_id, vinyl_name, vinyl_price, release
     nationality = existing_artist["artist"]["nationality"]
 
     vinyl_document = {
+        "_id": id_allocator().next_id(mongodb_connection, "vinyls", "vinyls"),
         "artist": {
-            "_id": artist_id,
+            "_id": int(artist_id),
             "artist_name": artist_name,
             "nationality": nationality,
         },
@@ -195,9 +366,19 @@ def insert_vinyl(mongodb_connection, artist_id, vinyl_name, vinyl_price, release
         "release_date": formatted_release_date,
         "cover_image": cover_image,
         "genre": genre,
+        "genres": split_genres(genre),
+        "search_tokens": search_tokens(vinyl_name, artist_name, genre),
     }
 
-    result = collection.insert_one(vinyl_document)
+    try:
+        result = collection.insert_one(vinyl_document)
+    except DuplicateKeyError:
+        # the block was reserved before a reseed reset the counter, take the next one from a fresh block
+        id_allocator().discard("vinyls")
+        vinyl_document["_id"] = id_allocator().next_id(mongodb_connection, "vinyls", "vinyls")
+        result = collection.insert_one(vinyl_document)
+    for name in vinyl_document["genres"]:
+        mongodb_connection["genres"].update_one({"_id": name}, {"$inc": {"vinyl_count": 1}}, upsert=True)
     current_app.logger.debug(f"Vinyl inserted successfully. Inserted ID: {result.inserted_id}")
 
     return result.inserted_id
@@ -325,6 +506,107 @@ def fetch_reviews_summary(mongodb_connection, start_date=None, end_date=None):
         return []
 
 
+def _find_order_vinyls(mongodb_connection, vinyl_ids):
+    return {
+        vinyl["_id"]: vinyl
+        for vinyl in mongodb_connection["vinyls"].find(
+            {"_id": {"$in": [int(vinyl_id) for vinyl_id in vinyl_ids]}},
+            {"price": 1, "vinyl_title": 1, "cover_image": 1, "genre": 1, "genres": 1, "artist": 1},
+        )
+    }
+
+
+def _order_document(order_id, user_id, items, vinyls):
+    lines = []
+    for vinyl_id, amount in items.items():
+        vinyl = vinyls[int(vinyl_id)]
+        lines.append(
+            {
+                "vinyl_id": int(vinyl_id),
+                "amount": amount,
+                "vinyl_details": {
+                    "price": vinyl["price"],
+                    "vinyl_title": vinyl["vinyl_title"],
+                    "cover_image": vinyl["cover_image"],
+                    "genre": vinyl["genre"],
+                    "genres": vinyl["genres"],
+                },
+                "artist_details": {
+                    "artist_id": int(vinyl["artist"]["_id"]),
+                    "artist_name": vinyl["artist"]["artist_name"],
+                    "nationality": vinyl["artist"]["nationality"],
+                },
+            }
+        )
+    return {
+        "_id": order_id,
+        "user_id": int(user_id),
+        "order_date": datetime.utcnow(),
+        "payment_method": "Kreditkarte",
+        "total_price": sum(line["vinyl_details"]["price"] * line["amount"] for line in lines),
+        "vinyls": lines,
+    }
+
+
+def checkout(mongodb_connection, user_id, items):
+    # items maps vinyl id -> amount, the whole cart is one order document
+    try:
+        vinyls = _find_order_vinyls(mongodb_connection, items)
+        missing = [vinyl_id for vinyl_id in items if int(vinyl_id) not in vinyls]
+        if missing:
+            current_app.logger.error(f"Vinyls {missing} not found.")
+            return {"error": f"Vinyls not found: {missing}"}
+
+        order_document = _order_document(
+            id_allocator().next_id(mongodb_connection, "orders", "orders"), user_id, items, vinyls
+        )
+        orders_col = mongodb_connection["orders"]
+        try:
+            orders_col.insert_one(order_document)
+        except DuplicateKeyError:
+            id_allocator().discard("orders")
+            order_document["_id"] = id_allocator().next_id(mongodb_connection, "orders", "orders")
+            orders_col.insert_one(order_document)
+        order_id = order_document["_id"]
+
+        current_app.logger.debug(f"Order {order_id} with {len(items)} vinyls placed successfully.")
+        return {"success": f"Order {order_id} placed successfully", "order_id": order_id}
+
+    except Exception as e:
+        current_app.logger.error(f"Error checking out cart: {e}")
+        return {"error": str(e)}
+
+
+def place_orders(mongodb_connection, orders):
+    # journaled orders as one unordered insert_many. The journal token is unique, an order that
+    # was inserted before a crash fails with a duplicate key and counts as placed. Any other write
+    # error is reported per token in failed, the journal retries those orders.
+    vinyls = _find_order_vinyls(mongodb_connection, {vinyl_id for order in orders for vinyl_id in order["items"]})
+    documents = []
+    rejected = []
+    for order in orders:
+        if any(int(vinyl_id) not in vinyls for vinyl_id in order["items"]):
+            rejected.append(order["token"])
+            continue
+        document = _order_document(
+            id_allocator().next_id(mongodb_connection, "orders", "orders"), order["user_id"], order["items"], vinyls
+        )
+        document["journal_token"] = order["token"]
+        documents.append(document)
+    failed = {}
+    if documents:
+        try:
+            mongodb_connection["orders"].insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                if "journal_token" not in error.get("keyPattern", {}):
+                    failed[documents[error["index"]]["journal_token"]] = error.get("errmsg", str(error))
+            if failed:
+                # the retry takes a fresh id block in case the ids collided
+                id_allocator().discard("orders")
+    return {"placed": len(documents) - len(failed), "rejected": rejected, "failed": failed}
+
+
 def get_purchase_overview(
     mongodb_connection: MongoClient,
     artist_name: Optional[str] = None,
@@ -361,7 +643,8 @@ def get_purchase_overview(
         if artist_name and artist_name.strip():
             match_criteria["vinyls.artist_details.artist_name"] = artist_name.strip()
         if genre and genre.strip():
-            match_criteria["vinyls.vinyl_details.genre"] = genre.strip()
+            # every line listed under the genre, the summary still groups by the genre string like MariaDB
+            match_criteria["vinyls.vinyl_details.genres"] = genre.strip()
         if formated_start_date or formated_end_date:
             order_date_filter = {}
             if formated_start_date:
@@ -371,7 +654,10 @@ def get_purchase_overview(
             match_criteria["order_date"] = order_date_filter
 
         # **Summary Pipeline**
+        # the first $match selects whole orders through the orders indexes, the second
+        # one drops the unwound lines of those orders that do not match themselves
         summary_pipeline = [
+            {"$match": match_criteria},
             {"$unwind": "$vinyls"},
             {"$match": match_criteria},
             {
@@ -398,6 +684,7 @@ def get_purchase_overview(
 
         # **Details Pipeline**
         details_pipeline = [
+            {"$match": match_criteria},
             {"$unwind": "$vinyls"},
             {"$match": match_criteria},
             {
@@ -437,6 +724,16 @@ def get_purchase_overview(
 from bson.objectid import ObjectId
 
 
+_id_allocator = None
+
+
+def id_allocator():
+    global _id_allocator
+    if _id_allocator is None:
+        _id_allocator = IdAllocator(block_size=current_app.config["MONGODB"]["id_block_size"])
+    return _id_allocator
+
+
 def buy_vinyl(mongodb_connection, user_id, vinyl_id, amount=1):
     try:
         vinyls_col = mongodb_connection["vinyls"]
@@ -451,12 +748,8 @@ def buy_vinyl(mongodb_connection, user_id, vinyl_id, amount=1):
         vinyl_price = vinyl["price"]
         total_price = vinyl_price * amount
 
-        last_order = orders_col.find_one({}, sort=[("_id", -1)])
-        current_app.logger.error(f"last {last_order['_id']}")
-        last_id = last_order["_id"]
-        new_id = int(last_id) + 1
         order_document = {
-            "_id": int(new_id),
+            "_id": id_allocator().next_id(mongodb_connection, "orders", "orders"),
             "user_id": int(user_id),
             "order_date": datetime.utcnow(),
             "payment_method": "Kreditkarte",  # Hardcoded as per original function
@@ -470,6 +763,7 @@ def buy_vinyl(mongodb_connection, user_id, vinyl_id, amount=1):
                         "vinyl_title": vinyl["vinyl_title"],
                         "cover_image": vinyl["cover_image"],
                         "genre": vinyl["genre"],
+                        "genres": vinyl["genres"],
                     },
                     "artist_details": {
                         "artist_id": int(vinyl["artist"]["_id"]),
@@ -481,7 +775,13 @@ def buy_vinyl(mongodb_connection, user_id, vinyl_id, amount=1):
         }
 
         # Insert the order into the Orders collection
-        result = orders_col.insert_one(order_document)
+        try:
+            result = orders_col.insert_one(order_document)
+        except DuplicateKeyError:
+            # the block was reserved before a reseed reset the counter, take the next one from a fresh block
+            id_allocator().discard("orders")
+            order_document["_id"] = id_allocator().next_id(mongodb_connection, "orders", "orders")
+            result = orders_col.insert_one(order_document)
         order_id = result.inserted_id
 
         current_app.logger.debug(f"Order {order_id} placed successfully.")
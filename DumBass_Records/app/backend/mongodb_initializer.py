@@ -2,9 +2,76 @@ import json
 from datetime import datetime
 import os
 import pymysql
-from pymongo import errors, ASCENDING, ASCENDING
+from pymongo import errors, ASCENDING, DESCENDING, IndexModel
 from flask import current_app
 import pymongo
+from collections import Counter
+from .genres import split_genres
+from .id_allocator import seed_counter
+from .search_index import normalize
+from .mariadb_handler import FULLTEXT_STOPWORDS
+
+
+def search_tokens(vinyl_title, artist_name, genre):
+    # lowercased words of the searched fields without the stopwords the MariaDB FULLTEXT indexes skip,
+    # search_vinyls matches query words against their starts
+    words = normalize(f"{vinyl_title or ''} {artist_name or ''} {genre or ''}").split()
+    return sorted(set(words) - FULLTEXT_STOPWORDS)
+
+
+# indexes per collection, applied by create_collections_with_schemas. Every query in
+# mongodb_handler that filters or sorts should be covered, see explain_handler_queries.
+INDEXES = {
+    "vinyls": [
+        # default_language none: artist names and titles must not be stemmed or stopword filtered
+        {
+            "keys": [("vinyl_title", pymongo.TEXT), ("artist.artist_name", pymongo.TEXT), ("genre", pymongo.TEXT)],
+            "name": "vinyls_text",
+            "weights": {"vinyl_title": 3, "artist.artist_name": 3, "genre": 1},
+            "default_language": "none",
+        },
+        # word prefixes of search_vinyls
+        {"keys": [("search_tokens", ASCENDING)], "name": "search_tokens"},
+        # genre filter of search_vinyls_admin and /api/vinyls, the sort key and _id follow the genre so genre
+        # pages are read in index order instead of sorting every vinyl of the genre
+        {"keys": [("genres", ASCENDING), ("_id", ASCENDING)], "name": "genres_id"},
+        {"keys": [("genres", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)], "name": "genres_price_id"},
+        {
+            "keys": [("genres", ASCENDING), ("release_date", ASCENDING), ("_id", ASCENDING)],
+            "name": "genres_release_date_id",
+        },
+        # keyset pagination for /api/vinyls, the _id suffix keeps equal prices and dates in a stable order
+        {"keys": [("price", ASCENDING), ("_id", ASCENDING)], "name": "price_id"},
+        {"keys": [("release_date", ASCENDING), ("_id", ASCENDING)], "name": "release_date_id"},
+        # artist lookup of insert_vinyl
+        {"keys": [("artist._id", ASCENDING)], "name": "artist_id"},
+    ],
+    "orders": [
+        # get_orders_for_user filters on the user and pages newest first on (order_date, _id)
+        {"keys": [("user_id", ASCENDING), ("order_date", DESCENDING), ("_id", DESCENDING)], "name": "user_order_date"},
+        # get_purchase_overview filters
+        {"keys": [("order_date", ASCENDING)], "name": "order_date"},
+        # orders flushed from the order journal, a replayed token must not be inserted twice
+        {
+            "keys": [("journal_token", ASCENDING)],
+            "name": "journal_token",
+            "unique": True,
+            "partialFilterExpression": {"journal_token": {"$exists": True}},
+        },
+        {"keys": [("vinyls.vinyl_details.genres", ASCENDING), ("order_date", ASCENDING)], "name": "genres_order_date"},
+        {
+            "keys": [("vinyls.artist_details.artist_name", ASCENDING), ("order_date", ASCENDING)],
+            "name": "artist_name_order_date",
+        },
+    ],
+    "users": [
+        {"keys": [("user_email", ASCENDING)], "name": "user_email"},
+    ],
+    "reviews": [
+        {"keys": [("user_id", ASCENDING), ("vinyl_id", ASCENDING)], "name": "user_id_1_vinyl_id_1", "unique": True},
+        {"keys": [("review_date", ASCENDING)], "name": "review_date"},
+    ],
+}
 
 
 def create_collections_with_schemas(mongodb_connection):
@@ -19,6 +86,127 @@ def create_collections_with_schemas(mongodb_connection):
         except errors.CollectionInvalid as e:
             current_app.logger.info(f"failed to create {schema} {e}")
 
+    apply_indexes(mongodb_connection)
+
+
+def apply_indexes(mongodb_connection):
+    for collection, specs in INDEXES.items():
+        models = [IndexModel(spec["keys"], **{k: v for k, v in spec.items() if k != "keys"}) for spec in specs]
+        names = mongodb_connection[collection].create_indexes(models)
+        current_app.logger.info(f"Indexes on {collection} created: {', '.join(names)}")
+
+
+def handler_queries():
+    # (name, call), the call runs the real mongodb_handler code with sample values. Handlers that
+    # write are covered through the read helpers they use.
+    # mongodb_handler imports search_tokens from this module, it is imported here
+    from app.backend import mongodb_handler
+
+    return [
+        ("query_vinyls_by_ids", lambda db: mongodb_handler.query_vinyls_by_ids(db, [1, 2, 3])),
+        (
+            "query_vinyls_page by price",
+            lambda db: mongodb_handler.query_vinyls_page(db, 21, "price", False, ("20.0", 1)),
+        ),
+        ("query_vinyls_page by genre", lambda db: mongodb_handler.query_vinyls_page(db, 21, genre="Rock")),
+        (
+            "query_vinyls_page by genre and price",
+            lambda db: mongodb_handler.query_vinyls_page(db, 21, "price", False, ("20.0", 1), genre="Rock"),
+        ),
+        ("search_vinyls", lambda db: mongodb_handler.search_vinyls(db, "bea")),
+        ("search_vinyls_admin", lambda db: mongodb_handler.search_vinyls_admin(db, "Rock", "", "10", "30", None)),
+        ("insert_vinyl artist lookup", lambda db: mongodb_handler.find_artist(db, 1)),
+        ("checkout vinyl lookup", lambda db: mongodb_handler._find_order_vinyls(db, [1, 2])),
+        ("handle_login", lambda db: mongodb_handler.handle_login(db, "user@user.com", "")),
+        (
+            "get_orders_for_user",
+            lambda db: mongodb_handler.get_orders_for_user(db, 1, 20, ("2100-01-01T00:00:00", 2**31 - 1)),
+        ),
+        ("query_review_by_user", lambda db: mongodb_handler.query_review_by_user(db, 1, 1)),
+        ("fetch_reviews_summary", lambda db: mongodb_handler.fetch_reviews_summary(db, "2024-01-01", "2024-12-31")),
+        (
+            "get_purchase_overview by date",
+            lambda db: mongodb_handler.get_purchase_overview(db, start_date="2024-01-01", end_date="2024-12-31"),
+        ),
+        ("get_purchase_overview by genre", lambda db: mongodb_handler.get_purchase_overview(db, genre="Rock")),
+        ("get_purchase_overview by artist", lambda db: mongodb_handler.get_purchase_overview(db, artist_name="Queen")),
+    ]
+
+
+class RecordingCollection:
+    def __init__(self, collection, calls):
+        self._collection = collection
+        self._calls = calls
+
+    def find(self, *args, **kwargs):
+        # the cursor itself is kept, its explain() includes the sort, limit and collation added later
+        cursor = self._collection.find(*args, **kwargs)
+        self._calls.append((self._collection.name, cursor))
+        return cursor
+
+    def find_one(self, filter=None, *args, **kwargs):
+        return next(self.find(filter, *args, **kwargs).limit(-1), None)
+
+    def aggregate(self, pipeline, **kwargs):
+        self._calls.append((self._collection.name, (pipeline, kwargs)))
+        return self._collection.aggregate(pipeline, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class RecordingDatabase:
+    # hands out collections that keep every find and aggregate issued through them
+    def __init__(self, database):
+        self._database = database
+        self.calls = []
+
+    def __getitem__(self, name):
+        return RecordingCollection(self._database[name], self.calls)
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+def _plan_stages(explain):
+    # every stage name below a winning plan, for classic and slot based execution plans
+    stages = []
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "stage" and isinstance(value, str):
+                stages.append(value)
+            elif key != "rejectedPlans":
+                stages.extend(_plan_stages(value))
+    elif isinstance(explain, list):
+        for value in explain:
+            stages.extend(_plan_stages(value))
+    return stages
+
+
+def explain_handler_query(mongodb_connection, name, call):
+    # uses_index is False when a winning plan contains a COLLSCAN, or the call issued no query
+    recording = RecordingDatabase(mongodb_connection)
+    call(recording)
+    stages = []
+    for collection, query in recording.calls:
+        if isinstance(query, tuple):
+            pipeline, options = query
+            explain = mongodb_connection.command("aggregate", collection, pipeline=pipeline, explain=True, **options)
+        else:
+            explain = query.explain()
+        stages += _plan_stages(explain)
+    return {
+        "query": name,
+        "collections": sorted({collection for collection, _ in recording.calls}),
+        "queries": len(recording.calls),
+        "stages": sorted(set(stages)),
+        "uses_index": bool(recording.calls) and "COLLSCAN" not in stages,
+    }
+
+
+def explain_handler_queries(mongodb_connection):
+    return [explain_handler_query(mongodb_connection, name, call) for name, call in handler_queries()]
+
 
 def drop_mongo_db(mongodb_connection):
     client = mongodb_connection.client
@@ -49,10 +237,13 @@ def fill_mongodb(mongodb_connection, mariadb_connection):
     reviews = fetch_reviews(mariadb_connection)
     transformed_vinyls = transform_vinyls(vinyls, artists)
     insert_vinyls(mongodb_connection, transformed_vinyls)
+    insert_genres(mongodb_connection, transformed_vinyls)
+    seed_counter(mongodb_connection, "vinyls", "vinyls")
     transformed_users = transform_users(users, mariadb_connection)
     insert_users(mongodb_connection, transformed_users)
     transformed_orders = transform_orders(orders, mariadb_connection)
     insert_orders(mongodb_connection, transformed_orders)
+    seed_counter(mongodb_connection, "orders", "orders")
     transformed_reviews = transform_reviews(reviews)
     insert_reviews(mongodb_connection, transformed_reviews)
 
@@ -73,6 +264,15 @@ def insert_vinyls(mongodb_connection, vinyls):
     current_app.logger.debug(f"Inserted {len(vinyls)} vinyls into MongoDB.")
 
 
+def insert_genres(mongodb_connection, vinyls):
+    # facet counts for the genre dropdown, insert_vinyl increments them
+    counts = Counter(name for vinyl in vinyls for name in vinyl["genres"])
+    if not counts:
+        return
+    mongodb_connection.genres.insert_many([{"_id": name, "vinyl_count": count} for name, count in counts.items()])
+    current_app.logger.debug(f"Inserted {len(counts)} genres into MongoDB.")
+
+
 def transform_vinyls(vinyls, artists_dict):
     transformed = []
     for vinyl in vinyls:
@@ -88,6 +288,8 @@ def transform_vinyls(vinyls, artists_dict):
             "release_date": release_date,
             "cover_image": vinyl.get("Cover_Image"),
             "genre": vinyl.get("Genre"),
+            "genres": split_genres(vinyl.get("Genre")),
+            "search_tokens": search_tokens(vinyl.get("Vinyl_Name"), artist.get("Artist_Name"), vinyl.get("Genre")),
             "artist": {
                 "_id": int(vinyl.get("Artist_ID")),
                 "artist_name": artist.get("Artist_Name"),
@@ -163,6 +365,7 @@ def transform_orders(orders, mariadb_connection):
                         "price": float(vinyl_info.get("Price", 0.0)),
                         "cover_image": vinyl_info.get("Cover_Image"),
                         "genre": vinyl_info.get("Genre"),
+                        "genres": split_genres(vinyl_info.get("Genre")),
                     },
                     "artist_details": {
                         "artist_id": int(artist_info.get("Artist_ID", 0)),
@@ -219,9 +422,6 @@ def insert_reviews(mongodb_connection, reviews):
         return
     mongodb_connection.reviews.insert_many(reviews, ordered=False)
     current_app.logger.info(f"Inserted {len(reviews)} reviews into MongoDB.")
-    mongodb_connection.reviews.create_index(
-        [("user_id", pymongo.ASCENDING), ("vinyl_id", pymongo.ASCENDING)], unique=True
-    )
 
 
 def fetch_artist(mariadb_connection):
@@ -0,0 +1,278 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.backend import database_handler
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS Orders (
+        Entry_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+        Token TEXT NOT NULL UNIQUE,
+        User_ID INTEGER NOT NULL,
+        Items TEXT NOT NULL,
+        Created_At REAL NOT NULL,
+        Claimed_By TEXT,
+        Claimed_At REAL,
+        Attempts INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+# orders the backend kept refusing, they stay here for inspection instead of blocking the journal
+CREATE_DEAD_LETTERS = """
+    CREATE TABLE IF NOT EXISTS Dead_Letters (
+        Token TEXT PRIMARY KEY,
+        User_ID INTEGER NOT NULL,
+        Items TEXT NOT NULL,
+        Created_At REAL NOT NULL,
+        Attempts INTEGER NOT NULL,
+        Error TEXT NOT NULL,
+        Failed_At REAL NOT NULL
+    )
+"""
+
+
+class OrderJournal:
+    # durable local queue for write-behind orders. An order is acknowledged once its row is
+    # fsynced to the SQLite journal, the committers of all workers share the file and claim
+    # batches with a lease, so the batch of a crashed worker is replayed once the lease expires.
+    # The backends skip journal tokens they already committed, a replay never doubles an order.
+    def __init__(self, path, lease=30.0):
+        self.path = path
+        self.lease = lease
+        self.owner = f"{os.uname().nodename}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        # caller holds _lock, a forked worker opens its own connection
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=FULL")
+            connection.execute(CREATE_TABLE)
+            connection.execute(CREATE_DEAD_LETTERS)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def append(self, user_id, items):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO Orders (Token, User_ID, Items, Created_At) VALUES (?, ?, ?, ?)",
+                (token, int(user_id), json.dumps(items), time.time()),
+            )
+        return token
+
+    def claim(self, limit):
+        # takes the oldest unclaimed orders, or those of a committer whose lease ran out
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    """
+                    UPDATE Orders SET Claimed_By = ?, Claimed_At = ?, Attempts = Attempts + 1
+                    WHERE Entry_ID IN (
+                        SELECT Entry_ID FROM Orders
+                        WHERE Claimed_By IS NULL OR Claimed_At < ?
+                        ORDER BY Entry_ID
+                        LIMIT ?
+                    )
+                    """,
+                    (self.owner, now, now - self.lease, limit),
+                )
+                rows = db.execute(
+                    """
+                    SELECT Token, User_ID, Items, Created_At, Attempts FROM Orders
+                    WHERE Claimed_By = ? ORDER BY Entry_ID
+                    """,
+                    (self.owner,),
+                ).fetchall()
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return [
+            {
+                "token": token,
+                "user_id": user_id,
+                "items": {int(vinyl_id): amount for vinyl_id, amount in json.loads(items).items()},
+                "created_at": created_at,
+                "attempts": attempts,
+            }
+            for token, user_id, items, created_at, attempts in rows
+        ]
+
+    def complete(self, tokens):
+        with self._lock:
+            self._db().executemany("DELETE FROM Orders WHERE Token = ?", [(token,) for token in tokens])
+
+    def dead_letter(self, errors):
+        # errors maps token -> write error of the last attempt
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany(
+                    """
+                    INSERT OR REPLACE INTO Dead_Letters (Token, User_ID, Items, Created_At, Attempts, Error, Failed_At)
+                    SELECT Token, User_ID, Items, Created_At, Attempts, ?, ? FROM Orders WHERE Token = ?
+                    """,
+                    [(error, now, token) for token, error in errors.items()],
+                )
+                db.executemany("DELETE FROM Orders WHERE Token = ?", [(token,) for token in errors])
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def release(self):
+        # gives the claimed batch back after a failed flush
+        with self._lock:
+            self._db().execute(
+                "UPDATE Orders SET Claimed_By = NULL, Claimed_At = NULL WHERE Claimed_By = ?", (self.owner,)
+            )
+
+    def pending(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM Orders").fetchone()[0]
+
+    def dead_letters(self):
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM Dead_Letters").fetchone()[0]
+
+
+_journal = None
+_wakeup = threading.Event()
+_started = False
+_stats_lock = threading.Lock()
+_stats = {
+    "appended": 0,
+    "committed": 0,
+    "rejected": 0,
+    "retried": 0,
+    "dead_lettered": 0,
+    "batches": 0,
+    "failed_batches": 0,
+    "flush_seconds": 0.0,
+    "max_lag_ms": 0.0,
+    "last_batch": None,
+}
+
+
+def get_journal(app):
+    global _journal
+    if _journal is None:
+        journal_config = app.config["ORDER_JOURNAL"]
+        _journal = OrderJournal(journal_config["path"], journal_config["lease"])
+    return _journal
+
+
+def enabled(app):
+    return app.config["ORDER_JOURNAL"]["enabled"]
+
+
+def append(app, user_id, items):
+    token = get_journal(app).append(user_id, items)
+    with _stats_lock:
+        _stats["appended"] += 1
+    _wakeup.set()
+    return token
+
+
+def flush(app):
+    # one batch from the journal into the active backend, returns the number of orders handled
+    journal_config = app.config["ORDER_JOURNAL"]
+    journal = get_journal(app)
+    batch = journal.claim(journal_config["batch_size"])
+    if not batch:
+        return 0
+    started = time.perf_counter()
+    try:
+        with app.app_context():
+            # the orders go to the backend that is active now, not the one they were placed on
+            database_handler.sync_backend()
+            result = database_handler.orders.place_orders(batch)
+    except Exception as e:
+        journal.release()
+        with _stats_lock:
+            _stats["failed_batches"] += 1
+        app.logger.warning(f"Flushing {len(batch)} journaled orders failed, retrying: {e}")
+        return 0
+    failed = result["failed"]
+    journal.complete([order["token"] for order in batch if order["token"] not in failed])
+    poison = {
+        order["token"]: failed[order["token"]]
+        for order in batch
+        if order["token"] in failed and order["attempts"] >= journal_config["max_attempts"]
+    }
+    if poison:
+        journal.dead_letter(poison)
+        app.logger.error(
+            f"Moved journaled orders to the dead letters after {journal_config['max_attempts']} attempts: {poison}"
+        )
+    if len(failed) > len(poison):
+        # the orders still claimed are the failed ones below max_attempts
+        journal.release()
+        app.logger.warning(f"Writing {len(failed) - len(poison)} journaled orders failed, retrying them")
+    elapsed = time.perf_counter() - started
+    lag_ms = (time.time() - batch[0]["created_at"]) * 1000
+    if result["rejected"]:
+        app.logger.error(f"Dropped journaled orders with unknown vinyls: {result['rejected']}")
+    with _stats_lock:
+        _stats["committed"] += result["placed"]
+        _stats["rejected"] += len(result["rejected"])
+        _stats["retried"] += len(failed) - len(poison)
+        _stats["dead_lettered"] += len(poison)
+        _stats["batches"] += 1
+        _stats["flush_seconds"] += elapsed
+        _stats["max_lag_ms"] = max(_stats["max_lag_ms"], lag_ms)
+        _stats["last_batch"] = {"orders": len(batch), "ms": round(elapsed * 1000, 3), "lag_ms": round(lag_ms, 3)}
+    # a batch with failed orders ends the drain, they are retried after the flush interval
+    return len(batch) - len(failed)
+
+
+def _run(app):
+    journal_config = app.config["ORDER_JOURNAL"]
+    while True:
+        # orders appended while a batch is flushing are picked up by the next one
+        _wakeup.wait(journal_config["flush_interval"])
+        _wakeup.clear()
+        time.sleep(journal_config["linger"])
+        try:
+            while flush(app) == journal_config["batch_size"]:
+                pass
+        except Exception as e:
+            app.logger.warning(f"Order journal committer failed: {e}")
+            time.sleep(journal_config["flush_interval"])
+
+
+def start(app):
+    # journaled orders of a crashed process are replayed by the first committer that starts
+    global _started
+    if not enabled(app) or _started:
+        return
+    _started = True
+    threading.Thread(target=_run, args=(app,), name="order-journal", daemon=True).start()
+
+
+def stats(app):
+    if not enabled(app):
+        return None
+    with _stats_lock:
+        report = dict(_stats)
+    report["pending"] = get_journal(app).pending()
+    report["dead_letters"] = get_journal(app).dead_letters()
+    report["orders_per_second"] = (
+        round(report["committed"] / report["flush_seconds"], 1) if report["flush_seconds"] else None
+    )
+    report["flush_seconds"] = round(report["flush_seconds"], 3)
+    report["max_lag_ms"] = round(report["max_lag_ms"], 3)
+    return report
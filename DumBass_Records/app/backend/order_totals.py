@@ -0,0 +1,117 @@
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+import pymysql
+
+from app.backend import database_handler
+
+# factor of the Rabatt_Nach_Empfehlung trigger, applied to the total of the orders it flags with Referral_Discount
+REFERRAL_DISCOUNT = Decimal("0.931")
+CENT = Decimal("0.01")
+
+_last_report = None
+_started = False
+
+
+def find_drift(mariadb_connection, batch_size=500):
+    # orders whose total is not the sum of their lines at the unit prices they were sold at, after the
+    # referral discount when the trigger applied it. Orders with an unpriced line are only counted.
+    drift = []
+    checked = 0
+    unpriced = 0
+    last_id = 0
+    with mariadb_connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        while True:
+            cursor.execute(
+                """
+                SELECT
+                    o.Order_ID,
+                    o.Total_Price,
+                    o.Referral_Discount,
+                    IFNULL(SUM(ov.Unit_Price * ov.Amount), 0) AS Line_Total,
+                    SUM(ov.Vinyl_ID IS NOT NULL AND ov.Unit_Price IS NULL) AS Unpriced_Lines
+                FROM Orders o
+                LEFT JOIN Order_Vinyl ov ON ov.Order_ID = o.Order_ID
+                WHERE o.Order_ID > %s
+                GROUP BY o.Order_ID
+                ORDER BY o.Order_ID
+                LIMIT %s
+                """,
+                (last_id, batch_size),
+            )
+            rows = cursor.fetchall()
+            # one short transaction per batch instead of a snapshot over the whole table
+            mariadb_connection.commit()
+            if not rows:
+                break
+            for row in rows:
+                if row["Unpriced_Lines"]:
+                    unpriced += 1
+                    continue
+                expected = Decimal(row["Line_Total"]).quantize(CENT, ROUND_HALF_UP)
+                if row["Referral_Discount"]:
+                    expected = (expected * REFERRAL_DISCOUNT).quantize(CENT, ROUND_HALF_UP)
+                if row["Total_Price"] != expected:
+                    drift.append({"order_id": row["Order_ID"], "total_price": row["Total_Price"], "expected": expected})
+            checked += len(rows)
+            last_id = rows[-1]["Order_ID"]
+    return checked, unpriced, drift
+
+
+def reconcile(mariadb_connection, drift):
+    # only a total that is still the drifted one is replaced, a concurrent write wins
+    with mariadb_connection.cursor() as cursor:
+        cursor.executemany(
+            "UPDATE Orders SET Total_Price = %s WHERE Order_ID = %s AND Total_Price = %s",
+            [(entry["expected"], entry["order_id"], entry["total_price"]) for entry in drift],
+        )
+    mariadb_connection.commit()
+
+
+def check_order_totals(mariadb_connection, repair=False, batch_size=500):
+    global _last_report
+    started = time.perf_counter()
+    checked, unpriced, drift = find_drift(mariadb_connection, batch_size)
+    if drift and repair:
+        reconcile(mariadb_connection, drift)
+    _last_report = {
+        "checked_at": time.time(),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "orders": checked,
+        "unpriced": unpriced,
+        "drifted": len(drift),
+        "repaired": len(drift) if repair else 0,
+        "sample": [entry["order_id"] for entry in drift[:20]],
+    }
+    return _last_report, drift
+
+
+def last_report():
+    return _last_report
+
+
+def _run(app):
+    totals_config = app.config["ORDER_TOTALS"]
+    while True:
+        time.sleep(totals_config["check_interval"])
+        try:
+            with app.app_context():
+                # MongoDB orders keep their totals in the order document
+                if database_handler.active_backend != database_handler.MARIADB:
+                    continue
+                report, _ = check_order_totals(
+                    database_handler.get_mariadb_connection(), totals_config["repair"], totals_config["batch_size"]
+                )
+                if report["drifted"]:
+                    app.logger.warning(f"Order totals drifted for {report['drifted']} orders: {report['sample']}")
+        except Exception as e:
+            app.logger.warning(f"Checking order totals failed: {e}")
+
+
+def start(app):
+    global _started
+    if not app.config["ORDER_TOTALS"]["check_interval"] or _started:
+        return
+    _started = True
+    threading.Thread(target=_run, args=(app,), name="order-totals", daemon=True).start()
@@ -0,0 +1,54 @@
+import base64
+import json
+
+# /api/vinyls sort keys, ties are broken by the vinyl id so every position in the order is unique
+SORT_KEYS = ("id", "price", "release_date")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort, descending, vinyl):
+    # the cursor is the sort key of the last row of a page, the next page starts right after it
+    value = None if sort == "id" else vinyl[sort]
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    elif value is not None:
+        value = str(value)
+    payload = json.dumps([sort, descending, value, vinyl["vinyl_id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort, descending):
+    # returns (value, vinyl_id), the value stays a string and is converted by the handlers
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, cursor_descending, value, vinyl_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+    if cursor_sort != sort or cursor_descending != descending or not isinstance(vinyl_id, int):
+        raise InvalidCursor("Cursor does not belong to this sort order")
+    return value, vinyl_id
+
+
+def encode_order_cursor(order):
+    # order history is sorted newest first on (order_date, order_id)
+    payload = json.dumps([order["order_date"].isoformat(), order["order_id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_order_cursor(cursor):
+    # returns (order_date, order_id), the date stays an ISO string and is converted by the handlers
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        order_date, order_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+    if not isinstance(order_date, str) or not isinstance(order_id, int):
+        raise InvalidCursor("Malformed cursor")
+    return order_date, order_id
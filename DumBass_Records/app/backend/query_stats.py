@@ -0,0 +1,188 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+
+import pymysql
+
+# upper bounds of the latency histogram buckets in milliseconds, the last bucket is unbounded
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+# statements that EXPLAIN accepts without executing them
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+_COMMENTS = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_VALUES_LISTS = re.compile(r"\bVALUES\s*\(.*?\)(?:\s*,\s*\(.*?\))*", re.I | re.S)
+
+
+def fingerprint(query):
+    # same statement shape -> same fingerprint, whatever the parameters or the whitespace
+    query = _COMMENTS.sub(" ", query)
+    query = query.replace("%s", "?")
+    query = _STRINGS.sub("?", query)
+    query = _NUMBERS.sub("?", query)
+    query = _IN_LISTS.sub("IN (...)", query)
+    query = _VALUES_LISTS.sub("VALUES (...)", query)
+    return " ".join(query.split()).rstrip(";")
+
+
+class _Statement:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.errors = 0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+        self.explain = None
+        self.explained_at = None
+
+    def percentile(self, fraction):
+        # upper bound of the bucket holding the percentile, None when it is the unbounded one
+        threshold = fraction * self.count
+        seen = 0
+        for position, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= threshold:
+                return BUCKETS_MS[position] if position < len(BUCKETS_MS) else None
+        return None
+
+    def report(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total * 1000, 3),
+            "avg_ms": round(self.total * 1000 / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "slow": self.slow,
+            "histogram": {
+                f"le_{bound}ms" if position < len(BUCKETS_MS) else "inf": count
+                for position, (bound, count) in enumerate(zip(BUCKETS_MS + (None,), self.histogram))
+            },
+            "explain": self.explain,
+        }
+
+
+class QueryStats:
+    # per process statistics, every worker reports its own share of the traffic
+    def __init__(self, slow_ms=100.0, explain_interval=60.0, max_fingerprints=500):
+        self.slow_ms = slow_ms
+        self.explain_interval = explain_interval
+        self.max_fingerprints = max_fingerprints
+        self._statements = {}
+        self._dropped = 0
+        self._lock = threading.Lock()
+
+    def record(self, connection, query, params, elapsed, failed=False):
+        key = fingerprint(query)
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            statement = self._statements.get(key)
+            if statement is None:
+                if len(self._statements) >= self.max_fingerprints:
+                    self._dropped += 1
+                    return
+                statement = self._statements[key] = _Statement(key)
+            statement.count += 1
+            statement.total += elapsed
+            statement.max = max(statement.max, elapsed)
+            statement.histogram[bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+            if failed:
+                statement.errors += 1
+            slow = elapsed_ms >= self.slow_ms and not failed
+            if slow:
+                statement.slow += 1
+            now = time.monotonic()
+            sample = (
+                slow
+                and query.lstrip().upper().startswith(EXPLAINABLE)
+                and (statement.explained_at is None or now - statement.explained_at >= self.explain_interval)
+            )
+            if sample:
+                statement.explained_at = now
+        if sample:
+            explain = self._explain(connection, query, params)
+            with self._lock:
+                statement.explain = explain
+
+    def _explain(self, connection, query, params):
+        try:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(f"EXPLAIN {query}", params)
+                plan = cursor.fetchall()
+        except Exception as e:
+            return {"error": str(e)}
+        extras = [str(row.get("Extra") or "") for row in plan]
+        return {
+            "sampled_at": time.time(),
+            "plan": plan,
+            "full_scan": [row.get("table") for row in plan if row.get("type") == "ALL"],
+            "filesort": any("Using filesort" in extra for extra in extras),
+            "temporary": any("Using temporary" in extra for extra in extras),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._dropped = 0
+
+    def report(self):
+        with self._lock:
+            statements = sorted(self._statements.values(), key=lambda statement: statement.total, reverse=True)
+            report = [statement.report() for statement in statements]
+            dropped = self._dropped
+        flagged = [
+            entry["fingerprint"]
+            for entry in report
+            if entry["explain"] and (entry["explain"].get("full_scan") or entry["explain"].get("filesort"))
+        ]
+        return {
+            "slow_ms": self.slow_ms,
+            "fingerprints": len(report),
+            "dropped": dropped,
+            "flagged": flagged,
+            "statements": report,
+        }
+
+
+class InstrumentedCursor:
+    # times execute/executemany of a pymysql cursor, everything else is passed through
+    def __init__(self, cursor, connection, stats):
+        self._cursor = cursor
+        self._connection = connection
+        self._stats = stats
+
+    def execute(self, query, args=None):
+        return self._timed(self._cursor.execute, query, args, args)
+
+    def executemany(self, query, args):
+        # EXPLAIN is sampled with the first row of parameters
+        return self._timed(self._cursor.executemany, query, args, args[0] if args else None)
+
+    def _timed(self, execute, query, args, explain_args):
+        started = time.perf_counter()
+        try:
+            result = execute(query, args)
+        except Exception:
+            self._stats.record(self._connection, query, explain_args, time.perf_counter() - started, failed=True)
+            raise
+        self._stats.record(self._connection, query, explain_args, time.perf_counter() - started)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
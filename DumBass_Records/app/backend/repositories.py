@@ -0,0 +1,451 @@
+from abc import ABC, abstractmethod
+
+from flask import current_app
+
+from app.backend import mariadb_handler
+from app.backend import mongodb_handler
+from app.backend.catalog_sampler import CatalogSampler
+
+
+class CatalogRepository(ABC):
+    @abstractmethod
+    def query_vinyls(self, limit):
+        pass
+
+    @abstractmethod
+    def search_vinyls(self, query):
+        pass
+
+    @abstractmethod
+    def search_vinyls_admin(self, genre, artist, min_price, max_price, id):
+        pass
+
+    @abstractmethod
+    def insert_vinyl(self, artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre):
+        pass
+
+    @abstractmethod
+    def query_vinyls_by_ids(self, vinyl_ids):
+        pass
+
+    @abstractmethod
+    def query_all_vinyls(self):
+        pass
+
+    @abstractmethod
+    def query_vinyls_page(self, limit, sort, descending, after, genre, artist_id, min_price, max_price):
+        pass
+
+    def invalidate(self):
+        # drops in-memory state derived from the catalog, called when another worker changed it
+        pass
+
+    def search_index(self):
+        # the in-process index that answers search_vinyls, None while the database does
+        return None
+
+
+class OrderRepository(ABC):
+    @abstractmethod
+    def get_orders_for_user(self, user_id, limit, after):
+        pass
+
+    @abstractmethod
+    def buy_vinyl(self, user_id, vinyl_id):
+        pass
+
+    @abstractmethod
+    def checkout(self, user_id, items):
+        pass
+
+    @abstractmethod
+    def place_orders(self, orders):
+        pass
+
+    @abstractmethod
+    def get_purchase_overview(self, artist_name, start_date, end_date, genre):
+        pass
+
+
+class ReviewRepository(ABC):
+    @abstractmethod
+    def query_review_by_user(self, user_id, vinyl_id):
+        pass
+
+    @abstractmethod
+    def insert_review_for_vinyl(self, user_id, vinyl_id, rating, review_text):
+        pass
+
+    @abstractmethod
+    def delete_review(self, user_id, vinyl_id):
+        pass
+
+    @abstractmethod
+    def fetch_reviews_summary(self, start_date, end_date):
+        pass
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    def handle_login(self, email, password):
+        pass
+
+    @abstractmethod
+    def get_users(self):
+        pass
+
+
+class Backend:
+    def __init__(self, name, catalog, orders, reviews, users):
+        self.name = name
+        self.catalog = catalog
+        self.orders = orders
+        self.reviews = reviews
+        self.users = users
+
+
+class HandlerRepository:
+    # the mariadb and mongodb implementations only differ in the handler module
+    # they delegate to, get_connection resolves the connection for each call
+    handler = None
+
+    def __init__(self, get_connection):
+        self.get_connection = get_connection
+
+
+class HandlerCatalogRepository(HandlerRepository, CatalogRepository):
+    def query_vinyls(self, limit):
+        return self.handler.query_vinyls(self.get_connection(), limit)
+
+    def search_vinyls(self, query):
+        return self.handler.search_vinyls(self.get_connection(), query)
+
+    def search_vinyls_admin(self, genre, artist, min_price, max_price, id):
+        return self.handler.search_vinyls_admin(self.get_connection(), genre, artist, min_price, max_price, id)
+
+    def insert_vinyl(self, artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre):
+        return self.handler.insert_vinyl(
+            self.get_connection(), artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre
+        )
+
+    def query_vinyls_by_ids(self, vinyl_ids):
+        return self.handler.query_vinyls_by_ids(self.get_connection(), vinyl_ids)
+
+    def query_all_vinyls(self):
+        return self.handler.query_all_vinyls(self.get_connection())
+
+    def query_vinyls_page(self, limit, sort, descending, after, genre, artist_id, min_price, max_price):
+        return self.handler.query_vinyls_page(
+            self.get_connection(), limit, sort, descending, after, genre, artist_id, min_price, max_price
+        )
+
+
+class HandlerOrderRepository(HandlerRepository, OrderRepository):
+    def get_orders_for_user(self, user_id, limit, after):
+        return self.handler.get_orders_for_user(self.get_connection(), user_id, limit, after)
+
+    def buy_vinyl(self, user_id, vinyl_id):
+        return self.handler.buy_vinyl(self.get_connection(), user_id, vinyl_id)
+
+    def checkout(self, user_id, items):
+        return self.handler.checkout(self.get_connection(), user_id, items)
+
+    def place_orders(self, orders):
+        return self.handler.place_orders(self.get_connection(), orders)
+
+    def get_purchase_overview(self, artist_name, start_date, end_date, genre):
+        return self.handler.get_purchase_overview(self.get_connection(), artist_name, start_date, end_date, genre)
+
+
+class HandlerReviewRepository(HandlerRepository, ReviewRepository):
+    def query_review_by_user(self, user_id, vinyl_id):
+        return self.handler.query_review_by_user(self.get_connection(), user_id, vinyl_id)
+
+    def insert_review_for_vinyl(self, user_id, vinyl_id, rating, review_text):
+        return self.handler.insert_review_for_vinyl(self.get_connection(), user_id, vinyl_id, rating, review_text)
+
+    def delete_review(self, user_id, vinyl_id):
+        return self.handler.delete_review(self.get_connection(), user_id, vinyl_id)
+
+    def fetch_reviews_summary(self, start_date, end_date):
+        return self.handler.fetch_reviews_summary(self.get_connection(), start_date, end_date)
+
+
+class HandlerUserRepository(HandlerRepository, UserRepository):
+    def handle_login(self, email, password):
+        return self.handler.handle_login(self.get_connection(), email, password)
+
+    def get_users(self):
+        return self.handler.get_users(self.get_connection())
+
+
+class MariaDBCatalogRepository(HandlerCatalogRepository):
+    handler = mariadb_handler
+
+    def __init__(self, get_connection):
+        super().__init__(get_connection)
+        self.sampler = CatalogSampler()
+
+    def query_vinyls(self, limit):
+        connection = self.get_connection()
+        if self.sampler.is_stale(current_app.config["CATALOG_SAMPLER"]["max_age"]):
+            self.sampler.refresh(mariadb_handler.query_vinyl_ids(connection))
+        return mariadb_handler.query_vinyls_by_ids(connection, self.sampler.sample(limit))
+
+    def insert_vinyl(self, artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre):
+        vinyl_id = super().insert_vinyl(artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre)
+        self.sampler.add(vinyl_id)
+        return vinyl_id
+
+    def invalidate(self):
+        self.sampler.invalidate()
+
+
+class MariaDBOrderRepository(HandlerOrderRepository):
+    handler = mariadb_handler
+
+
+class MariaDBReviewRepository(HandlerReviewRepository):
+    handler = mariadb_handler
+
+
+class MariaDBUserRepository(HandlerUserRepository):
+    handler = mariadb_handler
+
+
+class MongoDBCatalogRepository(HandlerCatalogRepository):
+    handler = mongodb_handler
+
+
+class MongoDBOrderRepository(HandlerOrderRepository):
+    handler = mongodb_handler
+
+
+class MongoDBReviewRepository(HandlerReviewRepository):
+    handler = mongodb_handler
+
+
+class MongoDBUserRepository(HandlerUserRepository):
+    handler = mongodb_handler
+
+
+class CatalogRepositoryWrapper(CatalogRepository):
+    # base for repositories that add behaviour on top of another catalog repository
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def query_vinyls(self, limit):
+        return self.catalog.query_vinyls(limit)
+
+    def search_vinyls(self, query):
+        return self.catalog.search_vinyls(query)
+
+    def search_vinyls_admin(self, genre, artist, min_price, max_price, id):
+        return self.catalog.search_vinyls_admin(genre, artist, min_price, max_price, id)
+
+    def insert_vinyl(self, artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre):
+        return self.catalog.insert_vinyl(artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre)
+
+    def query_vinyls_by_ids(self, vinyl_ids):
+        return self.catalog.query_vinyls_by_ids(vinyl_ids)
+
+    def query_all_vinyls(self):
+        return self.catalog.query_all_vinyls()
+
+    def query_vinyls_page(self, limit, sort, descending, after, genre, artist_id, min_price, max_price):
+        return self.catalog.query_vinyls_page(limit, sort, descending, after, genre, artist_id, min_price, max_price)
+
+    def invalidate(self):
+        self.catalog.invalidate()
+
+    def search_index(self):
+        return self.catalog.search_index()
+
+
+class IndexedCatalogRepository(CatalogRepositoryWrapper):
+    # answers /search from the in-process trigram index once it is built and keeps the facet
+    # bitmaps and the fuzzy dictionary current, the getters return None while they are (re)building
+    def __init__(self, catalog, get_index, get_facet_index, get_fuzzy_index):
+        super().__init__(catalog)
+        self.get_index = get_index
+        self.get_facet_index = get_facet_index
+        self.get_fuzzy_index = get_fuzzy_index
+
+    def search_vinyls(self, query):
+        index = self.get_index()
+        if index is None:
+            return self.catalog.search_vinyls(query)
+        return index.search(query, 20)
+
+    def search_index(self):
+        return self.get_index()
+
+    def insert_vinyl(self, artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre):
+        vinyl_id = self.catalog.insert_vinyl(artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre)
+        indexes = [
+            index
+            for index in (self.get_index(), self.get_facet_index(), self.get_fuzzy_index())
+            if index is not None
+        ]
+        if indexes and vinyl_id is not None:
+            for vinyl in self.catalog.query_vinyls_by_ids([vinyl_id]):
+                for index in indexes:
+                    index.add(vinyl)
+        return vinyl_id
+
+
+class CachedCatalogRepository(CatalogRepositoryWrapper):
+    # serves catalog listings and search results from shared caches, any catalog write clears them
+    # here and publish_write tells the other workers to clear theirs
+    def __init__(self, catalog, get_cache, get_search_cache, publish_write):
+        super().__init__(catalog)
+        self.get_cache = get_cache
+        self.get_search_cache = get_search_cache
+        self.publish_write = publish_write
+
+    def query_vinyls(self, limit):
+        return self.get_cache().get_or_load(("query_vinyls", limit), lambda: self.catalog.query_vinyls(limit))
+
+    def query_vinyls_page(self, limit, sort, descending, after, genre, artist_id, min_price, max_price):
+        return self.get_cache().get_or_load(
+            ("query_vinyls_page", limit, sort, descending, after, genre, artist_id, min_price, max_price),
+            lambda: self.catalog.query_vinyls_page(
+                limit, sort, descending, after, genre, artist_id, min_price, max_price
+            ),
+        )
+
+    def search_vinyls(self, query):
+        search_cache = self.get_search_cache()
+        # the index is asked once, so the cached results are tagged with the index that produced them
+        index = self.catalog.search_index()
+        results = search_cache.get(query, index)
+        if results is None:
+            if index is not None:
+                results = index.search(query, search_cache.limit)
+            else:
+                results = self.catalog.search_vinyls(query)
+            search_cache.set(query, results, index)
+        return results
+
+    def insert_vinyl(self, artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre):
+        result = self.catalog.insert_vinyl(artist_id, vinyl_name, vinyl_price, release_date, cover_image, genre)
+        self.get_cache().clear()
+        self.get_search_cache().clear()
+        self.publish_write()
+        return result
+
+
+class OrderRepositoryWrapper(OrderRepository):
+    # base for repositories that add behaviour on top of another order repository
+    def __init__(self, orders):
+        self.orders = orders
+
+    def get_orders_for_user(self, user_id, limit, after):
+        return self.orders.get_orders_for_user(user_id, limit, after)
+
+    def buy_vinyl(self, user_id, vinyl_id):
+        return self.orders.buy_vinyl(user_id, vinyl_id)
+
+    def checkout(self, user_id, items):
+        return self.orders.checkout(user_id, items)
+
+    def place_orders(self, orders):
+        return self.orders.place_orders(orders)
+
+    def get_purchase_overview(self, artist_name, start_date, end_date, genre):
+        return self.orders.get_purchase_overview(artist_name, start_date, end_date, genre)
+
+
+class CachedOrderRepository(OrderRepositoryWrapper):
+    # keeps the first page of every user's order history, a purchase by the user drops it, and the
+    # purchase overview per filter, any purchase clears those. Other workers only see the purchase
+    # once their copy expires, which bounds staleness to the ttl.
+    def __init__(self, orders, get_cache, get_overview_cache):
+        super().__init__(orders)
+        self.get_cache = get_cache
+        self.get_overview_cache = get_overview_cache
+
+    def get_orders_for_user(self, user_id, limit, after):
+        if after is not None:
+            return self.orders.get_orders_for_user(user_id, limit, after)
+        cache = self.get_cache()
+        cached = cache.get(user_id)
+        if cached is not None and cached[0] == limit:
+            return cached[1]
+        orders = self.orders.get_orders_for_user(user_id, limit, after)
+        cache.set(user_id, (limit, orders))
+        return orders
+
+    def get_purchase_overview(self, artist_name, start_date, end_date, genre):
+        filters = (artist_name, start_date, end_date, genre)
+        # empty form fields and surrounding whitespace do not make a different filter
+        key = tuple(str(value).strip() or None if value is not None else None for value in filters)
+        return self.get_overview_cache().get_or_load(key, lambda: self.orders.get_purchase_overview(*key))
+
+    def buy_vinyl(self, user_id, vinyl_id):
+        result = self.orders.buy_vinyl(user_id, vinyl_id)
+        self.get_cache().delete(user_id)
+        self.get_overview_cache().clear()
+        return result
+
+    def checkout(self, user_id, items):
+        result = self.orders.checkout(user_id, items)
+        self.get_cache().delete(user_id)
+        self.get_overview_cache().clear()
+        return result
+
+    def place_orders(self, orders):
+        result = self.orders.place_orders(orders)
+        cache = self.get_cache()
+        for user_id in {order["user_id"] for order in orders}:
+            cache.delete(user_id)
+        self.get_overview_cache().clear()
+        return result
+
+
+def with_catalog_cache(backend, get_cache, get_search_cache, publish_write):
+    backend.catalog = CachedCatalogRepository(backend.catalog, get_cache, get_search_cache, publish_write)
+    return backend
+
+
+def with_order_cache(backend, get_cache, get_overview_cache):
+    backend.orders = CachedOrderRepository(backend.orders, get_cache, get_overview_cache)
+    return backend
+
+
+def with_search_index(backend, get_index, get_facet_index, get_fuzzy_index):
+    backend.catalog = IndexedCatalogRepository(backend.catalog, get_index, get_facet_index, get_fuzzy_index)
+    return backend
+
+
+def create_mariadb_backend(get_connection):
+    return Backend(
+        "mariadb",
+        catalog=MariaDBCatalogRepository(get_connection),
+        orders=MariaDBOrderRepository(get_connection),
+        reviews=MariaDBReviewRepository(get_connection),
+        users=MariaDBUserRepository(get_connection),
+    )
+
+
+def create_mongodb_backend(get_connection):
+    return Backend(
+        "mongodb",
+        catalog=MongoDBCatalogRepository(get_connection),
+        orders=MongoDBOrderRepository(get_connection),
+        reviews=MongoDBReviewRepository(get_connection),
+        users=MongoDBUserRepository(get_connection),
+    )
+
+
+_backend_factories = {}
+
+
+def register_backend(name, factory):
+    _backend_factories[name] = factory
+
+
+def create_backend(name):
+    if name not in _backend_factories:
+        raise ValueError(f"Unknown backend '{name}', registered: {sorted(_backend_factories)}")
+    return _backend_factories[name]()
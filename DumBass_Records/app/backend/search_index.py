@@ -0,0 +1,151 @@
+import heapq
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+
+# same keys as the rows returned by the search_vinyls handlers
+FIELDS = (
+    "vinyl_id",
+    "vinyl_title",
+    "price",
+    "cover_image",
+    "artist_name",
+    "artist_id",
+    "release_date",
+    "genre",
+    "nationality",
+)
+SEARCHABLE_FIELDS = ("vinyl_title", "artist_name", "genre")
+
+
+def normalize(text):
+    return " ".join(re.findall(r"\w+", str(text or "").lower()))
+
+
+def _contains(postings, doc):
+    position = bisect_left(postings, doc)
+    return position < len(postings) and postings[position] == doc
+
+
+class TrigramIndex:
+    def __init__(self):
+        # doc number -> row tuple in FIELDS order and its normalized searchable fields
+        self._records = []
+        self._texts = []
+        # vinyl_id -> doc number, to re-rank the results of an earlier search
+        self._docs = {}
+        # postings are array("i") of doc numbers, ascending because docs are only appended
+        self._trigrams = {}
+        # queries shorter than a trigram are answered from 1 and 2 character word prefixes
+        self._prefixes = {}
+        self._lock = threading.Lock()
+
+    def add(self, vinyl):
+        record = tuple(vinyl.get(field) for field in FIELDS)
+        fields = tuple(normalize(vinyl.get(field)) for field in SEARCHABLE_FIELDS)
+
+        trigrams = set()
+        prefixes = set()
+        for field in fields:
+            trigrams.update(field[i : i + 3] for i in range(len(field) - 2))
+            for word in field.split():
+                prefixes.add(word[:1])
+                prefixes.add(word[:2])
+
+        with self._lock:
+            doc = len(self._records)
+            self._records.append(record)
+            self._texts.append(fields)
+            self._docs[record[0]] = doc
+            for trigram in trigrams:
+                self._trigrams.setdefault(trigram, array("i")).append(doc)
+            for prefix in prefixes:
+                self._prefixes.setdefault(prefix, array("i")).append(doc)
+
+    def search(self, query, limit=20):
+        query = normalize(query)
+        if not query:
+            return []
+
+        if len(query) < 3:
+            candidates = self._prefixes.get(query, ())
+            others = []
+        else:
+            postings = [self._trigrams.get(query[i : i + 3]) for i in range(len(query) - 2)]
+            if any(p is None for p in postings):
+                return []
+            postings.sort(key=len)
+            candidates, others = postings[0], postings[1:]
+
+        matches = []
+        for doc in candidates:
+            if all(_contains(p, doc) for p in others):
+                rank = self._rank(self._texts[doc], query)
+                if rank is not None:
+                    matches.append((rank, doc))
+
+        return self._top(matches, limit)
+
+    def refine(self, prefix, query, results, limit=20):
+        # answers query from the untruncated results of a search for prefix, which hold all of its matches
+        # as long as both run the same kind of match: short queries only match word starts, longer ones
+        # any substring, so "b" can not be refined to "bea"
+        prefix = normalize(prefix)
+        query = normalize(query)
+        if not query.startswith(prefix) or (len(prefix) < 3 <= len(query)):
+            return None
+
+        matches = []
+        for vinyl in results:
+            doc = self._docs.get(vinyl["vinyl_id"])
+            if doc is None:
+                return None
+            rank = self._rank(self._texts[doc], query)
+            if rank is not None:
+                matches.append((rank, doc))
+        return self._top(matches, limit)
+
+    def _top(self, matches, limit):
+        return [dict(zip(FIELDS, self._records[doc])) for _, doc in heapq.nsmallest(limit, matches)]
+
+    def _rank(self, fields, query):
+        # trigram hits are only candidates, the substring check confirms them
+        title, artist, genre = fields
+        if title.startswith(query):
+            return 0
+        if artist.startswith(query):
+            return 1
+        padded = f" {query}"
+        if any(padded in f" {field}" for field in fields):
+            return 2
+        if any(query in field for field in fields):
+            return 3
+        return None
+
+    def __len__(self):
+        return len(self._records)
+
+    def stats(self):
+        with self._lock:
+            postings = list(self._trigrams.values()) + list(self._prefixes.values())
+            postings_bytes = sum(sys.getsizeof(p) for p in postings)
+            keys_bytes = sys.getsizeof(self._trigrams) + sys.getsizeof(self._prefixes)
+            keys_bytes += sum(sys.getsizeof(k) for k in self._trigrams) + sum(sys.getsizeof(k) for k in self._prefixes)
+            records_bytes = sys.getsizeof(self._records) + sum(sys.getsizeof(r) for r in self._records)
+            records_bytes += sys.getsizeof(self._docs)
+            texts_bytes = sys.getsizeof(self._texts) + sum(
+                sys.getsizeof(t) + sum(sys.getsizeof(f) for f in t) for t in self._texts
+            )
+            return {
+                "documents": len(self._records),
+                "trigrams": len(self._trigrams),
+                "prefixes": len(self._prefixes),
+                "postings": sum(len(p) for p in postings),
+                "postings_bytes": postings_bytes,
+                "keys_bytes": keys_bytes,
+                "records_bytes": records_bytes,
+                "texts_bytes": texts_bytes,
+                "total_bytes": postings_bytes + keys_bytes + records_bytes + texts_bytes,
+            }
@@ -0,0 +1,84 @@
+# Compares /checkout (one order with N lines) against N single-vinyl /buy_vinyl orders
+# on the active database. Run inside the web container:
+#   python -m benchmarks.checkout_benchmark --backend mariadb --lines 1 10 100
+# Every order placed by the benchmark is deleted again.
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("BOOTSTRAP_ON_STARTUP", "false")
+
+from app.app import app
+from app.backend import database_handler
+
+
+def find_user_id(backend, email):
+    if backend == database_handler.MARIADB:
+        with database_handler.get_mariadb_connection().cursor() as cursor:
+            cursor.execute("SELECT User_ID FROM Users WHERE User_Email = %s", (email,))
+            return cursor.fetchone()[0]
+    return database_handler.get_mongodb_connection()["users"].find_one({"user_email": email})["_id"]
+
+
+def delete_orders(backend, order_ids):
+    if not order_ids:
+        return
+    if backend == database_handler.MARIADB:
+        connection = database_handler.get_mariadb_connection()
+        placeholders = ", ".join(["%s"] * len(order_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM Order_Vinyl WHERE Order_ID IN ({placeholders})", order_ids)
+            cursor.execute(f"DELETE FROM Orders WHERE Order_ID IN ({placeholders})", order_ids)
+        connection.commit()
+    else:
+        database_handler.get_mongodb_connection()["orders"].delete_many({"_id": {"$in": order_ids}})
+
+
+def order_id(result):
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result.get("order_id") or int(result["success"].split()[1])
+
+
+def per_vinyl(user_id, vinyl_ids):
+    return [order_id(database_handler.orders.buy_vinyl(user_id, vinyl_id)) for vinyl_id in vinyl_ids]
+
+
+def cart(user_id, vinyl_ids):
+    return [order_id(database_handler.orders.checkout(user_id, {vinyl_id: 1 for vinyl_id in vinyl_ids}))]
+
+
+def run(backend, lines, rounds, email):
+    database_handler.bind_backend(backend)
+    user_id = find_user_id(backend, email)
+    vinyl_ids = [vinyl["vinyl_id"] for vinyl in database_handler.catalog.query_all_vinyls()[: max(lines)]]
+    print(f"{backend}: user {user_id}, {rounds} rounds, milliseconds per cart (median / p95)")
+    for count in lines:
+        for name, place in (("buy_vinyl per vinyl", per_vinyl), ("checkout", cart)):
+            timings = []
+            placed = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                placed += place(user_id, vinyl_ids[:count])
+                timings.append((time.perf_counter() - started) * 1000)
+                database_handler.release_connections()
+            delete_orders(backend, placed)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"  {count:>4} lines  {name:<20} {statistics.median(timings):>9.2f} / {p95:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=[database_handler.MARIADB, database_handler.MONGODB], default="mariadb")
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--email", default="user@user.com")
+    args = parser.parse_args()
+    with app.app_context():
+        run(args.backend, args.lines, args.rounds, args.email)
+
+
+if __name__ == "__main__":
+    main()
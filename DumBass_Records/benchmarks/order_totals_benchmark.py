@@ -0,0 +1,76 @@
+# Per-order insert latency on MariaDB with the old after_order_vinyl_insert trigger, which
+# re-summed the whole order after every line, against the application computed total.
+#   python -m benchmarks.order_totals_benchmark --lines 1 10 100
+# The trigger only exists while the benchmark runs, every order placed is deleted again.
+import argparse
+import statistics
+import time
+
+from benchmarks.checkout_benchmark import delete_orders, find_user_id, order_id
+from app.app import app
+from app.backend import database_handler
+
+TRIGGER = """
+    CREATE TRIGGER after_order_vinyl_insert
+    AFTER INSERT ON Order_Vinyl
+    FOR EACH ROW
+    BEGIN
+        UPDATE Orders
+        SET Total_Price = (
+            SELECT IFNULL(SUM(v.Price * ov.Amount), 0)
+            FROM Order_Vinyl ov
+            JOIN Vinyls v ON ov.Vinyl_ID = v.Vinyl_ID
+            WHERE ov.Order_ID = NEW.Order_ID
+        )
+        WHERE Orders.Order_ID = NEW.Order_ID;
+    END;
+"""
+
+
+def set_trigger(enabled):
+    connection = database_handler.get_mariadb_connection()
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS after_order_vinyl_insert")
+        if enabled:
+            cursor.execute(TRIGGER)
+    connection.commit()
+
+
+def run(lines, rounds, email):
+    database_handler.bind_backend(database_handler.MARIADB)
+    user_id = find_user_id(database_handler.MARIADB, email)
+    vinyl_ids = [vinyl["vinyl_id"] for vinyl in database_handler.catalog.query_all_vinyls()[: max(lines)]]
+    print(f"mariadb: user {user_id}, {rounds} rounds, milliseconds per order (median / p95)")
+    try:
+        for count in lines:
+            items = {vinyl_id: 1 for vinyl_id in vinyl_ids[:count]}
+            for name, trigger in (("trigger", True), ("application total", False)):
+                set_trigger(trigger)
+                timings = []
+                placed = []
+                for _ in range(rounds):
+                    started = time.perf_counter()
+                    placed.append(order_id(database_handler.orders.checkout(user_id, items)))
+                    timings.append((time.perf_counter() - started) * 1000)
+                    database_handler.release_connections()
+                delete_orders(database_handler.MARIADB, placed)
+                timings.sort()
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                print(f"  {count:>4} lines  {name:<18} {statistics.median(timings):>9.2f} / {p95:.2f}")
+    finally:
+        set_trigger(False)
+        database_handler.release_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--email", default="user@user.com")
+    args = parser.parse_args()
+    with app.app_context():
+        run(args.lines, args.rounds, args.email)
+
+
+if __name__ == "__main__":
+    main()
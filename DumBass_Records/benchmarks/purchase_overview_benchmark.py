@@ -0,0 +1,174 @@
+# Purchase overview on a large Order_Vinyl table: the former two aggregations against the single
+# ROLLUP pass, and the cached repository call. Run inside the web container:
+#   python -m benchmarks.purchase_overview_benchmark --rows 10000000
+# Synthetic orders are generated with the SEQUENCE engine for a customer without referrals, so the
+# discount trigger leaves Referrals alone, and deleted again unless --keep is given.
+import argparse
+import datetime
+import os
+import statistics
+import time
+
+os.environ.setdefault("BOOTSTRAP_ON_STARTUP", "false")
+
+from app.app import app
+from app.backend import database_handler, mariadb_handler
+
+OLD_SUMMARY = """
+    SELECT
+        v.Genre,
+        COUNT(DISTINCT v.Vinyl_ID) AS vinyl_count,
+        SUM(ov.Amount) AS total_purchase,
+        SUM(ov.Amount * v.Price) AS total_revenue
+    FROM Vinyls v
+    JOIN Artists a ON v.Artist_ID = a.Artist_ID
+    JOIN Order_Vinyl ov ON v.Vinyl_ID = ov.Vinyl_ID
+    JOIN Orders o ON ov.Order_ID = o.Order_ID
+    WHERE (%s IS NULL OR a.Artist_Name = %s)
+    AND (%s IS NULL OR o.Order_Date BETWEEN %s AND %s)
+    AND (%s IS NULL OR v.Genre = %s)
+    GROUP BY v.Genre
+    ORDER BY total_purchase DESC
+"""
+
+OLD_DETAILS = """
+    SELECT
+        v.Vinyl_Name,
+        a.Artist_Name,
+        v.Genre,
+        SUM(ov.Amount) AS Total_Sales,
+        SUM(ov.Amount * v.Price) AS Total_Revenue
+    FROM Vinyls v
+    JOIN Artists a ON v.Artist_ID = a.Artist_ID
+    JOIN Order_Vinyl ov ON v.Vinyl_ID = ov.Vinyl_ID
+    JOIN Orders o ON ov.Order_ID = o.Order_ID
+    WHERE (%s IS NULL OR a.Artist_Name = %s)
+    AND (%s IS NULL OR o.Order_Date BETWEEN %s AND %s)
+    AND (%s IS NULL OR v.Genre = %s)
+    GROUP BY v.Vinyl_ID, a.Artist_Name
+    ORDER BY Total_Sales DESC
+"""
+
+LINES_PER_ORDER = 5
+CHUNK_ORDERS = 100000
+
+
+def generate(connection, rows):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.User_ID FROM Customers c
+            WHERE NOT EXISTS (SELECT 1 FROM Referrals r WHERE r.User_ID = c.User_ID AND r.Referral_Count > 0)
+            LIMIT 1
+            """
+        )
+        user_id = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM Vinyls")
+        vinyl_count = cursor.fetchone()[0]
+        first_id = None
+        orders = rows // LINES_PER_ORDER
+        for offset in range(0, orders, CHUNK_ORDERS):
+            chunk = min(CHUNK_ORDERS, orders - offset)
+            cursor.execute("SELECT IFNULL(MAX(Order_ID), 0) FROM Orders")
+            chunk_start = cursor.fetchone()[0]
+            if first_id is None:
+                first_id = chunk_start + 1
+            cursor.execute(
+                f"""
+                INSERT INTO Orders (User_ID, Order_Date, Zahlungsmethode, Total_Price)
+                SELECT %s, CURDATE() - INTERVAL (seq %% 730) DAY, 'Kreditkarte', 0
+                FROM seq_1_to_{chunk}
+                """,
+                (user_id,),
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO Order_Vinyl (Order_ID, Vinyl_ID, Amount)
+                SELECT o.Order_ID, v.Vinyl_ID, 1 + (o.Order_ID + l.seq) %% 3
+                FROM Orders o
+                JOIN seq_0_to_{LINES_PER_ORDER - 1} l
+                JOIN (SELECT Vinyl_ID, ROW_NUMBER() OVER (ORDER BY Vinyl_ID) - 1 AS n FROM Vinyls) v
+                    ON v.n = (o.Order_ID * 7 + l.seq) %% {vinyl_count}
+                WHERE o.Order_ID > %s AND o.User_ID = %s
+                """,
+                (chunk_start, user_id),
+            )
+            connection.commit()
+            print(f"  generated {(offset + chunk) * LINES_PER_ORDER} of {rows} lines")
+        cursor.execute("ANALYZE TABLE Orders, Order_Vinyl")
+        cursor.fetchall()
+    return first_id
+
+
+def remove(connection, first_id):
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute("DELETE FROM Order_Vinyl WHERE Order_ID >= %s LIMIT 500000", (first_id,))
+            deleted = cursor.rowcount
+            connection.commit()
+            if not deleted:
+                break
+        cursor.execute("DELETE FROM Orders WHERE Order_ID >= %s", (first_id,))
+    connection.commit()
+
+
+def old_overview(connection, artist_name, start_date, end_date, genre):
+    params = [artist_name, artist_name, start_date, start_date, end_date, genre, genre]
+    with connection.cursor() as cursor:
+        cursor.execute(OLD_SUMMARY, params)
+        summary = cursor.fetchall()
+        cursor.execute(OLD_DETAILS, params)
+        details = cursor.fetchall()
+    connection.commit()
+    return summary, details
+
+
+def timed(call, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def run(rows, rounds, keep):
+    database_handler.bind_backend(database_handler.MARIADB)
+    connection = database_handler.get_mariadb_connection()
+    print(f"generating {rows} Order_Vinyl rows")
+    first_id = generate(connection, rows)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT Genre_Name FROM Genres ORDER BY Vinyl_Count DESC LIMIT 1")
+            genre = cursor.fetchone()[0]
+        today = datetime.date.today()
+        filters = {
+            "no filter": (None, None, None, None),
+            "genre": (None, None, None, genre),
+            "last 30 days": (None, str(today - datetime.timedelta(days=30)), str(today), None),
+        }
+        print(f"milliseconds, median of {rounds}")
+        for name, args in filters.items():
+            old = timed(lambda: old_overview(connection, *args), rounds)
+            rollup = timed(lambda: mariadb_handler.get_purchase_overview(connection, *args), rounds)
+            database_handler.get_overview_cache().clear()
+            cached = timed(lambda: database_handler.orders.get_purchase_overview(*args), rounds)
+            print(f"  {name:<14} two queries {old:>10.1f}  rollup {rollup:>10.1f}  cached {cached:>8.3f}")
+    finally:
+        if not keep:
+            remove(connection, first_id)
+        database_handler.release_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Leave the synthetic orders in the database.")
+    args = parser.parse_args()
+    with app.app_context():
+        run(args.rows, args.rounds, args.keep)
+
+
+if __name__ == "__main__":
+    main()
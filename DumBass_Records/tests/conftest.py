@@ -0,0 +1,72 @@
+import os
+import sys
+
+import pymysql
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+os.environ.setdefault("BOOTSTRAP_ON_STARTUP", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.app import app as flask_app
+from app.backend import database_handler, mariadb_migrations, mongodb_initializer
+
+
+@pytest.fixture(scope="session")
+def app():
+    flask_app.config["TESTING"] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    # requests must not reach for the shared backend state
+    monkeypatch.setattr(database_handler, "_backend_state_checked_at", float("inf"))
+    return app.test_client()
+
+
+# the database fixtures skip their tests unless the compose services are up and bootstrapped
+@pytest.fixture(scope="module")
+def mariadb_connection(app):
+    mariadb_config = app.config["MARIADB"]
+    try:
+        connection = pymysql.connect(
+            host=mariadb_config["host"],
+            port=mariadb_config["port"],
+            user=mariadb_config["user"],
+            password=mariadb_config["password"],
+            database=mariadb_config["name"],
+            connect_timeout=2,
+        )
+    except pymysql.MySQLError as e:
+        pytest.skip(f"MariaDB not reachable: {e}")
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW TABLES LIKE 'Vinyls'")
+        bootstrapped = cursor.fetchone() is not None
+    if not bootstrapped:
+        connection.close()
+        pytest.skip("MariaDB has no schema yet")
+    with app.app_context():
+        mariadb_migrations.apply_migrations(connection)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture(scope="module")
+def mongodb_connection(app):
+    mongo_config = app.config["MONGODB"]
+    client = MongoClient(host=mongo_config["host"], port=mongo_config["port"], serverSelectionTimeoutMS=2000)
+    try:
+        database = client[mongo_config["db"]]
+        collections = database.list_collection_names()
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"MongoDB not reachable: {e}")
+    if "vinyls" not in collections:
+        client.close()
+        pytest.skip("MongoDB has not been migrated yet")
+    with app.app_context():
+        mongodb_initializer.apply_indexes(database)
+    yield database
+    client.close()
@@ -0,0 +1,34 @@
+import pytest
+
+from app.backend import order_journal
+
+
+@pytest.fixture
+def customer(client):
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+        session["user_role"] = "customer"
+    return client
+
+
+@pytest.fixture
+def journal(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config["ORDER_JOURNAL"], "enabled", True)
+    monkeypatch.setitem(app.config["ORDER_JOURNAL"], "path", str(tmp_path / "journal.sqlite3"))
+    monkeypatch.setattr(order_journal, "_journal", None)
+    yield order_journal.get_journal(app)
+
+
+@pytest.mark.parametrize("body", [{}, {"vinyl_id": None}, {"vinyl_id": "abc"}, None])
+def test_buy_vinyl_rejects_missing_or_invalid_vinyl_id(customer, journal, body):
+    response = customer.post("/buy_vinyl", json=body) if body is not None else customer.post("/buy_vinyl")
+
+    assert response.status_code == 400
+    assert journal.pending() == 0
+
+
+def test_buy_vinyl_journals_valid_order(customer, journal):
+    response = customer.post("/buy_vinyl", json={"vinyl_id": "7"})
+
+    assert response.status_code == 200
+    assert [order["items"] for order in journal.claim(10)] == [{7: 1}]
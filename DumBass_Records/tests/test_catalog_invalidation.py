@@ -0,0 +1,45 @@
+import pytest
+
+from app.backend import backend_state, database_handler
+
+
+@pytest.fixture
+def shared_state(app, monkeypatch):
+    # the Backend_State row other workers would write to
+    state = {"row": (database_handler.MARIADB, 1, 0)}
+    monkeypatch.setattr(database_handler, "get_mariadb_connection", lambda: None)
+    monkeypatch.setattr(backend_state, "read_state", lambda connection: state["row"])
+
+    def bump_catalog_version(connection):
+        backend, version, catalog_version = state["row"]
+        state["row"] = (backend, version, catalog_version + 1)
+        return state["row"]
+
+    monkeypatch.setattr(backend_state, "bump_catalog_version", bump_catalog_version)
+    monkeypatch.setitem(app.config["SEARCH_INDEX"], "enabled", False)
+    with app.app_context():
+        database_handler.sync_backend(force=True)
+        yield state
+
+
+def test_catalog_change_of_another_worker_clears_caches(shared_state):
+    catalog = database_handler.catalog
+    database_handler.get_catalog_cache().set("listing", ["stale"])
+    database_handler.get_order_cache().set(1, ["orders"])
+    backend, version, catalog_version = shared_state["row"]
+    shared_state["row"] = (backend, version, catalog_version + 1)
+
+    database_handler.sync_backend(force=True)
+
+    assert database_handler.catalog is catalog
+    assert database_handler.get_catalog_cache().get("listing") is None
+    assert database_handler.get_order_cache().get(1) == ["orders"]
+
+
+def test_own_catalog_change_is_not_invalidated_again(shared_state):
+    database_handler.publish_catalog_change()
+    database_handler.get_catalog_cache().set("listing", ["fresh"])
+
+    database_handler.sync_backend(force=True)
+
+    assert database_handler.get_catalog_cache().get("listing") == ["fresh"]
@@ -0,0 +1,67 @@
+import datetime
+
+import pytest
+
+from app.backend.facet_index import FacetIndex, set_bits
+from app.backend.pagination import InvalidCursor
+
+
+def vinyl(vinyl_id, genre="Rock", nationality="UK", year=1970, price=25):
+    return {
+        "vinyl_id": vinyl_id,
+        "genre": genre,
+        "nationality": nationality,
+        "release_date": datetime.date(year, 1, 1),
+        "price": price,
+    }
+
+
+@pytest.fixture
+def facet_index():
+    facet_index = FacetIndex()
+    for vinyl_id in range(1, 301):
+        facet_index.add(vinyl(vinyl_id * 10, "Rock" if vinyl_id % 3 else "Jazz", "UK" if vinyl_id % 2 else "US"))
+    return facet_index
+
+
+def test_set_bits_matches_bit_positions():
+    bits = (1 << 0) | (1 << 7) | (1 << 8) | (1 << 300) | (1 << 1025)
+
+    assert set_bits(bits) == [0, 7, 8, 300, 1025]
+    assert set_bits(bits, 3) == [0, 7, 8]
+    assert set_bits(0) == []
+
+
+def test_query_pages_through_all_matches(facet_index):
+    expected = [vinyl_id * 10 for vinyl_id in range(1, 301) if vinyl_id % 3 == 0 and vinyl_id % 2]
+    seen = []
+    after = None
+    while True:
+        result = facet_index.query({"genre": ["Jazz"], "nationality": ["UK"]}, limit=7, after=after)
+        seen += result["vinyl_ids"]
+        if not result["has_more"]:
+            break
+        after = result["vinyl_ids"][-1]
+
+    assert seen == expected
+    assert result["total"] == len(expected)
+
+
+def test_query_without_limit_returns_every_match(facet_index):
+    result = facet_index.query({"genre": ["Jazz"]}, limit=None)
+
+    assert result["vinyl_ids"] == [vinyl_id * 10 for vinyl_id in range(1, 301) if vinyl_id % 3 == 0]
+    assert not result["has_more"]
+
+
+def test_query_with_limit_zero_only_counts(facet_index):
+    result = facet_index.query({}, limit=0)
+
+    assert result["vinyl_ids"] == []
+    assert result["has_more"]
+    assert result["facets"]["genre"] == {"Jazz": 100, "Rock": 200}
+
+
+def test_query_rejects_unknown_cursor(facet_index):
+    with pytest.raises(InvalidCursor):
+        facet_index.query({"genre": ["Jazz"]}, after=11)
@@ -0,0 +1,10 @@
+from app.backend.genres import split_genres
+
+
+def test_split_genres_keeps_compound_discogs_genres():
+    assert split_genres("Rock, Folk, World, & Country, Pop") == ["Rock", "Folk, World, & Country", "Pop"]
+
+
+def test_split_genres_drops_blanks_and_duplicates():
+    assert split_genres(" Rock,,Pop, Rock ") == ["Rock", "Pop"]
+    assert split_genres(None) == []
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from app.backend import mongodb_handler
+from app.backend.id_allocator import COUNTERS
+
+
+def test_mongodb_insert_vinyl_stores_an_integer_id_and_a_date(app, mongodb_connection, monkeypatch):
+    artist = mongodb_connection["vinyls"].find_one({}, {"artist": 1})
+    monkeypatch.setattr(mongodb_handler, "_id_allocator", None)
+
+    with app.app_context():
+        # the collection validator refuses ObjectId ids and string release dates
+        vinyl_id = mongodb_handler.insert_vinyl(
+            mongodb_connection, str(artist["artist"]["_id"]), "Test Pressing", "19.99", "1999-12-31", "cover.jpg", "Jazz"
+        )
+
+    try:
+        vinyl = mongodb_connection["vinyls"].find_one({"_id": vinyl_id})
+        assert isinstance(vinyl_id, int)
+        assert vinyl["release_date"] == datetime(1999, 12, 31)
+        assert vinyl["artist"]["_id"] == artist["artist"]["_id"]
+        assert mongodb_connection[COUNTERS].find_one({"_id": "vinyls"})["value"] >= vinyl_id
+    finally:
+        mongodb_connection["vinyls"].delete_one({"_id": vinyl_id})
+        mongodb_connection["genres"].update_one({"_id": "Jazz"}, {"$inc": {"vinyl_count": -1}})
@@ -0,0 +1,15 @@
+import pytest
+
+from app.backend import mariadb_migrations
+
+
+@pytest.mark.parametrize(
+    "name, tables, call", mariadb_migrations.HOT_QUERIES, ids=[name for name, _, _ in mariadb_migrations.HOT_QUERIES]
+)
+def test_hot_query_does_not_scan(app, mariadb_connection, name, tables, call):
+    with app.app_context():
+        entry = mariadb_migrations.explain_hot_query(mariadb_connection, name, tables, call)
+
+    assert entry["statements"], f"{name} executed no SELECT"
+    assert "ALL" not in entry["type"], f"{name} scans {', '.join(tables)}: {entry}"
+    assert entry["uses_index"], entry
@@ -0,0 +1,14 @@
+import pytest
+
+from app.backend import mongodb_initializer
+
+HANDLER_QUERIES = mongodb_initializer.handler_queries()
+
+
+@pytest.mark.parametrize("name, call", HANDLER_QUERIES, ids=[name for name, _ in HANDLER_QUERIES])
+def test_handler_query_does_not_scan(app, mongodb_connection, name, call):
+    with app.app_context():
+        entry = mongodb_initializer.explain_handler_query(mongodb_connection, name, call)
+
+    assert entry["queries"], f"{name} issued no query"
+    assert "COLLSCAN" not in entry["stages"], f"{name} scans {', '.join(entry['collections'])}: {entry}"
@@ -0,0 +1,78 @@
+import uuid
+
+import pytest
+
+from app.backend import database_handler, mariadb_handler, order_journal
+
+
+class PoisonedOrders:
+    # the order repository of a backend that keeps refusing one token
+    def __init__(self, poison):
+        self.poison = poison
+        self.placed = []
+
+    def place_orders(self, orders):
+        good = [order for order in orders if order["token"] != self.poison]
+        self.placed += [order["token"] for order in good]
+        failed = {order["token"]: "refused" for order in orders if order["token"] == self.poison}
+        return {"placed": len(good), "rejected": [], "failed": failed}
+
+
+@pytest.fixture
+def journal(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config["ORDER_JOURNAL"], "path", str(tmp_path / "journal.sqlite3"))
+    monkeypatch.setitem(app.config["ORDER_JOURNAL"], "max_attempts", 3)
+    monkeypatch.setattr(order_journal, "_journal", None)
+    monkeypatch.setattr(database_handler, "sync_backend", lambda force=False: None)
+    return order_journal.get_journal(app)
+
+
+def test_poison_order_is_dead_lettered_without_blocking_the_journal(app, journal, monkeypatch):
+    poison = journal.append(1, {1: 1})
+    good = journal.append(2, {2: 1})
+    orders = PoisonedOrders(poison)
+    monkeypatch.setattr(database_handler, "orders", orders)
+
+    for _ in range(3):
+        order_journal.flush(app)
+
+    assert orders.placed == [good]
+    assert journal.pending() == 0
+    assert journal.dead_letters() == 1
+
+
+def test_mariadb_writes_the_batch_around_a_poison_order(app, mariadb_connection):
+    with mariadb_connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.User_ID FROM Customers c
+            WHERE NOT EXISTS (SELECT 1 FROM Referrals r WHERE r.User_ID = c.User_ID AND r.Referral_Count > 0)
+            LIMIT 1
+            """
+        )
+        customer = cursor.fetchone()
+        cursor.execute("SELECT MIN(Vinyl_ID) FROM Vinyls")
+        vinyl_id = cursor.fetchone()[0]
+    if customer is None or vinyl_id is None:
+        pytest.skip("MariaDB has no customer without referrals or no vinyl")
+
+    good = {"token": uuid.uuid4().hex, "user_id": customer[0], "items": {vinyl_id: 1}}
+    # no customer has a negative id, the foreign key refuses the order
+    poison = {"token": uuid.uuid4().hex, "user_id": -1, "items": {vinyl_id: 1}}
+    with app.app_context():
+        result = mariadb_handler.place_orders(mariadb_connection, [poison, good])
+
+    try:
+        assert result["placed"] == 1
+        assert list(result["failed"]) == [poison["token"]]
+        with mariadb_connection.cursor() as cursor:
+            cursor.execute("SELECT Token FROM Order_Journal WHERE Token IN (%s, %s)", (good["token"], poison["token"]))
+            assert [row[0] for row in cursor.fetchall()] == [good["token"]]
+    finally:
+        with mariadb_connection.cursor() as cursor:
+            cursor.execute("SELECT Order_ID FROM Order_Journal WHERE Token = %s", (good["token"],))
+            for (order_id,) in cursor.fetchall():
+                cursor.execute("DELETE FROM Order_Journal WHERE Order_ID = %s", (order_id,))
+                cursor.execute("DELETE FROM Order_Vinyl WHERE Order_ID = %s", (order_id,))
+                cursor.execute("DELETE FROM Orders WHERE Order_ID = %s", (order_id,))
+        mariadb_connection.commit()
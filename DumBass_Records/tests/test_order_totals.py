@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from app.backend import order_totals
+
+
+class Cursor:
+    def __init__(self, batches):
+        self.batches = batches
+        self.rows = []
+
+    def execute(self, query, args=None):
+        self.rows = self.batches.pop(0) if self.batches else []
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class Connection:
+    # answers the find_drift query with fixed batches of orders
+    def __init__(self, *batches):
+        self.batches = list(batches)
+
+    def cursor(self, *args):
+        return Cursor(self.batches)
+
+    def commit(self):
+        pass
+
+
+def order(order_id, total_price, line_total, referral_discount=0, unpriced_lines=0):
+    return {
+        "Order_ID": order_id,
+        "Total_Price": Decimal(total_price),
+        "Referral_Discount": referral_discount,
+        "Line_Total": Decimal(line_total),
+        "Unpriced_Lines": unpriced_lines,
+    }
+
+
+def test_totals_are_checked_against_the_unit_prices_and_the_discount_flag():
+    connection = Connection(
+        [
+            order(1, "40.00", "40.00"),
+            # 40.00 * 0.931
+            order(2, "37.24", "40.00", referral_discount=1),
+            order(3, "40.00", "40.00", referral_discount=1),
+            order(4, "37.24", "40.00"),
+            order(5, "12.00", "0", unpriced_lines=1),
+        ]
+    )
+
+    checked, unpriced, drift = order_totals.find_drift(connection)
+
+    assert checked == 5
+    assert unpriced == 1
+    assert [(entry["order_id"], entry["expected"]) for entry in drift] == [(3, Decimal("37.24")), (4, Decimal("40.00"))]
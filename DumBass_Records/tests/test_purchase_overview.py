@@ -0,0 +1,26 @@
+import pytest
+
+from app.backend import mariadb_handler
+from app.backend.genres import split_genres
+
+
+def test_genre_filter_includes_vinyls_with_several_genres(app, mariadb_connection):
+    with mariadb_connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT v.Vinyl_Name, v.Genre FROM Vinyls v
+            WHERE v.Genre LIKE '%,%' AND EXISTS (SELECT 1 FROM Order_Vinyl ov WHERE ov.Vinyl_ID = v.Vinyl_ID)
+            LIMIT 1
+            """
+        )
+        row = cursor.fetchone()
+    mariadb_connection.commit()
+    if row is None:
+        pytest.skip("no ordered vinyl with several genres")
+    vinyl_name, genre = row
+
+    with app.app_context():
+        for name in split_genres(genre):
+            summary, details = mariadb_handler.get_purchase_overview(mariadb_connection, genre=name)
+            assert vinyl_name in {detail["Vinyl_Name"] for detail in details}, name
+            assert genre in {row["Genre"] for row in summary}, name
@@ -0,0 +1,29 @@
+import threading
+import time
+
+from app.backend import database_handler
+
+
+class SlowQueryStats:
+    def __init__(self, **kwargs):
+        time.sleep(0.05)
+
+
+def test_concurrent_first_requests_share_one_query_stats(app, monkeypatch):
+    monkeypatch.setitem(app.config["QUERY_STATS"], "enabled", True)
+    monkeypatch.setattr(database_handler, "QueryStats", SlowQueryStats)
+    monkeypatch.setattr(database_handler, "_query_stats", None)
+    instances = []
+
+    def first_request():
+        with app.app_context():
+            instances.append(database_handler.get_query_stats())
+
+    threads = [threading.Thread(target=first_request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(instances) == 8
+    assert len({id(instance) for instance in instances}) == 1
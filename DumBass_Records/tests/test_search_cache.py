@@ -0,0 +1,70 @@
+from app.backend.cache import PrefixSearchCache
+from app.backend.search_index import TrigramIndex
+
+VINYLS = [
+    ("Greatest Hits", "Queen", "Rock"),
+    ("A Night at the Opera", "Queen", "Rock"),
+    ("Queen Rock Montreal", "Queen", "Rock, Live"),
+    ("Abbey Road", "The Beatles", "Rock, Pop"),
+    ("Beat It", "Michael Jackson", "Pop"),
+    ("Maxbeat", "Ubqueen", "Electronic"),
+    ("Rocky Horror", "Various", "Soundtrack"),
+]
+
+
+def build_index():
+    index = TrigramIndex()
+    for vinyl_id, (title, artist, genre) in enumerate(VINYLS, start=1):
+        index.add({"vinyl_id": vinyl_id, "vinyl_title": title, "artist_name": artist, "genre": genre})
+    return index
+
+
+def test_prefix_derived_results_match_a_fresh_search():
+    index = build_index()
+    queries = ["q", "qu", "que", "quee", "queen", "queen r", "queen rock", "queen greatest", "b", "be", "bea", "beat"]
+    for prefix in queries:
+        for query in queries:
+            if query == prefix or not query.startswith(prefix):
+                continue
+            cache = PrefixSearchCache(limit=20)
+            cache.set(prefix, index.search(prefix, 20), index)
+            cached = cache.get(query, index)
+            assert cached is None or cached == index.search(query, 20), (prefix, query)
+
+
+def test_longer_query_is_refined_from_a_cached_prefix():
+    index = build_index()
+    cache = PrefixSearchCache(limit=20)
+    cache.set("que", index.search("que", 20), index)
+
+    assert cache.get("queen rock", index) == index.search("queen rock", 20)
+    assert cache.stats()["prefix_hits"] == 1
+
+
+def test_word_prefix_results_are_not_refined_to_substring_matches():
+    # "b" only matches word starts, "bea" also finds "Maxbeat"
+    index = build_index()
+    cache = PrefixSearchCache(limit=20)
+    cache.set("b", index.search("b", 20), index)
+
+    assert cache.get("bea", index) is None
+
+
+def test_database_results_are_only_reused_for_the_same_query():
+    # full-text search ORs the words, so "queen rock" matches more than "queen"
+    index = build_index()
+    cache = PrefixSearchCache(limit=20)
+    database_results = [{"vinyl_id": 1, "vinyl_title": "Greatest Hits", "artist_name": "Queen", "genre": "Rock"}]
+    cache.set("queen", database_results)
+
+    assert cache.get("queen", index) == database_results
+    assert cache.get("queen greatest", index) is None
+    assert cache.get("queen greatest") is None
+
+
+def test_results_of_another_index_are_not_refined():
+    cache = PrefixSearchCache(limit=20)
+    old_index = build_index()
+    cache.set("queen", old_index.search("queen", 20), old_index)
+
+    assert cache.get("queen rock", build_index()) is None
@@ -0,0 +1,53 @@
+import pytest
+
+from app.backend import database_handler
+from app.backend.facet_index import FacetIndex
+
+
+class FakeCatalog:
+    def __init__(self):
+        self.pages = []
+        self.sampled = []
+
+    def query_vinyls(self, limit):
+        self.sampled.append(limit)
+        return []
+
+    def query_vinyls_page(self, limit, sort, descending, after, genre, artist_id, min_price, max_price):
+        self.pages.append({"sort": sort, "descending": descending, "after": after})
+        return []
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    catalog = FakeCatalog()
+    monkeypatch.setattr(database_handler, "catalog", catalog)
+    monkeypatch.setattr(database_handler, "get_facet_index", lambda: None)
+    return catalog
+
+
+@pytest.mark.parametrize("query", ["sort=bogus", "cursor=zzz", "sort=price&cursor=zzz"])
+def test_shop_falls_back_to_first_page_on_invalid_arguments(client, catalog, query):
+    response = client.get(f"/shop?{query}")
+
+    assert response.status_code == 200
+    assert catalog.pages[-1] == {"sort": "id", "descending": False, "after": None}
+
+
+def test_api_facets_rejects_invalid_cursor(client, monkeypatch):
+    facet_index = FacetIndex()
+    facet_index.add({"vinyl_id": 1, "genre": "Rock", "nationality": "UK", "release_date": "1970-01-01", "price": 25})
+    monkeypatch.setattr(database_handler, "get_facet_index", lambda: facet_index)
+
+    for cursor in ("abc", "99"):
+        response = client.get(f"/api/facets?genre=Rock&cursor={cursor}")
+
+        assert response.status_code == 400
+
+
+def test_shop_keeps_the_random_listing(client, catalog):
+    response = client.get("/shop?sort=random")
+
+    assert response.status_code == 200
+    assert catalog.sampled == [100]
+    assert catalog.pages == []